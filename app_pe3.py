@@ -1,15 +1,19 @@
-import os
-import shutil
-import tempfile
+import dataclasses
+import hashlib
+import json
+import uuid
+
+import pandas as pd
 import streamlit as st
-from openpyxl import load_workbook
-from io import BytesIO
-from copy import copy, deepcopy
 
-from funciones_asistencia import generar_asistencia
-from funciones_op1 import generar_op1
-from funciones_personal import generar_personal
-from funciones_cajas_sede import generar_cajas_sede
+from funciones_plantilla import PLANTILLA_PATH
+from funciones_almacen import abrir, depurar, guardar, leer, ubicacion
+from funciones_lectura import lector_excel
+from funciones_clasificar import clasificar_archivos
+from funciones_combinar import combinar_reportes, compactar_xlsx, describir_compactacion
+from funciones_lote import INCREMENTALES, reportes_disponibles
+from funciones_perfil import Perfil, configurar_memoria, describir_perfil, etapa, filas_perfil
+from funciones_trabajos import describir_trabajo, enviar, retirar
 
 
 # ========================
@@ -22,186 +26,187 @@ for key in [
     "op1_generada",
     "personal_generada",
     "cajas_sede_generada",
+    "reporte_final",
 ]:
     if key not in st.session_state:
         st.session_state[key] = None
 
+if "perfiles" not in st.session_state:
+    st.session_state["perfiles"] = {}
+
+# último resultado de cada reporte (sin los bytes): al regenerar, OP1 y
+# ASISTENCIA solo releen los archivos que cambiaron
+if "resultados" not in st.session_state:
+    st.session_state["resultados"] = {}
+
+# trabajos en segundo plano: {reporte: (Trabajo, icono)} y el lote de
+# "Generar todo" que falta terminar para construir el Reporte Final
+if "trabajos" not in st.session_state:
+    st.session_state["trabajos"] = {}
+if "lote" not in st.session_state:
+    st.session_state["lote"] = None
+
+# Los xlsx generados se guardan en disco (funciones_almacen), no en la
+# sesión: en "*_generada" y "reporte_final" queda solo su huella.
+if "sesion" not in st.session_state:
+    st.session_state["sesion"] = uuid.uuid4().hex
+    depurar()
+SESION = st.session_state["sesion"]
+
+# tracemalloc solo si se pidió en el panel de perfil (vale para esta sesión)
+configurar_memoria(st.session_state.get("perfil_memoria", False))
+
+CLAVES_REPORTE = {
+    "PERSONAL": "personal_generada",
+    "CAJAS-SEDE": "cajas_sede_generada",
+    "ASISTENCIA": "asistencia_generada",
+    "OP1": "op1_generada",
+}
+
+
+def guardar_reporte(clave, datos):
+    """Guarda el xlsx en el almacén y devuelve su huella."""
+    guardar(SESION, clave, datos)
+    return hashlib.sha256(datos).hexdigest()
+
+
+def descargar(clave):
+    # se llama recién al pulsar el botón de descarga: Streamlit lee del
+    # archivo abierto, sin copiarlo antes a memoria con leer()
+    def abrir_reporte():
+        archivo = abrir(SESION, clave)
+        return archivo if archivo is not None else b""
+    return abrir_reporte
+
+
+# lo que el almacén ya depuró (cuota o TTL) deja de figurar como generado
+for key in [*CLAVES_REPORTE.values(), "reporte_final"]:
+    if st.session_state[key] is not None and ubicacion(SESION, key) is None:
+        st.session_state[key] = None
 
-# ========================
-# PLANTILLA BASE
-# ========================
-def _get_plantilla_path():
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    candidatos = [
-        os.path.join(base_dir, "plantillas", "Op1 - Reporte.xlsx"),
-        os.path.join(base_dir, "Op1 - Reporte.xlsx"),
-    ]
-    for ruta in candidatos:
-        if os.path.exists(ruta):
-            return ruta
-    raise FileNotFoundError("❌ No se encontró la plantilla ‘Op1 - Reporte.xlsx’.")
-    
-
-PLANTILLA_PATH = _get_plantilla_path()
-
-
-def get_temp_copy():
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
-    shutil.copyfile(PLANTILLA_PATH, tmp.name)
-    return tmp.name
-
-
-# ========================
-# CLASIFICADOR (CORREGIDO)
-# ========================
-def clasificar_archivos(lista):
-    res = {
-        "asc": None,
-        "nom": None,
-        "asc_mindef": None,
-        "asc_inst": None,
-        "nom_inst": None,
-        "asc_fa": None,
-        "mindef_inst": None,
-        "asc_personal": None,
-        "asc_cajas_sede": None,
-    }
-
-    for f in lista:
-        nombre = f.name.upper().replace(" ", "")
-
-        # 1) PERSONAL
-        if "PERSONAL" in nombre and "ASC" in nombre:
-            res["asc_personal"] = f
-            continue
-
-        # 2) CAJAS - SEDE
-        if "CAJAS" in nombre and "SEDE" in nombre and "ASC" in nombre:
-            res["asc_cajas_sede"] = f
-            continue
-
-        # 3) MINDEF – POSTULANTES
-        if "MINDEF" in nombre and "POSTULANTE" in nombre:
-            res["asc_mindef"] = f
-            continue
-
-        # 4) POSTULANTES (ASC / NOM)
-        if "POSTULANTE" in nombre:
-            if "ASC" in nombre:
-                res["asc"] = f
-            elif "NOM" in nombre:
-                res["nom"] = f
-            continue
-
-        # 5) MINDEF – INSTRUMENTOS
-        if "MINDEF" in nombre and ("INSTRUMENTO" in nombre or "INSTRUMENTOS" in nombre):
-            res["mindef_inst"] = f
-            continue
-
-        # 6) INSTRUMENTOS (ASC / NOM)
-        if "INSTRUMENTO" in nombre or "INSTRUMENTOS" in nombre:
-            if "ASC" in nombre:
-                res["asc_inst"] = f
-            elif "NOM" in nombre:
-                res["nom_inst"] = f
-            continue
-
-        # 7) ASC – FA
-        if "FA" in nombre and "ASC" in nombre:
-            res["asc_fa"] = f
-            continue
-
-    return res
-
-
-# ========================
-# COPIAR HOJA COMPLETA
-# ========================
-def copiar_hoja_completa(ws_src, ws_dest):
-
-    for row in ws_src.iter_rows():
-        for cell in row:
-            new_cell = ws_dest.cell(row=cell.row, column=cell.col_idx, value=cell.value)
-
-            if cell.has_style:
-                new_cell.font = copy(cell.font)
-                new_cell.border = copy(cell.border)
-                new_cell.fill = copy(cell.fill)
-                new_cell.number_format = copy(cell.number_format)
-                new_cell.alignment = copy(cell.alignment)
-
-    for merged in ws_src.merged_cells.ranges:
-        ws_dest.merge_cells(str(merged))
-
-    for col, dim in ws_src.column_dimensions.items():
-        ws_dest.column_dimensions[col].width = dim.width
-
-    for r, dim in ws_src.row_dimensions.items():
-        ws_dest.row_dimensions[r].height = dim.height
 
+def resultado_anterior(reporte):
+    """Último resultado del reporte con su xlsx (None si ya no está)."""
+    res = st.session_state["resultados"].get(reporte)
+    contenido = leer(SESION, CLAVES_REPORTE[reporte]) if res else None
+    return dataclasses.replace(res, contenido=contenido) if contenido else None
+
+
+def mostrar_resultado(res, icono=None):
+    """Muestra avisos/errores de un generar_* y guarda el xlsx en el almacén."""
+    if res.perfil:
+        st.session_state["perfiles"][res.reporte] = res.perfil
+    for aviso in res.avisos:
+        st.warning(aviso)
+    if not res.ok:
+        st.error(res.error)
+        return
+    clave = CLAVES_REPORTE[res.reporte]
+    st.session_state[clave] = guardar_reporte(clave, res.contenido)
+    st.session_state["resultados"][res.reporte] = dataclasses.replace(res, contenido=None)
+    st.success(res.mensaje)
+    if icono:
+        st.toast(f"{res.reporte} generado", icon=icono)
+
+
+def encolar(reporte, clasificados, icono=None):
+    """Envía el reporte a la cola de trabajos sin esperar a que termine."""
+    anterior = resultado_anterior(reporte) if reporte in INCREMENTALES else None
     try:
-        if getattr(ws_src, "conditional_formatting", None):
-            ws_dest.conditional_formatting = deepcopy(ws_src.conditional_formatting)
-    except Exception:
-        pass
-
-
-# ========================
-# COMBINAR REPORTES
-# ========================
-def combinar_reportes(plantilla, asistencia=None, op1=None,
-                      personal=None, cajas_sede=None):
-
-    wb_final = load_workbook(plantilla)
-
-    reportes = {
-        "ASISTENCIA": asistencia,
-        "OP1": op1,
-        "PERSONAL": personal,
-        "CAJAS-SEDE": cajas_sede
-    }
-
-    hojas_protegidas = ["DIC"]
-    for hoja in wb_final.sheetnames[:]:
-        if hoja not in hojas_protegidas:
-            del wb_final[hoja]
-
-    for nombre, archivo_bytes in reportes.items():
-        if not archivo_bytes:
+        trabajo = enviar(reporte, clasificados, SESION, anterior=anterior)
+    except RuntimeError as e:
+        st.error(str(e))
+        return False
+
+    # con otras entradas el trabajo anterior del mismo reporte ya no sirve
+    previo = st.session_state["trabajos"].get(reporte)
+    if previo is not None and previo[0] is not trabajo:
+        previo[0].cancelar()
+        retirar(previo[0])
+    st.session_state["trabajos"][reporte] = (trabajo, icono)
+    return True
+
+
+def recoger_trabajos():
+    """Muestra y guarda lo que terminó; cierra el lote de "Generar todo"."""
+    trabajos = st.session_state["trabajos"]
+    lote = st.session_state["lote"]
+    for reporte, (trabajo, icono) in list(trabajos.items()):
+        if not trabajo.terminado:
             continue
+        del trabajos[reporte]
+        res = retirar(trabajo)
+        if res is None:
+            st.info(f"Generación de {reporte} cancelada.", icon="✖️")
+        else:
+            mostrar_resultado(res, icono)
+        if lote and reporte in lote["pendientes"]:
+            lote["pendientes"].discard(reporte)
+            lote["ok"] = lote["ok"] or (res is not None and res.ok)
+
+    if lote and not lote["pendientes"]:
+        st.session_state["lote"] = None
+        if lote["ok"]:
+            with st.spinner("Construyendo Reporte Final..."):
+                construir_reporte_final()
+            st.toast("Reportes generados", icon="🚀")
+
+
+@st.fragment(run_every=1)
+def panel_trabajos():
+    """Avance de los trabajos (se refresca solo; al terminar uno, rerun de la app)."""
+    trabajos = st.session_state["trabajos"]
+    for reporte, (trabajo, _) in trabajos.items():
+        fraccion, texto = describir_trabajo(trabajo)
+        c1, c2 = st.columns([5, 1])
+        c1.progress(fraccion, text=f"{reporte}: {texto}")
+        if c2.button("✖️ Cancelar", key=f"cancelar_{trabajo.id}", disabled=trabajo.cancelado):
+            trabajo.cancelar()
+    if any(trabajo.terminado for trabajo, _ in trabajos.values()):
+        st.rerun()
+
+
+def huella_reportes():
+    """Huella de los cuatro reportes generados (None si falta alguno)."""
+    return tuple(
+        st.session_state[k]
+        for k in [
+            "asistencia_generada",
+            "op1_generada",
+            "personal_generada",
+            "cajas_sede_generada",
+        ]
+    )
 
-        wb_src = load_workbook(archivo_bytes)
-        ws_src = wb_src.active
-
-        ws_new = wb_final.create_sheet(nombre)
-        copiar_hoja_completa(ws_src, ws_new)
-
-    if "DIC" in wb_final.sheetnames:
-        dic = wb_final["DIC"]
-        wb_final._sheets.remove(dic)
-        wb_final._sheets.insert(0, dic)
-
-    try:
-        wb_final.calculation_properties.fullCalcOnLoad = True
-    except:
-        pass
 
-    out = BytesIO()
-    wb_final.save(out)
-    out.seek(0)
-    return out
+def construir_reporte_final():
+    with Perfil("REPORTE FINAL") as perfil:
+        with etapa("combinar_reportes"):
+            combinado = combinar_reportes(
+                PLANTILLA_PATH,
+                asistencia=ubicacion(SESION, "asistencia_generada"),
+                op1=ubicacion(SESION, "op1_generada"),
+                personal=ubicacion(SESION, "personal_generada"),
+                cajas_sede=ubicacion(SESION, "cajas_sede_generada")
+            )
+        with etapa("compactar_xlsx") as registro:
+            datos, informe = compactar_xlsx(combinado)
+            registro["bytes"] = len(datos)
+    guardar_reporte("reporte_final", datos)
+    st.session_state["reporte_final"] = (huella_reportes(), informe)
+    st.session_state["perfiles"]["REPORTE FINAL"] = perfil.como_dict()
 
 
 # ========================
 # UI STREAMLIT
 # ========================
 st.title("📊 Sistema de Generación de Reportes PE")
-st.caption("Sube los archivos Excel. Se clasificarán automáticamente.")
+st.caption("Sube los archivos Excel o CSV. Se clasificarán automáticamente.")
 
 with st.expander("📁 Subir archivos", expanded=True):
     archivos = st.file_uploader(
-        "Selecciona archivos (.xlsx)",
-        type=["xlsx"],
+        "Selecciona archivos (.xlsx, .csv, .tsv)",
+        type=["xlsx", "csv", "tsv", "txt"],
         accept_multiple_files=True
     )
 
@@ -217,6 +222,7 @@ if archivos:
                         f"✅ **{k.upper()}**<br><small>{v.name}</small>",
                         unsafe_allow_html=True
                     )
+        st.caption(f"📖 Lector de Excel: {lector_excel()}")
 
 
 # ========================
@@ -226,31 +232,23 @@ if archivos:
     st.subheader("⚙️ Generar")
     c1, c2, c3, c4 = st.columns(4)
 
+    # Cada botón encola un trabajo (funciones_trabajos) y la página sigue
+    # respondiendo; volver a pulsarlo con los mismos archivos no lo repite.
+
     # PERSONAL
     with c1:
         if st.button("👥 PERSONAL", disabled=clasificados.get("asc_personal") is None):
-            tmp = get_temp_copy()
-            generar_personal(tmp, clasificados["asc_personal"])
-            st.toast("PERSONAL generado", icon="👥")
+            encolar("PERSONAL", clasificados, "👥")
 
     # CAJAS-SEDE
     with c2:
         if st.button("🏢 CAJAS-SEDE", disabled=clasificados.get("asc_cajas_sede") is None):
-            tmp = get_temp_copy()
-            generar_cajas_sede(tmp, clasificados["asc_cajas_sede"])
-            st.toast("CAJAS-SEDE generado", icon="🏢")
+            encolar("CAJAS-SEDE", clasificados, "🏢")
 
     # ASISTENCIA
     with c3:
         if st.button("🟢 ASISTENCIA", disabled=not (clasificados.get("asc") and clasificados.get("nom"))):
-            tmp = get_temp_copy()
-            generar_asistencia(
-                tmp,
-                clasificados["asc"],
-                clasificados["nom"],
-                clasificados.get("asc_mindef")
-            )
-            st.toast("ASISTENCIA generado", icon="🟢")
+            encolar("ASISTENCIA", clasificados, "🟢")
 
     # OP1
     with c4:
@@ -258,15 +256,19 @@ if archivos:
                      disabled=not (clasificados.get("asc_inst")
                                    and clasificados.get("nom_inst")
                                    and clasificados.get("asc_fa"))):
-            tmp = get_temp_copy()
-            generar_op1(
-                tmp,
-                clasificados["asc_fa"],
-                clasificados["asc_inst"],
-                clasificados["nom_inst"],
-                clasificados.get("mindef_inst")
-            )
-            st.toast("OP1 generado", icon="🟦")
+            encolar("OP1", clasificados, "🟦")
+
+    # GENERAR TODO (en paralelo) + Reporte Final al terminar
+    disponibles = reportes_disponibles(clasificados)
+    if st.button("🚀 Generar todo", type="primary", disabled=not disponibles):
+        pendientes = {r for r in disponibles if encolar(r, clasificados)}
+        if pendientes:
+            st.session_state["lote"] = {"pendientes": pendientes, "ok": False}
+
+# trabajos terminados (aunque ya no haya archivos subidos) y avance de los demás
+recoger_trabajos()
+if st.session_state["trabajos"]:
+    panel_trabajos()
 
 
 # ========================
@@ -280,28 +282,28 @@ cols = st.columns(4)
 if st.session_state["personal_generada"]:
     cols[0].download_button(
         "PERSONAL",
-        st.session_state["personal_generada"],
+        descargar("personal_generada"),
         file_name="PE - PERSONAL.xlsx"
     )
 
 if st.session_state["cajas_sede_generada"]:
     cols[1].download_button(
         "CAJAS-SEDE",
-        st.session_state["cajas_sede_generada"],
+        descargar("cajas_sede_generada"),
         file_name="PE - CAJAS_SEDE.xlsx"
     )
 
 if st.session_state["asistencia_generada"]:
     cols[2].download_button(
         "ASISTENCIA",
-        st.session_state["asistencia_generada"],
+        descargar("asistencia_generada"),
         file_name="PE - ASISTENCIA.xlsx"
     )
 
 if st.session_state["op1_generada"]:
     cols[3].download_button(
         "OP1",
-        st.session_state["op1_generada"],
+        descargar("op1_generada"),
         file_name="PE - OP1.xlsx"
     )
 
@@ -320,18 +322,48 @@ hay_reportes = (
 )
 
 if hay_reportes:
-    combinado = combinar_reportes(
-        PLANTILLA_PATH,
-        asistencia=st.session_state["asistencia_generada"],
-        op1=st.session_state["op1_generada"],
-        personal=st.session_state["personal_generada"],
-        cajas_sede=st.session_state["cajas_sede_generada"]
-    )
-
-    st.download_button(
-        "⬇️ Descargar Reporte Final",
-        combinado,
-        file_name="PE - Reporte_Final.xlsx"
-    )
+    # Huella de los cuatro reportes: el combinado solo se reconstruye
+    # cuando alguno cambia y el usuario lo pide.
+    huella = huella_reportes()
+
+    final = st.session_state["reporte_final"]
+    vigente = final is not None and final[0] == huella
+
+    if st.button("📘 Construir Reporte Final", disabled=vigente):
+        construir_reporte_final()
+        final = st.session_state["reporte_final"]
+        vigente = True
+
+    if vigente:
+        st.download_button(
+            "⬇️ Descargar Reporte Final",
+            descargar("reporte_final"),
+            file_name="PE - Reporte_Final.xlsx"
+        )
+        st.caption(f"📦 Compactado: {describir_compactacion(final[1])}")
+    elif final is not None:
+        st.caption("Los reportes cambiaron: vuelve a construir el Reporte Final.")
 else:
-    st.info("Genera al menos un reporte para combinarlo.", icon="ℹ️")
\ No newline at end of file
+    st.info("Genera al menos un reporte para combinarlo.", icon="ℹ️")
+
+# ========================
+# PERFIL DE GENERACIÓN
+# ========================
+with st.expander("⏱️ Perfil de generación"):
+    st.toggle("Medir memoria (tracemalloc; la generación tarda más)", key="perfil_memoria")
+
+    perfiles = st.session_state["perfiles"]
+    if not perfiles:
+        st.caption("Genera un reporte para ver el tiempo, la memoria y los conteos de cada etapa.")
+
+    for nombre, perfil in perfiles.items():
+        st.markdown(f"**{nombre}** — {describir_perfil(perfil)}")
+        st.dataframe(pd.DataFrame(filas_perfil(perfil)), hide_index=True)
+
+    if perfiles:
+        st.download_button(
+            "⬇️ Descargar perfil (JSON)",
+            json.dumps(list(perfiles.values()), ensure_ascii=False, indent=2),
+            file_name="PE - Perfil.json",
+            mime="application/json"
+        )
@@ -0,0 +1,14 @@
+"""
+Benchmark de los generadores con datos sintéticos (ver datos.sintetizar).
+
+    python -m benchmarks --escalas 1k,10k,100k --out resultados.json
+    python -m benchmarks --escalas 1M --repeticiones 1
+    python -m benchmarks --escalas 1k,10k --guardar-baseline
+    python -m benchmarks --escalas 1k,10k --verificar-lectores
+
+Cada etapa (generar_*, combinar_reportes, compactar_xlsx) se mide por
+separado; si existe benchmarks/baseline.json se compara contra ella y
+el código de salida es 1 ante regresiones o errores.
+--verificar-lectores comprueba que cada lector de Excel instalado
+(calamine, openpyxl) entrega DataFrames idénticos en cada cargador.
+"""
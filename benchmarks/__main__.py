@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import sys
+
+from benchmarks.ejecutar import ETAPAS, comparar, datos_escala, ejecutar
+from benchmarks.lectores import verificar_lectores
+from funciones_lectura import lector_excel
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def _escala(texto):
+    """1000, 10k, 1M → número de filas."""
+    texto = texto.strip().lower()
+    factor = {"k": 1_000, "m": 1_000_000}.get(texto[-1:], 1)
+    return int(float(texto.rstrip("km")) * factor)
+
+
+def _imprimir(filas, resultados):
+    print(f"\n— {filas:,} filas —")
+    for r in sorted(resultados, key=lambda r: ETAPAS.index(r["etapa"])):
+        estado = f"  ❌ {r['error']}" if r["error"] else ""
+        print(f"  {r['etapa']:<20} min {r['min_s']:>8.3f} s   mediana {r['mediana_s']:>8.3f} s{estado}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks", description="Benchmark de los generadores PE con datos sintéticos")
+    parser.add_argument("--escalas", default="1k,10k,100k",
+                        help="Filas por archivo de entrada, separadas por comas (1k … 1M)")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--datos", default=None, help="Carpeta donde guardar/reutilizar los Excel sintéticos")
+    parser.add_argument("--con-cache", action="store_true",
+                        help="No vaciar la caché de DataFrames entre repeticiones y usar la copia en disco (Arrow)")
+    parser.add_argument("--out", default=None, help="Archivo JSON de resultados")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Línea base con la cual comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="Margen antes de marcar una regresión (0.25 = 25%% más lento)")
+    parser.add_argument("--guardar-baseline", action="store_true",
+                        help="Guardar estos resultados como nueva línea base")
+    parser.add_argument("--verificar-lectores", action="store_true",
+                        help="Solo comprobar que cada lector de Excel instalado da los mismos DataFrames")
+    args = parser.parse_args(argv)
+
+    escalas = [_escala(e) for e in args.escalas.split(",") if e.strip()]
+
+    if args.verificar_lectores:
+        diferencias = []
+        for filas in escalas:
+            encontradas = verificar_lectores(datos_escala(filas, args.semilla, args.datos))
+            for entrada, lector, diferencia in encontradas:
+                print(f"  ❌ {filas:,} filas, {entrada}: {lector} ≠ openpyxl ({diferencia})")
+            diferencias.extend(encontradas)
+        print("Lectores idénticos ✔" if not diferencias else f"{len(diferencias)} diferencias entre lectores")
+        return 1 if diferencias else 0
+
+    print(f"Lector de Excel: {lector_excel()}")
+    actual = ejecutar(escalas, args.repeticiones, args.semilla, args.datos, args.con_cache, _imprimir)
+
+    regresiones = []
+    if not args.guardar_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regresiones = comparar(actual, json.load(f), args.tolerancia)
+
+        print("\nComparación con la línea base (mínimo de las repeticiones):")
+        for r in actual["resultados"]:
+            if r.get("razon") is not None:
+                marca = "⚠ REGRESIÓN" if r in regresiones else ""
+                print(f"  {r['escala']:>9,} {r['etapa']:<20} {r['base_s']:>8.3f} s → {r['min_s']:>8.3f} s  x{r['razon']:.2f} {marca}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(actual, f, ensure_ascii=False, indent=2)
+    if args.guardar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(actual, f, ensure_ascii=False, indent=2)
+        print(f"\nLínea base guardada en {args.baseline}")
+
+    errores = [r for r in actual["resultados"] if r["error"]]
+    return 1 if regresiones or errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
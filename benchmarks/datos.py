@@ -0,0 +1,160 @@
+import os
+import random
+
+from openpyxl import Workbook, load_workbook
+
+from funciones_op1 import FA_TIPOS
+from funciones_personal import ROLE_MAPPING
+from funciones_plantilla import PLANTILLA_PATH
+
+
+# ---------------------------------------------------------
+# Nombres de archivo (los que reconoce clasificar_archivos)
+# ---------------------------------------------------------
+ARCHIVOS = {
+    "asc": "ASC - POSTULANTES.xlsx",
+    "nom": "NOM - POSTULANTES.xlsx",
+    "asc_mindef": "MINDEF - POSTULANTES.xlsx",
+    "asc_inst": "ASC - INSTRUMENTOS.xlsx",
+    "nom_inst": "NOM - INSTRUMENTOS.xlsx",
+    "mindef_inst": "MINDEF - INSTRUMENTOS.xlsx",
+    "asc_fa": "ASC - FA.xlsx",
+    "asc_personal": "ASC - PERSONAL.xlsx",
+    "asc_cajas_sede": "ASC - CAJAS SEDE.xlsx",
+}
+
+TIPOS_INSTRUMENTO = [
+    "CUADERNILLO DE CONOCIMIENTOS - FORMA A",
+    "Cuadernillo de Habilidades",
+    "CUADERNILLO DE CONOCIMIENTOS",
+    "FICHA DE RESPUESTA",
+    "FICHA DE RESPUESTA ÓPTICA",
+    "CUADERNILLO",
+    "SOBRE DE DEVOLUCIÓN",
+]
+
+TIPOS_CAJA = ["Caja de instrumento de aplicación", "CAJA ADICIONAL", "Candado", "Precinto"]
+
+
+# ---------------------------------------------------------
+# Sedes y locales de la plantilla
+# ---------------------------------------------------------
+def claves_plantilla(ruta=None):
+    """Sedes (ASISTENCIA, CAJAS-SEDE) y pares sede/local (OP1, PERSONAL)."""
+    wb = load_workbook(ruta or PLANTILLA_PATH, read_only=True)
+    try:
+        def columnas(hoja, n):
+            filas = wb[hoja].iter_rows(min_row=2, min_col=2, max_col=1 + n, values_only=True)
+            return [f if n > 1 else f[0] for f in filas if all(f)]
+
+        return {
+            "sedes": columnas("ASISTENCIA", 1),
+            "sedes_cajas": columnas("CAJAS-SEDE", 1),
+            "locales": columnas("OP1", 2),
+            "locales_personal": columnas("PERSONAL", 2),
+        }
+    finally:
+        wb.close()
+
+
+def _escribir(ruta, encabezado, filas, hoja="Reporte", titulo="REPORTE", vacias=1):
+    """Libro como los del sistema de origen: título, filas vacías y tabla."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(hoja)
+    ws.append([titulo])
+    for _ in range(vacias):
+        ws.append([])
+    ws.append(encabezado)
+    for fila in filas:
+        ws.append(fila)
+    wb.save(ruta)
+
+
+# ---------------------------------------------------------
+# Generar un juego completo de entradas
+# ---------------------------------------------------------
+def sintetizar(carpeta, filas, semilla=1, plantilla=None):
+    """
+    Escribe en `carpeta` los nueve Excel de entrada con `filas` filas
+    cada uno. Las sedes y locales salen de la plantilla, con algo de
+    ruido (espacios, mayúsculas, vacíos, tipos y sedes que no cuadran)
+    como en los archivos reales. Devuelve {entrada: ruta}.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    rnd = random.Random(semilla)
+    claves = claves_plantilla(plantilla)
+    rutas = {k: os.path.join(carpeta, nombre) for k, nombre in ARCHIVOS.items()}
+
+    def sede_ruidosa(sede):
+        r = rnd.random()
+        if r < 0.03:
+            return f" {sede} "
+        if r < 0.05:
+            return "SEDE NO REGISTRADA"
+        return sede
+
+    # POSTULANTES (ASC / NOM / MINDEF): encabezado con "N" en la primera columna
+    for k in ("asc", "nom", "asc_mindef"):
+        _escribir(
+            rutas[k],
+            ["N", "Código", "Apellidos y nombres", "Sede Operativa", "Postulantes",
+             "Asistencia al Local", "Asistencia en Aula", "Casos de inconsistencia"],
+            (
+                [i + 1, f"P{i:07d}", f"POSTULANTE {i}", sede_ruidosa(rnd.choice(claves["sedes"])),
+                 1, rnd.randint(0, 1), rnd.randint(0, 1), rnd.choice([0, 0, 0, 1, None])]
+                for i in range(filas)
+            ),
+        )
+
+    # INSTRUMENTOS (ASC / NOM / MINDEF) y FA: por sede, local y aula
+    tipos = {
+        "asc_inst": TIPOS_INSTRUMENTO,
+        "nom_inst": TIPOS_INSTRUMENTO,
+        "mindef_inst": TIPOS_INSTRUMENTO,
+        "asc_fa": list(FA_TIPOS.values()) + ["OTRO FORMATO"],
+    }
+    for k, opciones in tipos.items():
+        def filas_inventario():
+            for i in range(filas):
+                sede, local = rnd.choice(claves["locales"])
+                inventario = rnd.randint(0, 60) if rnd.random() > 0.02 else None
+                yield [sede_ruidosa(sede), local, f"AULA {i % 40 + 1:02d}", rnd.choice(opciones), inventario]
+
+        _escribir(
+            rutas[k],
+            ["Sede Operativa", "Local", "Aula", "Tipo", "Inventario en campo"],
+            filas_inventario(),
+            vacias=2,
+        )
+
+    # PERSONAL (hoja Reporte_Nacional)
+    cargos = list(ROLE_MAPPING.values())
+
+    def filas_personal():
+        for _ in range(filas):
+            sede, local = rnd.choice(claves["locales_personal"])
+            if rnd.random() < 0.1:
+                sede, local = sede.lower(), f"{local}\xa0"
+            yield [sede, local, rnd.choice(cargos), rnd.randint(0, 12), rnd.randint(0, 12)]
+
+    _escribir(
+        rutas["asc_personal"],
+        ["Sede Operativa", "Local", "Cargo", "Mínimo requerido", "Asistencia"],
+        filas_personal(),
+        hoja="Reporte_Nacional",
+        vacias=2,
+    )
+
+    # CAJAS-SEDE (hoja Reporte): valores numéricos a veces como texto
+    _escribir(
+        rutas["asc_cajas_sede"],
+        ["Sede Operativa", "Tipo", "Total inventario imprenta", "Ingreso", "Salida"],
+        (
+            [rnd.choice(claves["sedes_cajas"]), rnd.choice(TIPOS_CAJA), rnd.randint(0, 20),
+             rnd.choice([rnd.randint(0, 20), str(rnd.randint(0, 20)), None]), rnd.randint(0, 20)]
+            for _ in range(filas)
+        ),
+        vacias=3,
+    )
+
+    return rutas
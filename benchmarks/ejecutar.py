@@ -0,0 +1,175 @@
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from io import BytesIO
+
+import openpyxl
+import pandas as pd
+
+from benchmarks.datos import ARCHIVOS, sintetizar
+from funciones_asistencia import generar_asistencia
+from funciones_cache import disco_activo, limpiar_cache, usar_disco
+from funciones_cajas_sede import generar_cajas_sede
+from funciones_combinar import combinar_reportes, compactar_xlsx
+from funciones_lectura import lector_excel
+from funciones_op1 import generar_op1
+from funciones_personal import generar_personal
+from funciones_plantilla import PLANTILLA_PATH, obtener_plantilla
+
+
+ETAPAS = [
+    "generar_asistencia",
+    "generar_op1",
+    "generar_personal",
+    "generar_cajas_sede",
+    "combinar_reportes",
+    "compactar_xlsx",
+]
+
+CARPETA_DATOS = os.path.join(tempfile.gettempdir(), "pe_reportes_bench")
+
+
+# ---------------------------------------------------------
+# Datos por escala (se generan una vez y se reutilizan)
+# ---------------------------------------------------------
+def datos_escala(filas, semilla=1, carpeta=None):
+    carpeta = os.path.join(carpeta or CARPETA_DATOS, f"{filas}_{semilla}")
+    rutas = {k: os.path.join(carpeta, nombre) for k, nombre in ARCHIVOS.items()}
+    if not all(os.path.exists(r) for r in rutas.values()):
+        rutas = sintetizar(carpeta, filas, semilla)
+    return rutas
+
+
+def _medir(funcion, repeticiones, preparar=None):
+    tiempos, valor = [], None
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        valor = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return valor, tiempos
+
+
+def _fila(filas, etapa, tiempos, error=None):
+    return {
+        "escala": filas,
+        "etapa": etapa,
+        "tiempos_s": [round(t, 4) for t in tiempos],
+        "min_s": round(min(tiempos), 4),
+        "mediana_s": round(statistics.median(tiempos), 4),
+        "error": error,
+    }
+
+
+# ---------------------------------------------------------
+# Medir una escala
+# ---------------------------------------------------------
+def medir_escala(filas, repeticiones=3, semilla=1, carpeta=None, con_cache=False):
+    """
+    Mide cada generar_* por separado y luego combinar_reportes y
+    compactar_xlsx sobre sus salidas. Sin con_cache se vacía la caché
+    de DataFrames antes de cada repetición y no se usa la copia en disco
+    (se mide la lectura del Excel).
+    """
+    rutas = datos_escala(filas, semilla, carpeta)
+    preparar = None if con_cache else limpiar_cache
+    disco = disco_activo()
+    usar_disco(disco and con_cache)
+    try:
+        return _medir_escala(filas, rutas, repeticiones, preparar)
+    finally:
+        usar_disco(disco)
+
+
+def _medir_escala(filas, rutas, repeticiones, preparar):
+
+    generadores = {
+        "generar_asistencia": ("ASISTENCIA", lambda: generar_asistencia(
+            obtener_plantilla("ASISTENCIA"), rutas["asc"], rutas["nom"], rutas["asc_mindef"])),
+        "generar_op1": ("OP1", lambda: generar_op1(
+            obtener_plantilla("OP1"), rutas["asc_fa"], rutas["asc_inst"], rutas["nom_inst"], rutas["mindef_inst"])),
+        "generar_personal": ("PERSONAL", lambda: generar_personal(
+            obtener_plantilla("PERSONAL"), rutas["asc_personal"])),
+        "generar_cajas_sede": ("CAJAS-SEDE", lambda: generar_cajas_sede(
+            obtener_plantilla("CAJAS-SEDE"), rutas["asc_cajas_sede"])),
+    }
+
+    resultados, salidas = [], {}
+    for etapa, (reporte, funcion) in generadores.items():
+        res, tiempos = _medir(funcion, repeticiones, preparar)
+        resultados.append(_fila(filas, etapa, tiempos, res.error))
+        salidas[reporte] = res.contenido
+
+    def combinar():
+        return combinar_reportes(
+            PLANTILLA_PATH,
+            **{
+                parametro: BytesIO(salidas[reporte])
+                for reporte, parametro in [("ASISTENCIA", "asistencia"), ("OP1", "op1"),
+                                           ("PERSONAL", "personal"), ("CAJAS-SEDE", "cajas_sede")]
+                if salidas[reporte]
+            }
+        )
+
+    combinado, tiempos = _medir(combinar, repeticiones)
+    resultados.append(_fila(filas, "combinar_reportes", tiempos))
+
+    (_, informe), tiempos = _medir(lambda: compactar_xlsx(combinado), repeticiones)
+    fila = _fila(filas, "compactar_xlsx", tiempos)
+    fila["bytes"] = {"antes": informe["bytes_antes"], "despues": informe["bytes_despues"]}
+    resultados.append(fila)
+
+    return resultados
+
+
+def ejecutar(escalas, repeticiones=3, semilla=1, carpeta=None, con_cache=False, al_terminar=None):
+    """Corre todas las escalas y devuelve el documento JSON de resultados."""
+    resultados = []
+    for filas in escalas:
+        filas_escala = medir_escala(filas, repeticiones, semilla, carpeta, con_cache)
+        resultados.extend(filas_escala)
+        if al_terminar:
+            al_terminar(filas, filas_escala)
+
+    return {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "openpyxl": openpyxl.__version__,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeticiones": repeticiones,
+            "semilla": semilla,
+            "con_cache": con_cache,
+            "lector_excel": lector_excel(),
+        },
+        "resultados": resultados,
+    }
+
+
+# ---------------------------------------------------------
+# Comparación con la línea base
+# ---------------------------------------------------------
+def comparar(actual, baseline, tolerancia=0.25):
+    """
+    Agrega a cada resultado el tiempo de la línea base y la razón
+    actual/base (sobre el mínimo de las repeticiones). Devuelve la
+    lista de regresiones: etapas más lentas que base * (1 + tolerancia).
+    """
+    base = {(r["escala"], r["etapa"]): r for r in baseline.get("resultados", [])}
+    regresiones = []
+    for r in actual["resultados"]:
+        b = base.get((r["escala"], r["etapa"]))
+        if b is None or r["error"] or b.get("error") or not b["min_s"]:
+            r["base_s"] = r["razon"] = None
+            continue
+        r["base_s"] = b["min_s"]
+        r["razon"] = round(r["min_s"] / b["min_s"], 3)
+        if r["razon"] > 1 + tolerancia:
+            regresiones.append(r)
+    return regresiones
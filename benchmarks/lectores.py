@@ -0,0 +1,61 @@
+from funciones_asistencia import cargar_postulantes
+from funciones_cajas_sede import cargar_asc_cajas_sede
+from funciones_lectura import lectores_disponibles, usar_lector
+from funciones_op1 import (
+    CATEGORIAS_ASC, CATEGORIAS_FA, CATEGORIAS_MINDEF, CATEGORIAS_NOM,
+    cargador_categorizado,
+)
+from funciones_personal import _cargar_asc_personal
+
+
+# ---------------------------------------------------------
+# Entrada → cargador (el mismo que usa cada generar_*)
+# ---------------------------------------------------------
+CARGADORES = {
+    "asc": cargar_postulantes,
+    "nom": cargar_postulantes,
+    "asc_mindef": cargar_postulantes,
+    "asc_fa": cargador_categorizado(CATEGORIAS_FA),
+    "asc_inst": cargador_categorizado(CATEGORIAS_ASC),
+    "nom_inst": cargador_categorizado(CATEGORIAS_NOM),
+    "mindef_inst": cargador_categorizado(CATEGORIAS_MINDEF),
+    "asc_personal": _cargar_asc_personal,
+    "asc_cajas_sede": cargar_asc_cajas_sede,
+}
+
+
+def _diferencia(a, b):
+    """Primera diferencia entre dos DataFrames (None si son idénticos)."""
+    if not a.columns.equals(b.columns):
+        return f"columnas {list(a.columns)} ≠ {list(b.columns)}"
+    if not a.index.equals(b.index):
+        return f"índice de {len(a)} ≠ {len(b)} filas"
+    for c in a.columns:
+        if a[c].dtype != b[c].dtype:
+            return f"tipo de {c}: {a[c].dtype} ≠ {b[c].dtype}"
+        if not a[c].equals(b[c]):
+            return f"valores de {c}"
+    return None
+
+
+def verificar_lectores(rutas):
+    """
+    Carga cada entrada con cada lector de Excel instalado y la compara
+    con la de openpyxl. Devuelve [(entrada, lector, diferencia)].
+    """
+    anterior = usar_lector("openpyxl")
+    diferencias = []
+    try:
+        for entrada, cargador in CARGADORES.items():
+            usar_lector("openpyxl")
+            referencia = cargador(rutas[entrada])
+            for lector in lectores_disponibles():
+                if lector == "openpyxl":
+                    continue
+                usar_lector(lector)
+                diferencia = _diferencia(referencia, cargador(rutas[entrada]))
+                if diferencia:
+                    diferencias.append((entrada, lector, diferencia))
+    finally:
+        usar_lector(anterior)
+    return diferencias
@@ -0,0 +1,173 @@
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+# ---------------------------------------------------------
+# Almacén en disco de los reportes generados
+# ---------------------------------------------------------
+# Los xlsx de cada sesión se guardan en <carpeta>/<sesión>/<nombre>
+# en vez de quedar como BytesIO en st.session_state. Límites:
+#   PE_ALMACEN_SESION_MB  por sesión (64)
+#   PE_ALMACEN_TOTAL_MB   para todo el servidor (1024)
+#   PE_ALMACEN_TTL_HORAS  sin uso, se borra (8)
+# Al pasar un límite se borra primero lo usado hace más tiempo (LRU):
+# la fecha de modificación del archivo se renueva cada vez que se lee.
+# ---------------------------------------------------------
+CARPETA_ALMACEN = os.environ.get("PE_ALMACEN_DIR") or os.path.join(tempfile.gettempdir(), "pe_reportes_almacen")
+CUOTA_SESION = int(float(os.environ.get("PE_ALMACEN_SESION_MB", "64")) * 1024 * 1024)
+CUOTA_TOTAL = int(float(os.environ.get("PE_ALMACEN_TOTAL_MB", "1024")) * 1024 * 1024)
+TTL_SEGUNDOS = float(os.environ.get("PE_ALMACEN_TTL_HORAS", "8")) * 3600
+
+_NOMBRE_VALIDO = re.compile(r"[A-Za-z0-9_-]+")
+_lock = threading.Lock()
+
+
+def _ruta(sesion, nombre):
+    # sesión y nombre forman la ruta: nada de "/", ".." ni vacíos
+    for parte in (sesion, nombre):
+        if not _NOMBRE_VALIDO.fullmatch(parte or ""):
+            raise ValueError(f"❌ Nombre no válido en el almacén: {parte!r}")
+    return os.path.join(CARPETA_ALMACEN, sesion, nombre)
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+# ---------------------------------------------------------
+# Guardar / leer
+# ---------------------------------------------------------
+def guardar(sesion, nombre, datos):
+    """Escribe los bytes (reemplazando los anteriores) y aplica los límites."""
+    ruta = _ruta(sesion, nombre)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _lock:     # depurar() no borra la carpeta mientras se escribe
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        try:
+            with open(temporal, "wb") as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+        finally:
+            _borrar(temporal)
+    depurar(protegido=ruta)
+    return ruta
+
+
+def abrir(sesion, nombre):
+    """Archivo abierto en modo binario (None si no está o ya se depuró)."""
+    ruta = _ruta(sesion, nombre)
+    try:
+        archivo = open(ruta, "rb")
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(ruta)      # último uso, para el LRU y el TTL
+    except OSError:
+        pass
+    return archivo
+
+
+def leer(sesion, nombre):
+    archivo = abrir(sesion, nombre)
+    if archivo is None:
+        return None
+    with archivo:
+        return archivo.read()
+
+
+def ubicacion(sesion, nombre):
+    """Ruta del archivo si existe (para leerlo sin copiarlo a memoria)."""
+    ruta = _ruta(sesion, nombre)
+    return ruta if os.path.exists(ruta) else None
+
+
+def borrar(sesion, nombre):
+    _borrar(_ruta(sesion, nombre))
+
+
+# ---------------------------------------------------------
+# Límites: TTL, cuota por sesión y cuota total (LRU)
+# ---------------------------------------------------------
+def _archivos():
+    """[(último uso, bytes, sesión, ruta)] de todo el almacén."""
+    archivos = []
+    try:
+        sesiones = list(os.scandir(CARPETA_ALMACEN))
+    except FileNotFoundError:
+        return archivos
+    for sesion in sesiones:
+        if not sesion.is_dir():
+            continue
+        try:
+            entradas = list(os.scandir(sesion.path))
+        except FileNotFoundError:
+            continue
+        for e in entradas:
+            if e.name.endswith(".tmp"):
+                continue
+            try:
+                st = e.stat()
+            except FileNotFoundError:
+                continue
+            archivos.append((st.st_mtime, st.st_size, sesion.name, e.path))
+    return archivos
+
+
+def _recortar(archivos, cuota, protegido):
+    """Borra los menos usados hasta quedar bajo la cuota; devuelve los que quedan."""
+    total = sum(a[1] for a in archivos)
+    quedan = []
+    for a in sorted(archivos):
+        if total > cuota and a[3] != protegido:
+            _borrar(a[3])
+            total -= a[1]
+        else:
+            quedan.append(a)
+    return quedan
+
+
+def depurar(protegido=None, ahora=None):
+    """
+    Aplica TTL y cuotas. `protegido` (el archivo recién guardado) no se
+    borra aunque él solo pase la cuota. Devuelve cuántos archivos borró.
+    """
+    ahora = time.time() if ahora is None else ahora
+    with _lock:
+        archivos = _archivos()
+        antes = len(archivos)
+
+        vigentes = []
+        for a in archivos:
+            if ahora - a[0] > TTL_SEGUNDOS and a[3] != protegido:
+                _borrar(a[3])
+            else:
+                vigentes.append(a)
+
+        por_sesion = {}
+        for a in vigentes:
+            por_sesion.setdefault(a[2], []).append(a)
+        vigentes = []
+        for sesion, lista in por_sesion.items():
+            vigentes += _recortar(lista, CUOTA_SESION, protegido)
+
+        vigentes = _recortar(vigentes, CUOTA_TOTAL, protegido)
+
+        # carpetas de sesiones que quedaron vacías
+        for sesion in {a[2] for a in archivos} - {a[2] for a in vigentes}:
+            try:
+                os.rmdir(os.path.join(CARPETA_ALMACEN, sesion))
+            except OSError:
+                pass
+
+    return antes - len(vigentes)
+
+
+def uso(sesion=None):
+    """Bytes ocupados por una sesión (o por todo el almacén)."""
+    return sum(a[1] for a in _archivos() if sesion is None or a[2] == sesion)
@@ -1,16 +1,26 @@
 import pandas as pd
-import streamlit as st
-from io import BytesIO
-from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 from openpyxl.formatting.rule import CellIsRule
 
+from funciones_cache import cargar_con_cache
+from funciones_formulas import guardar_con_valores
+from funciones_incremental import (
+    aplicar_cambios, cambios_en_bloques, entradas_cambiadas, estado_previo, huellas_entradas,
+)
+from funciones_lectura import (
+    detectar_encabezado, elegir_columnas, es_texto_delimitado, leer_excel, leer_texto_agregado,
+)
+from funciones_normalizar import clave, claves
+from funciones_perfil import avance, etapa, perfilado
+from funciones_plantilla import cargar_hoja
+from funciones_resultado import ResultadoGeneracion
+
 
 # ---------------------------------------------------------
 # Detecta la columna “Sede”
 # ---------------------------------------------------------
-def detectar_columna_sede(df):
-    for c in df.columns:
+def columna_sede(columnas):
+    for c in columnas:
         if any(x in str(c).lower() for x in [
             "sede", "operativa", "evaluación", "evaluacion",
             "aplicación", "aplicacion"
@@ -19,76 +29,146 @@ def detectar_columna_sede(df):
     raise ValueError("❌ No se encontró una columna de sede válida.")
 
 
+def detectar_columna_sede(df):
+    return columna_sede(df.columns)
+
+
 # ---------------------------------------------------------
 # Carga archivos ASC, NOM y MINDEF (antes ACC)
 # ---------------------------------------------------------
-def cargar_postulantes(file):
-    df = pd.read_excel(file, header=None)
+def _es_fila_n(valores):
+    return bool(valores) and str(valores[0]).upper() == "N"
+
 
+def detectar_fila_n(file):
     # Buscar fila con cabecera (valor "N" en la primera columna)
-    cab = df.index[df.iloc[:, 0].astype(str).str.upper().eq("N")].tolist()
-    if not cab:
+    fila, columnas = detectar_encabezado(file, _es_fila_n)
+    if fila is None:
         raise ValueError("❌ No se encontró la fila de cabecera (valor 'N').")
+    return fila, columnas
+
 
-    df.columns = df.iloc[cab[0]]
-    df = df.iloc[cab[0] + 1:].reset_index(drop=True)
+COLUMNAS_NUMERICAS = ["Postulantes", "Asistencia al Local",
+                      "Asistencia en Aula", "Casos de inconsistencia"]
 
+
+def _normalizar_postulantes(df):
     sede_col = detectar_columna_sede(df)
     df = df.rename(columns={sede_col: "Sede"})
+    df["Sede"] = claves(df["Sede"])
 
     # Convertir campos numéricos
-    for c in ["Postulantes", "Asistencia al Local",
-              "Asistencia en Aula", "Casos de inconsistencia"]:
+    for c in COLUMNAS_NUMERICAS:
         if c in df.columns:
             df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0)
 
+    return df
+
+
+def _sumar_por_sede(df):
     return df.groupby("Sede", as_index=False).sum()
 
 
+def _agregar_parte(df):
+    # del CSV solo se guardan la sede y los totales que usa la hoja
+    df = _normalizar_postulantes(df)
+    return _sumar_por_sede(df[["Sede"] + [c for c in COLUMNAS_NUMERICAS if c in df.columns]])
+
+
+def _columnas_postulantes(columnas):
+    # solo la sede y los totales: nombres, códigos, etc. no se leen
+    necesarias = {columna_sede(columnas): str, **{c: None for c in COLUMNAS_NUMERICAS}}
+    return elegir_columnas(columnas, necesarias)
+
+
+def cargar_postulantes(file):
+    fila, columnas = detectar_fila_n(file)
+    columnas, tipos = _columnas_postulantes(columnas)
+    if es_texto_delimitado(file):
+        return leer_texto_agregado(file, fila, _agregar_parte, _sumar_por_sede, columnas=columnas, dtype=tipos)
+
+    df = _normalizar_postulantes(leer_excel(file, header=fila, columnas=columnas, dtype=tipos))
+
+    with etapa("agregar") as registro:
+        df = _sumar_por_sede(df)
+        registro["grupos"] = len(df)
+    return df
+
+
 # ---------------------------------------------------------
-# Forzar recálculo en Excel
+# Totales de cada archivo → columnas de la hoja
+# (ASC → E–H, NOM → I–L, MINDEF opcional → M–P)
 # ---------------------------------------------------------
-def habilitar_recalculo(wb):
-    from openpyxl.workbook.properties import CalcProperties
-    try:
-        wb.calculation_properties.fullCalcOnLoad = True
-    except Exception:
-        wb.calculation_properties = CalcProperties(fullCalcOnLoad=True)
+COLUMNAS_ENTRADA = {"asc": "EFGH", "nom": "IJKL", "mindef": "MNOP"}
+
+
+def filas_asistencia(ws):
+    """[(fila, sede)] de las filas de la hoja con sede."""
+    filas = []
+    for r in range(2, ws.max_row + 1):
+        sede = clave(ws[f"B{r}"].value)
+        if sede:
+            filas.append((r, sede))
+    return filas
+
+
+def bloque_asistencia(entrada, filas, totales):
+    """{celda: total} de las columnas de `entrada` (0 si la sede no está)."""
+    return {
+        f"{col}{r}": totales.get(sede, {}).get(campo, 0)
+        for r, sede in filas
+        for col, campo in zip(COLUMNAS_ENTRADA[entrada], COLUMNAS_NUMERICAS)
+    }
 
 
 # ---------------------------------------------------------
 # FUNCIÓN PRINCIPAL — GENERAR ASISTENCIA
 # ---------------------------------------------------------
-def generar_asistencia(base, asc, nom, mindef):
-    st.info("Procesando hoja ASISTENCIA...")
+@perfilado("ASISTENCIA")
+def generar_asistencia(base, asc, nom, mindef, anterior=None):
+    """
+    Con `anterior` (el resultado de la generación previa) solo se leen
+    los archivos que cambiaron y se reescriben sus celdas.
+    """
+    resultado = ResultadoGeneracion("ASISTENCIA")
 
     try:
-        # === Cargar ASC ===
-        asc_df = cargar_postulantes(asc)
-        asc_d = asc_df.set_index("Sede").to_dict("index")
-
-        # === Cargar NOM ===
-        nom_df = cargar_postulantes(nom)
-        nom_d = nom_df.set_index("Sede").to_dict("index")
+        archivos = {"asc": asc, "nom": nom, "mindef": mindef}
+        huellas = huellas_entradas(base, archivos)
+        previo = estado_previo(anterior, huellas)
+        cambiadas = entradas_cambiadas(previo, huellas)
+
+        # === Cargar ASC / NOM / MINDEF (opcional) ===
+        totales = {}
+        for entrada in cambiadas:
+            if entrada == "mindef" and not mindef:
+                totales[entrada] = {}   # si no hay archivo MINDEF → valores 0
+                continue
+            df = cargar_con_cache(archivos[entrada], "postulantes", cargar_postulantes)
+            totales[entrada] = df.set_index("Sede").to_dict("index")
 
-        # === Cargar MINDEF (opcional) ===
-        if mindef:
-            mindef_df = cargar_postulantes(mindef)
-            mindef_d = mindef_df.set_index("Sede").to_dict("index")
-        else:
-            mindef_d = {}   # si no hay archivo MINDEF → valores 0
+        if previo is not None:
+            filas = previo["filas"]
+            bloques = dict(previo["bloques"])
+            bloques.update({e: bloque_asistencia(e, filas, totales[e]) for e in cambiadas})
+            cambios = cambios_en_bloques(previo, bloques, cambiadas)
 
-        # === Abrir la plantilla ===
-        wb = load_workbook(base)
-        if "ASISTENCIA" not in wb.sheetnames:
-            raise ValueError("❌ La plantilla no contiene la hoja ASISTENCIA.")
+            if cambios:
+                resultado.contenido = aplicar_cambios(anterior, "ASISTENCIA", cambios)
+                resultado.mensaje = f"✅ Hoja ASISTENCIA actualizada ({len(cambios)} celdas)."
+            else:
+                resultado.contenido = anterior.contenido
+                resultado.mensaje = "✅ Hoja ASISTENCIA sin cambios en los datos."
 
-        # Dejar solo la hoja ASISTENCIA
-        for h in wb.sheetnames.copy():
-            if h != "ASISTENCIA":
-                del wb[h]
+            resultado.estado = {"huellas": huellas, "filas": filas, "bloques": bloques}
+            return resultado
 
+        # === Abrir la plantilla ===
+        # Solo se abre la hoja ASISTENCIA
+        wb = cargar_hoja(base, "ASISTENCIA")
         ws = wb["ASISTENCIA"]
+        filas = filas_asistencia(ws)
+        bloques = {e: bloque_asistencia(e, filas, totales[e]) for e in COLUMNAS_ENTRADA}
 
         # Colores
         rojo = PatternFill("solid", fgColor="FFC7CE")
@@ -97,80 +177,56 @@ def generar_asistencia(base, asc, nom, mindef):
         # ---------------------------------------------------------
         # Llenar cada fila
         # ---------------------------------------------------------
-        for r in range(2, ws.max_row + 1):
-            sede = str(ws[f"B{r}"].value or "").strip()
-            if not sede:
-                continue
+        with etapa("llenar_celdas", filas=ws.max_row - 1):
+            # ASC → E–H, NOM → I–L, MINDEF → M–P
+            for valores in bloques.values():
+                for celda, valor in valores.items():
+                    ws[celda].value = valor
+
+            for r, _ in filas:
+                avance(r - 1, ws.max_row - 1)
+
+                # ----------------------------------
+                #  TOTALES
+                # ----------------------------------
+
+                # Q = Total Postulantes (ASC + NOM + MINDEF)
+                ws[f"Q{r}"].value = f"=E{r}+I{r}+M{r}"
 
-            get = lambda d, k: d.get(sede, {}).get(k, 0)
-
-            # ----------------------------------
-            #  ASC  → columnas E, F, G, H
-            # ----------------------------------
-            ws[f"E{r}"].value = get(asc_d, "Postulantes")
-            ws[f"F{r}"].value = get(asc_d, "Asistencia al Local")
-            ws[f"G{r}"].value = get(asc_d, "Asistencia en Aula")
-            ws[f"H{r}"].value = get(asc_d, "Casos de inconsistencia")
-
-            # ----------------------------------
-            #  NOM → columnas I, J, K, L
-            # ----------------------------------
-            ws[f"I{r}"].value = get(nom_d, "Postulantes")
-            ws[f"J{r}"].value = get(nom_d, "Asistencia al Local")
-            ws[f"K{r}"].value = get(nom_d, "Asistencia en Aula")
-            ws[f"L{r}"].value = get(nom_d, "Casos de inconsistencia")
-
-            # ----------------------------------
-            #  MINDEF (opcional) → M, N, O, P
-            # ----------------------------------
-            ws[f"M{r}"].value = get(mindef_d, "Postulantes")
-            ws[f"N{r}"].value = get(mindef_d, "Asistencia al Local")
-            ws[f"O{r}"].value = get(mindef_d, "Asistencia en Aula")
-            ws[f"P{r}"].value = get(mindef_d, "Casos de inconsistencia")
-
-            # ----------------------------------
-            #  TOTALES
-            # ----------------------------------
-
-            # Q = Total Postulantes (ASC + NOM + MINDEF)
-            ws[f"Q{r}"].value = f"=E{r}+I{r}+M{r}"
-
-            # R = Total Local
-            ws[f"R{r}"].value = f"=F{r}+J{r}+N{r}"
-
-            # S = Total Aula
-            ws[f"S{r}"].value = f"=G{r}+K{r}+O{r}"
-
-            # T = Total Inconsistencias
-            ws[f"T{r}"].value = f"=H{r}+L{r}+P{r}"
-
-            # ----------------------------------
-            #  ESTADO (U)
-            # ----------------------------------
-            ws[f"U{r}"].value = f'=IF($D{r}=$T{r},"OK","ERR")'
+                # R = Total Local
+                ws[f"R{r}"].value = f"=F{r}+J{r}+N{r}"
+
+                # S = Total Aula
+                ws[f"S{r}"].value = f"=G{r}+K{r}+O{r}"
+
+                # T = Total Inconsistencias
+                ws[f"T{r}"].value = f"=H{r}+L{r}+P{r}"
+
+                # ----------------------------------
+                #  ESTADO (U)
+                # ----------------------------------
+                ws[f"U{r}"].value = f'=IF($D{r}=$T{r},"OK","ERR")'
 
         # ---------------------------------------------------------
         # FORMATO CONDICIONAL (U)
         # ---------------------------------------------------------
-        ws.conditional_formatting.add(
-            f"U2:U{ws.max_row}",
-            CellIsRule("equal", ['"ERR"'], fill=rojo)
-        )
-        ws.conditional_formatting.add(
-            f"U2:U{ws.max_row}",
-            CellIsRule("equal", ['"OK"'], fill=verde)
-        )
-
-        # Recalcular al abrir en Excel
-        habilitar_recalculo(wb)
-
-        # Salida
-        out = BytesIO()
-        wb.save(out)
-        out.seek(0)
-        st.session_state["asistencia_generada"] = out
-
-        st.success("✅ Hoja ASISTENCIA generada correctamente.")
+        with etapa("formato_condicional"):
+            ws.conditional_formatting.add(
+                f"U2:U{ws.max_row}",
+                CellIsRule("equal", ['"ERR"'], fill=rojo)
+            )
+            ws.conditional_formatting.add(
+                f"U2:U{ws.max_row}",
+                CellIsRule("equal", ['"OK"'], fill=verde)
+            )
+
+        # Salida (totales y estados ya calculados: Excel no recalcula al abrir)
+        resultado.contenido = guardar_con_valores(wb)
+
+        resultado.mensaje = "✅ Hoja ASISTENCIA generada correctamente."
+        resultado.estado = {"huellas": huellas, "filas": filas, "bloques": bloques}
 
     except Exception as e:
-        st.error(f"❌ Error al generar ASISTENCIA: {e}")
\ No newline at end of file
+        resultado.error = f"❌ Error al generar ASISTENCIA: {e}"
+
+    return resultado
\ No newline at end of file
@@ -0,0 +1,243 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from funciones_lectura import rebobinar
+from funciones_normalizar import SIN_ACENTOS
+from funciones_perfil import etapa
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:     # sin pyarrow no hay copia en disco
+    pa = None
+
+
+# ---------------------------------------------------------
+# Límite de memoria de la caché (bytes de DataFrames)
+# ---------------------------------------------------------
+LIMITE_CACHE_BYTES = 512 * 1024 * 1024
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+# ---------------------------------------------------------
+# Contenido y huella de un archivo (ruta, UploadedFile, BytesIO)
+# ---------------------------------------------------------
+def contenido_archivo(archivo):
+    if isinstance(archivo, (str, bytes)) or hasattr(archivo, "__fspath__"):
+        with open(archivo, "rb") as f:
+            return f.read()
+    if hasattr(archivo, "getvalue"):
+        return archivo.getvalue()
+    datos = rebobinar(archivo).read()
+    rebobinar(archivo)
+    return datos
+
+
+def huella_archivo(archivo):
+    # una ruta se lee por bloques: un CSV grande no se carga entero para la huella
+    if isinstance(archivo, (str, bytes)) or hasattr(archivo, "__fspath__"):
+        h = hashlib.sha256()
+        with open(archivo, "rb") as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(bloque)
+        return h.hexdigest()
+    return hashlib.sha256(contenido_archivo(archivo)).hexdigest()
+
+
+# ---------------------------------------------------------
+# Copia en disco (Arrow IPC) de cada entrada ya normalizada
+# ---------------------------------------------------------
+# Subir VERSION_DISCO cuando cambie lo que devuelve algún cargador,
+# para no reutilizar copias hechas con la versión anterior.
+# Límites (como en funciones_almacen), aplicados en cada escritura:
+#   PE_SPILL_MB         tamaño total de la carpeta (1024)
+#   PE_SPILL_TTL_HORAS  una copia sin uso se borra (8)
+# Al pasar la cuota se borran primero las menos usadas (LRU): leer una
+# copia renueva su fecha de modificación.
+VERSION_DISCO = 4
+CARPETA_DISCO = os.environ.get("PE_SPILL_DIR") or os.path.join(tempfile.gettempdir(), "pe_reportes_spill")
+CUOTA_DISCO = int(float(os.environ.get("PE_SPILL_MB", "1024")) * 1024 * 1024)
+TTL_DISCO = float(os.environ.get("PE_SPILL_TTL_HORAS", "8")) * 3600
+
+_disco_activo = pa is not None and os.environ.get("PE_SPILL", "1") != "0"
+
+
+def usar_disco(activo):
+    global _disco_activo
+    _disco_activo = bool(activo) and pa is not None
+
+
+def disco_activo():
+    return _disco_activo
+
+
+def _ruta_disco(clave):
+    tipo, huella = clave
+    if SIN_ACENTOS:
+        tipo += "-sin-acentos"  # las claves se normalizan al cargar
+    return os.path.join(CARPETA_DISCO, f"{tipo}-v{VERSION_DISCO}-{huella}.arrow")
+
+
+def _leer_arrow(ruta):
+    # memory map: las columnas numéricas no se copian al leer
+    with pa.memory_map(ruta) as origen:
+        return pa.ipc.open_file(origen).read_all().to_pandas()
+
+
+def _identicos(a, b):
+    return (
+        a.columns.equals(b.columns)
+        and a.index.equals(b.index)
+        and list(a.dtypes) == list(b.dtypes)
+        and a.equals(b)
+    )
+
+
+def _leer_disco(clave):
+    if not _disco_activo:
+        return None
+    ruta = _ruta_disco(clave)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        df = _leer_arrow(ruta)
+    except Exception:
+        return None     # copia dañada o de otra versión de pyarrow: se vuelve a leer el Excel
+    try:
+        os.utime(ruta)      # último uso, para el LRU y el TTL
+    except OSError:
+        pass
+    return df
+
+
+def _escribir_disco(clave, df):
+    """
+    Guarda df sin comprimir y lo relee para confirmar que vuelve igual
+    (columnas con tipos mezclados, p. ej. números y textos, no se guardan).
+    """
+    if not _disco_activo:
+        return
+    ruta = _ruta_disco(clave)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CARPETA_DISCO, exist_ok=True)
+        feather.write_feather(df, temporal, compression="uncompressed")
+        if _identicos(df, _leer_arrow(temporal)):
+            os.replace(temporal, ruta)
+    except Exception:
+        pass
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    depurar_disco(protegido=ruta)
+
+
+def _borrar_disco(ruta):
+    try:
+        os.remove(ruta)
+    except OSError:     # ya no está, o (Windows) otro proceso la tiene abierta
+        pass
+
+
+def depurar_disco(protegido=None, ahora=None, vaciar=False):
+    """
+    Aplica TTL y cuota a la carpeta de copias; con vaciar=True borra
+    todas las copias. Los .tmp solo se borran por TTL (pueden ser
+    escrituras en curso de otro proceso).
+    Devuelve cuántos archivos borró.
+    """
+    ahora = time.time() if ahora is None else ahora
+    try:
+        entradas = list(os.scandir(CARPETA_DISCO))
+    except FileNotFoundError:
+        return 0
+
+    borrados, vigentes = 0, []
+    for e in entradas:
+        try:
+            st = e.stat()
+        except FileNotFoundError:
+            continue
+        temporal = e.name.endswith(".tmp")
+        vencido = ahora - st.st_mtime > TTL_DISCO
+        if (vencido or (vaciar and not temporal)) and e.path != protegido:
+            _borrar_disco(e.path)
+            borrados += 1
+        elif not temporal:
+            vigentes.append((st.st_mtime, st.st_size, e.path))
+
+    total = sum(tam for _, tam, _ in vigentes)
+    for _, tam, ruta in sorted(vigentes):
+        if total <= CUOTA_DISCO:
+            break
+        if ruta != protegido:
+            _borrar_disco(ruta)
+            borrados += 1
+            total -= tam
+    return borrados
+
+
+def _tamano(df):
+    try:
+        return int(df.memory_usage(deep=True).sum())
+    except Exception:
+        return 0
+
+
+# ---------------------------------------------------------
+# Carga con caché LRU por (tipo de cargador, huella)
+# ---------------------------------------------------------
+def cargar_con_cache(archivo, tipo, cargador):
+    """
+    Devuelve cargador(archivo). Si el mismo contenido ya se cargó con
+    el mismo tipo de cargador, reutiliza el DataFrame sin leer el Excel:
+    primero de la memoria y, si no está, de la copia en disco (Arrow)
+    que dejó una corrida anterior (también de otro proceso).
+    Se entrega siempre una copia: los generadores modifican sus entradas.
+    """
+    with etapa(f"cargar {tipo}") as registro:
+        df, registro["cache"] = _cargar(archivo, tipo, cargador)
+        registro["filas"] = len(df)
+    return df
+
+
+def _cargar(archivo, tipo, cargador):
+    clave = (tipo, huella_archivo(archivo))
+
+    with _lock:
+        if clave in _cache:
+            _cache.move_to_end(clave)
+            return _cache[clave][0].copy(), "memoria"
+
+    origen = "disco"
+    df = _leer_disco(clave)
+    if df is None:
+        origen = "excel"
+        df = cargador(archivo)
+        _escribir_disco(clave, df)
+    tam = _tamano(df)
+
+    if tam <= LIMITE_CACHE_BYTES:
+        with _lock:
+            _cache[clave] = (df.copy(), tam)
+            _cache.move_to_end(clave)
+
+            total = sum(t for _, t in _cache.values())
+            while total > LIMITE_CACHE_BYTES and len(_cache) > 1:
+                _, (_, t) = _cache.popitem(last=False)
+                total -= t
+
+    return df, origen
+
+
+def limpiar_cache():
+    """Vacía la caché en memoria y borra las copias en disco (no los .tmp en curso)."""
+    with _lock:
+        _cache.clear()
+    depurar_disco(vaciar=True)
@@ -1,27 +1,22 @@
+import numpy as np
 import pandas as pd
-import streamlit as st
-from openpyxl import load_workbook
 from openpyxl.styles import Font
 from openpyxl.formatting.rule import CellIsRule
-from io import BytesIO
+
+from funciones_cache import cargar_con_cache
+from funciones_formulas import guardar_con_valores
+from funciones_lectura import (
+    detectar_encabezado, elegir_columnas, es_texto_delimitado, leer_excel, leer_texto_agregado,
+)
+from funciones_normalizar import clave, claves, limpiar, limpiar_serie
+from funciones_perfil import avance, etapa, perfilado
+from funciones_plantilla import cargar_hoja
+from funciones_resultado import ResultadoGeneracion
 
 
 # ---------------------------------------------------------
-# NORMALIZADOR
+# NÚMEROS
 # ---------------------------------------------------------
-def limpiar(s):
-    if pd.isna(s):
-        return ""
-    return (
-        str(s)
-        .replace("\xa0", " ")
-        .replace("\t", " ")
-        .replace("\n", " ")
-        .strip()
-        .upper()
-    )
-
-
 def _to_int(v):
     """Convierte valores a enteros sin romper."""
     try:
@@ -38,158 +33,236 @@ def _to_int(v):
             return 0
 
 
+def a_enteros(serie):
+    """
+    _to_int sobre toda la columna: una sola conversión numérica y
+    _to_int solo para el texto que pd.to_numeric no entiende.
+    """
+    numeros = pd.to_numeric(serie, errors="coerce")
+    raros = numeros.isna() & serie.notna()
+    if raros.any():
+        numeros = numeros.astype("float64")
+        numeros[raros] = serie[raros].map(_to_int)
+    numeros = numeros.replace([np.inf, -np.inf], 0).fillna(0)
+    return np.trunc(numeros).astype("int64")
+
+
 # ---------------------------------------------------------
 # DETECTAR ENCABEZADO PARA ASC – CAJAS – SEDE
 # ---------------------------------------------------------
-def detectar_fila_encabezados_cajas_sede(df_raw):
+def _es_fila_encabezados_cajas_sede(fila):
+    valores = {limpiar(v) for v in fila}
+
+    return (
+        "SEDE OPERATIVA" in valores
+        and "TIPO" in valores
+        and "TOTAL INVENTARIO IMPRENTA" in valores
+        and "INGRESO" in valores
+        and "SALIDA" in valores
+    )
 
-    for i in range(min(200, len(df_raw))):
-        fila = df_raw.iloc[i].astype(str).apply(limpiar)
-        valores = list(fila.values)
 
-        if (
-            "SEDE OPERATIVA" in valores
-            and "TIPO" in valores
-            and "TOTAL INVENTARIO IMPRENTA" in valores
-            and "INGRESO" in valores
-            and "SALIDA" in valores
-        ):
-            return i
+def detectar_fila_encabezados_cajas_sede(archivo_asc):
 
-    raise ValueError("No se encontró encabezado en ASC - CAJAS SEDE.")
+    fila, columnas = detectar_encabezado(
+        archivo_asc,
+        _es_fila_encabezados_cajas_sede,
+        sheet_name="Reporte",
+        max_filas=200
+    )
+    if fila is None:
+        raise ValueError("No se encontró encabezado en ASC - CAJAS SEDE.")
+    return fila, columnas
 
 
 # ---------------------------------------------------------
 # CARGAR ASC – CAJAS – SEDE
 # ---------------------------------------------------------
-def cargar_asc_cajas_sede(archivo_asc):
+OBLIGATORIAS = [
+    "SEDE OPERATIVA",
+    "TIPO",
+    "TOTAL INVENTARIO IMPRENTA",
+    "INGRESO",
+    "SALIDA",
+]
 
-    df_raw = pd.read_excel(archivo_asc, sheet_name="Reporte", header=None)
-    fila = detectar_fila_encabezados_cajas_sede(df_raw)
+# sede y tipo como texto; los totales pueden venir como texto y se
+# convierten con a_enteros
+TIPOS_COLUMNAS = {"SEDE OPERATIVA": str, "TIPO": str}
 
-    df = pd.read_excel(
-        archivo_asc,
-        sheet_name="Reporte",
-        header=fila
-    )
 
+def _normalizar_cajas_sede(df):
     df.columns = [limpiar(c) for c in df.columns]
 
-    obligatorias = [
-        "SEDE OPERATIVA",
-        "TIPO",
-        "TOTAL INVENTARIO IMPRENTA",
-        "INGRESO",
-        "SALIDA",
-    ]
-
-    faltan = [c for c in obligatorias if c not in df.columns]
+    faltan = [c for c in OBLIGATORIAS if c not in df.columns]
     if faltan:
         raise ValueError(f"Faltan columnas obligatorias en ASC - CAJAS SEDE: {faltan}")
 
-    df["SEDE OPERATIVA"] = df["SEDE OPERATIVA"].apply(limpiar)
-    df["TIPO"] = df["TIPO"].apply(limpiar)
+    df["SEDE OPERATIVA"] = claves(df["SEDE OPERATIVA"])
+    df["TIPO"] = limpiar_serie(df["TIPO"])
 
     return df
 
 
-# ---------------------------------------------------------
-# CLASIFICAR TIPO
-# ---------------------------------------------------------
-def clasificar_tipo(tipo):
-    t = limpiar(tipo)
-
-    if "APLIC" in t:
-        return "INSTRUMENTO"
+def _sumar_por_sede_tipo(df):
+    return df.groupby(["SEDE OPERATIVA", "TIPO"], sort=False, as_index=False).sum()
 
-    if "ADIC" in t:
-        return "ADICIONAL"
 
-    if "CAND" in t:
-        return "CANDADO"
+def _agregar_parte(df):
+    # totales enteros por (sede, tipo): generar_cajas_sede los clasifica y suma igual
+    df = _normalizar_cajas_sede(df)[OBLIGATORIAS]
+    for c in OBLIGATORIAS[2:]:
+        df[c] = a_enteros(df[c])
+    return _sumar_por_sede_tipo(df)
 
-    return None
 
+def cargar_asc_cajas_sede(archivo_asc):
 
-# ---------------------------------------------------------
-# GENERAR CAJAS-SEDE
-# ---------------------------------------------------------
-def generar_cajas_sede(ruta_plantilla_temp, archivo_asc_cajas_sede):
+    fila, columnas = detectar_fila_encabezados_cajas_sede(archivo_asc)
+    columnas, tipos = elegir_columnas(
+        columnas, {c: TIPOS_COLUMNAS.get(c) for c in OBLIGATORIAS}, limpiar
+    )
 
-    try:
-        with st.spinner("Generando hoja CAJAS-SEDE..."):
+    if es_texto_delimitado(archivo_asc):
+        return leer_texto_agregado(
+            archivo_asc, fila, _agregar_parte, _sumar_por_sede_tipo, columnas=columnas, dtype=tipos
+        )
 
-            # --- 1) Cargar ASC
-            df = cargar_asc_cajas_sede(archivo_asc_cajas_sede)
+    df = leer_excel(
+        archivo_asc,
+        sheet_name="Reporte",
+        header=fila,
+        columnas=columnas,
+        dtype=tipos
+    )
 
-            # --- 2) Agrupar por SEDE + TIPO
-            index = {}
+    return _normalizar_cajas_sede(df)
 
-            for _, row in df.iterrows():
-                tipo_cl = clasificar_tipo(row["TIPO"])
-                if not tipo_cl:
-                    continue
 
-                sede = row["SEDE OPERATIVA"]
+# ---------------------------------------------------------
+# CLASIFICAR TIPO (gana la primera regla que aparezca en el texto)
+# ---------------------------------------------------------
+REGLAS_TIPO = [
+    ("APLIC", "INSTRUMENTO"),
+    ("ADIC", "ADICIONAL"),
+    ("CAND", "CANDADO"),
+]
 
-                key = (sede, tipo_cl)
 
-                if key not in index:
-                    index[key] = {"T": 0, "I": 0, "S": 0}
+def clasificar_tipo(tipo):
+    t = limpiar(tipo)
 
-                index[key]["T"] += _to_int(row["TOTAL INVENTARIO IMPRENTA"])
-                index[key]["I"] += _to_int(row["INGRESO"])
-                index[key]["S"] += _to_int(row["SALIDA"])
+    for texto, categoria in REGLAS_TIPO:
+        if texto in t:
+            return categoria
 
-            # --- 3) Cargar plantilla
-            wb = load_workbook(ruta_plantilla_temp)
-            ws = wb["CAJAS-SEDE"]
+    return None
 
-            # Mapear encabezados fila 1
-            header_map = {}
-            for c in ws[1]:
-                if c.value:
-                    header_map[limpiar(c.value)] = c.column_letter
 
-            # Identificar columnas pero NO escribir en C, D, E
-            col_sede = header_map.get("SEDE")
+def clasificar_tipos(tipos):
+    """
+    clasificar_tipo sobre toda la columna (None donde no aplica). La
+    columna ya viene limpia (_normalizar_cajas_sede).
+    """
+    t = tipos.fillna("").astype(str)
+    return pd.Series(
+        np.select(
+            [t.str.contains(texto, regex=False) for texto, _ in REGLAS_TIPO],
+            [categoria for _, categoria in REGLAS_TIPO],
+            default=None,
+        ),
+        index=tipos.index,
+    )
 
-            # Columnas T (C, D, E) — NO SE MODIFICAN
-            # col_T_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN[T]"]
-            # col_T_ADIC = header_map["CAJA DE INSTRUMENTO ADICIONAL[T]"]
-            # col_T_CAND = header_map["CAJA DE CANDADO[T]"]
 
-            # Columnas I (estas SÍ se llenan)
-            col_I_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN-I"]
-            col_I_ADIC  = header_map["CAJA DE INSTRUMENTO ADICIONAL-I"]
-            col_I_CAND  = header_map["CAJA DE CANDADO-I"]
+def totales_por_sede_tipo(df):
+    """{(sede, tipo clasificado): {"T", "I", "S"}} sumando las tres columnas."""
+    tipos = clasificar_tipos(df["TIPO"])
+    hay = tipos.notna()
 
-            # Columnas I%
-            col_IP_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN-I[P]"]
-            col_IP_ADIC  = header_map["CAJA DE INSTRUMENTO ADICIONAL-I[P]"]
-            col_IP_CAND  = header_map["CAJA DE CANDADO-I[P]"]
+    valores = pd.DataFrame({
+        "SEDE OPERATIVA": df["SEDE OPERATIVA"][hay],
+        "TIPO": tipos[hay],
+        "T": a_enteros(df["TOTAL INVENTARIO IMPRENTA"][hay]),
+        "I": a_enteros(df["INGRESO"][hay]),
+        "S": a_enteros(df["SALIDA"][hay]),
+    })
+    totales = valores.groupby(["SEDE OPERATIVA", "TIPO"], sort=False)[["T", "I", "S"]].sum()
 
-            # Columnas S (se llenan)
-            col_S_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN-S"]
-            col_S_ADIC  = header_map["CAJA DE INSTRUMENTO ADICIONAL-S"]
-            col_S_CAND  = header_map["CAJA DE CANDADO-S"]
+    return {
+        clave: dict(zip("TIS", fila))
+        for clave, fila in zip(totales.index, totales.to_numpy().tolist())
+    }
 
-            # Columnas S%
-            col_SP_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN-S[P]"]
-            col_SP_ADIC  = header_map["CAJA DE INSTRUMENTO ADICIONAL-S[P]"]
-            col_SP_CAND  = header_map["CAJA DE CANDADO-S[P]"]
 
-            # Totales (debes calcularlos sin modificar C, D, E)
-            col_TOTAL_T = header_map["CAJAS[T]"]     # F
-            col_TOTAL_I = header_map["CAJAS-I[T]"]   # M
-            col_TOTAL_S = header_map["CAJAS-S[T]"]   # T
+# ---------------------------------------------------------
+# GENERAR CAJAS-SEDE
+# ---------------------------------------------------------
+@perfilado("CAJAS-SEDE")
+def generar_cajas_sede(ruta_plantilla_temp, archivo_asc_cajas_sede):
 
-            max_row = ws.max_row
+    resultado = ResultadoGeneracion("CAJAS-SEDE")
 
-            # --- 4) Procesar filas de la plantilla ---
+    try:
+        # --- 1) Cargar ASC
+        df = cargar_con_cache(archivo_asc_cajas_sede, "cajas-sede", cargar_asc_cajas_sede)
+
+        # --- 2) Agrupar por SEDE + TIPO
+        with etapa("agregar") as registro:
+            index = totales_por_sede_tipo(df)
+            registro["grupos"] = len(index)
+
+        # --- 3) Cargar plantilla
+        wb = cargar_hoja(ruta_plantilla_temp, "CAJAS-SEDE")
+        ws = wb["CAJAS-SEDE"]
+
+        # Mapear encabezados fila 1
+        header_map = {}
+        for c in ws[1]:
+            if c.value:
+                header_map[limpiar(c.value)] = c.column_letter
+
+        # Identificar columnas pero NO escribir en C, D, E
+        col_sede = header_map.get("SEDE")
+
+        # Columnas T (C, D, E) — NO SE MODIFICAN
+        # col_T_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN[T]"]
+        # col_T_ADIC = header_map["CAJA DE INSTRUMENTO ADICIONAL[T]"]
+        # col_T_CAND = header_map["CAJA DE CANDADO[T]"]
+
+        # Columnas I (estas SÍ se llenan)
+        col_I_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN-I"]
+        col_I_ADIC  = header_map["CAJA DE INSTRUMENTO ADICIONAL-I"]
+        col_I_CAND  = header_map["CAJA DE CANDADO-I"]
+
+        # Columnas I%
+        col_IP_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN-I[P]"]
+        col_IP_ADIC  = header_map["CAJA DE INSTRUMENTO ADICIONAL-I[P]"]
+        col_IP_CAND  = header_map["CAJA DE CANDADO-I[P]"]
+
+        # Columnas S (se llenan)
+        col_S_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN-S"]
+        col_S_ADIC  = header_map["CAJA DE INSTRUMENTO ADICIONAL-S"]
+        col_S_CAND  = header_map["CAJA DE CANDADO-S"]
+
+        # Columnas S%
+        col_SP_INSTR = header_map["CAJA DE INSTRUMENTO DE APLICACIÓN-S[P]"]
+        col_SP_ADIC  = header_map["CAJA DE INSTRUMENTO ADICIONAL-S[P]"]
+        col_SP_CAND  = header_map["CAJA DE CANDADO-S[P]"]
+
+        # Totales (debes calcularlos sin modificar C, D, E)
+        col_TOTAL_T = header_map["CAJAS[T]"]     # F
+        col_TOTAL_I = header_map["CAJAS-I[T]"]   # M
+        col_TOTAL_S = header_map["CAJAS-S[T]"]   # T
+
+        max_row = ws.max_row
+
+        # --- 4) Procesar filas de la plantilla ---
+        with etapa("llenar_celdas", filas=max_row - 1):
             for r in range(2, max_row + 1):
+                avance(r - 1, max_row - 1)
 
-                sede_pl = limpiar(ws[f"{col_sede}{r}"].value)
+                sede_pl = clave(ws[f"{col_sede}{r}"].value)
                 if not sede_pl:
                     continue
 
@@ -227,7 +300,8 @@ def generar_cajas_sede(ruta_plantilla_temp, archivo_asc_cajas_sede):
                 ws[f"{col_SP_ADIC}{r}"]  = f"=IF(D{r}=0,1,{col_S_ADIC}{r}/D{r})"
                 ws[f"{col_SP_CAND}{r}"]  = f"=IF(E{r}=0,1,{col_S_CAND}{r}/E{r})"
 
-            # --- 5) Formato condicional para porcentajes ---
+        # --- 5) Formato condicional para porcentajes ---
+        with etapa("formato_condicional"):
             for nombre, letra in header_map.items():
                 if "[P]" in nombre:
                     rango = f"{letra}2:{letra}{max_row}"
@@ -238,19 +312,12 @@ def generar_cajas_sede(ruta_plantilla_temp, archivo_asc_cajas_sede):
                     )
                     ws.conditional_formatting.add(rango, regla)
 
-            # --- 6) Guardar SOLO esta hoja ---
-            for hoja in wb.sheetnames:
-                if hoja != "CAJAS-SEDE":
-                    del wb[hoja]
-
-            out = BytesIO()
-            wb.save(out)
-            out.seek(0)
-
-            st.session_state["cajas_sede_generada"] = out
-
-        st.success("Hoja CAJAS-SEDE generada correctamente ✔")
+        # --- 6) Guardar SOLO esta hoja (cargar_hoja abrió solo CAJAS-SEDE) ---
+        resultado.contenido = guardar_con_valores(wb)
+        resultado.mensaje = "Hoja CAJAS-SEDE generada correctamente ✔"
 
     except Exception as e:
-        st.error(f"Error al generar CAJAS-SEDE: {e}")
+        resultado.error = f"Error al generar CAJAS-SEDE: {e}"
+
+    return resultado
 
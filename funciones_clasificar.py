@@ -0,0 +1,70 @@
+import os
+
+
+# ========================
+# CLASIFICADOR (CORREGIDO)
+# ========================
+def clasificar_archivos(lista):
+    """
+    Asigna cada archivo (UploadedFile, BytesIO con .name o ruta) a su
+    entrada según el nombre; las reglas son las mismas para .xlsx y
+    para .csv/.tsv (ver funciones_lectura.EXTENSIONES_TEXTO).
+    """
+    res = {
+        "asc": None,
+        "nom": None,
+        "asc_mindef": None,
+        "asc_inst": None,
+        "nom_inst": None,
+        "asc_fa": None,
+        "mindef_inst": None,
+        "asc_personal": None,
+        "asc_cajas_sede": None,
+    }
+
+    for f in lista:
+        # Solo el nombre del archivo: la carpeta no debe influir
+        nombre = os.path.basename(getattr(f, "name", None) or str(f)).upper().replace(" ", "")
+
+        # 1) PERSONAL
+        if "PERSONAL" in nombre and "ASC" in nombre:
+            res["asc_personal"] = f
+            continue
+
+        # 2) CAJAS - SEDE
+        if "CAJAS" in nombre and "SEDE" in nombre and "ASC" in nombre:
+            res["asc_cajas_sede"] = f
+            continue
+
+        # 3) MINDEF – POSTULANTES
+        if "MINDEF" in nombre and "POSTULANTE" in nombre:
+            res["asc_mindef"] = f
+            continue
+
+        # 4) POSTULANTES (ASC / NOM)
+        if "POSTULANTE" in nombre:
+            if "ASC" in nombre:
+                res["asc"] = f
+            elif "NOM" in nombre:
+                res["nom"] = f
+            continue
+
+        # 5) MINDEF – INSTRUMENTOS
+        if "MINDEF" in nombre and ("INSTRUMENTO" in nombre or "INSTRUMENTOS" in nombre):
+            res["mindef_inst"] = f
+            continue
+
+        # 6) INSTRUMENTOS (ASC / NOM)
+        if "INSTRUMENTO" in nombre or "INSTRUMENTOS" in nombre:
+            if "ASC" in nombre:
+                res["asc_inst"] = f
+            elif "NOM" in nombre:
+                res["nom_inst"] = f
+            continue
+
+        # 7) ASC – FA
+        if "FA" in nombre and "ASC" in nombre:
+            res["asc_fa"] = f
+            continue
+
+    return res
\ No newline at end of file
@@ -0,0 +1,742 @@
+import posixpath
+import re
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from copy import copy, deepcopy
+from io import BytesIO
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl import load_workbook
+from openpyxl.worksheet.cell_range import CellRange
+
+from funciones_formulas import guardar_con_valores
+from funciones_perfil import etapa
+from funciones_plantilla import cargar_hoja, hojas_plantilla
+
+
+NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+NS_CT = "http://schemas.openxmlformats.org/package/2006/content-types"
+
+REL_HOJA = NS_R + "/worksheet"
+REL_ESTILOS = NS_R + "/styles"
+REL_TEMA = NS_R + "/theme"
+REL_TABLA = NS_R + "/table"
+REL_SHARED_STRINGS = NS_R + "/sharedStrings"
+
+CT_HOJA = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+CT_TABLA = "application/vnd.openxmlformats-officedocument.spreadsheetml.table+xml"
+CT_ESTILOS = "application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"
+CT_TEMA = "application/vnd.openxmlformats-officedocument.theme+xml"
+CT_LIBRO = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"
+CT_CORE = "application/vnd.openxmlformats-package.core-properties+xml"
+CT_APP = "application/vnd.openxmlformats-officedocument.extended-properties+xml"
+
+ET.register_namespace("", NS)
+ET.register_namespace("r", NS_R)
+
+
+def _q(tag):
+    return f"{{{NS}}}{tag}"
+
+
+# ========================
+# COPIAR HOJA COMPLETA (modo "celdas")
+# ========================
+def copiar_hoja_completa(ws_src, ws_dest):
+
+    for row in ws_src.iter_rows():
+        for cell in row:
+            new_cell = ws_dest.cell(row=cell.row, column=cell.col_idx, value=cell.value)
+
+            if cell.has_style:
+                new_cell.font = copy(cell.font)
+                new_cell.border = copy(cell.border)
+                new_cell.fill = copy(cell.fill)
+                new_cell.number_format = copy(cell.number_format)
+                new_cell.alignment = copy(cell.alignment)
+
+    for merged in ws_src.merged_cells.ranges:
+        ws_dest.merge_cells(str(merged))
+
+    for col, dim in ws_src.column_dimensions.items():
+        ws_dest.column_dimensions[col].width = dim.width
+
+    for r, dim in ws_src.row_dimensions.items():
+        ws_dest.row_dimensions[r].height = dim.height
+
+    try:
+        if getattr(ws_src, "conditional_formatting", None):
+            ws_dest.conditional_formatting = deepcopy(ws_src.conditional_formatting)
+    except Exception:
+        pass
+
+
+def _combinar_por_celdas(plantilla, reportes):
+
+    wb_final = load_workbook(plantilla)
+
+    hojas_protegidas = ["DIC"]
+    for hoja in wb_final.sheetnames[:]:
+        if hoja not in hojas_protegidas:
+            del wb_final[hoja]
+
+    for nombre, archivo_bytes in reportes.items():
+        if not archivo_bytes:
+            continue
+
+        with etapa(f"copiar_celdas {nombre}") as registro:
+            wb_src = load_workbook(archivo_bytes)
+            ws_src = wb_src.active
+
+            ws_new = wb_final.create_sheet(nombre)
+            copiar_hoja_completa(ws_src, ws_new)
+            registro["celdas"] = len(ws_src._cells)
+
+    if "DIC" in wb_final.sheetnames:
+        dic = wb_final["DIC"]
+        wb_final._sheets.remove(dic)
+        wb_final._sheets.insert(0, dic)
+
+    try:
+        wb_final.calculation_properties.fullCalcOnLoad = True
+    except:
+        pass
+
+    with etapa("guardar_xlsx"):
+        out = BytesIO()
+        wb_final.save(out)
+    out.seek(0)
+    return out
+
+
+# ========================
+# LECTURA DE UN PAQUETE XLSX DE UNA HOJA
+# ========================
+class _PaqueteNoSoportado(Exception):
+    """El libro tiene partes que el modo "paquete" no sabe trasladar."""
+
+
+def _leer_rels(z, ruta):
+    if ruta not in z.namelist():
+        return []
+    raiz = ET.fromstring(z.read(ruta))
+    return [
+        (r.get("Id"), r.get("Type"), r.get("Target"), r.get("TargetMode"))
+        for r in raiz.findall(f"{{{NS_REL}}}Relationship")
+    ]
+
+
+def _resolver(base_dir, destino):
+    if destino.startswith("/"):
+        return destino.lstrip("/")
+    return posixpath.normpath(posixpath.join(base_dir, destino))
+
+
+def _rels_de(ruta):
+    carpeta, nombre = posixpath.split(ruta)
+    return posixpath.join(carpeta, "_rels", nombre + ".rels")
+
+
+def _leer_paquete(datos):
+    """
+    Devuelve las partes necesarias de un libro de una sola hoja
+    (como los que generan las funciones generar_*).
+    """
+    if hasattr(datos, "getvalue"):
+        datos = datos.getvalue()
+    elif isinstance(datos, str):
+        with open(datos, "rb") as f:
+            datos = f.read()
+    z = zipfile.ZipFile(BytesIO(datos))
+
+    libro = ET.fromstring(z.read("xl/workbook.xml"))
+    rels_libro = {rid: (tipo, destino) for rid, tipo, destino, _ in _leer_rels(z, "xl/_rels/workbook.xml.rels")}
+
+    hojas = libro.findall(f"{_q('sheets')}/{_q('sheet')}")
+    if len(hojas) != 1:
+        raise _PaqueteNoSoportado("se esperaba un libro de una sola hoja")
+
+    ruta_hoja = _resolver("xl", rels_libro[hojas[0].get(f"{{{NS_R}}}id")][1])
+
+    ruta_estilos = ruta_tema = None
+    for tipo, destino in rels_libro.values():
+        if tipo == REL_SHARED_STRINGS:
+            raise _PaqueteNoSoportado("el libro usa sharedStrings")
+        if tipo == REL_ESTILOS:
+            ruta_estilos = _resolver("xl", destino)
+        elif tipo == REL_TEMA:
+            ruta_tema = _resolver("xl", destino)
+
+    tablas = []
+    for rid, tipo, destino, modo in _leer_rels(z, _rels_de(ruta_hoja)):
+        if tipo != REL_TABLA or modo == "External":
+            raise _PaqueteNoSoportado(f"relación no soportada: {tipo}")
+        tablas.append((rid, z.read(_resolver(posixpath.dirname(ruta_hoja), destino))))
+
+    nombres = z.namelist()
+    return {
+        "libro": libro,
+        "hoja": z.read(ruta_hoja),
+        "tablas": tablas,
+        "estilos": z.read(ruta_estilos) if ruta_estilos else None,
+        "tema": z.read(ruta_tema) if ruta_tema else None,
+        "core": z.read("docProps/core.xml") if "docProps/core.xml" in nombres else None,
+        "app": z.read("docProps/app.xml") if "docProps/app.xml" in nombres else None,
+    }
+
+
+# ========================
+# FUSIÓN DE ESTILOS
+# ========================
+class _EstilosCombinados:
+    """
+    Une los styles.xml de varios libros. Cada fuente, borde, relleno,
+    xf y dxf idéntico se guarda una sola vez; incorporar() devuelve las
+    tablas de traducción de índices viejos → nuevos.
+    """
+
+    def __init__(self):
+        self.formatos = {}
+        self.listas = {k: ([], {}) for k in ("fonts", "fills", "borders", "cellStyleXfs", "cellXfs", "dxfs")}
+        self.cell_styles = {}
+        self.table_styles = {}
+        self.table_styles_attrs = None
+        self.colors = None
+
+    def _agregar(self, seccion, elem):
+        lista, indice = self.listas[seccion]
+        clave = ET.tostring(elem)
+        if clave not in indice:
+            indice[clave] = len(lista)
+            lista.append(elem)
+        return indice[clave]
+
+    def _hijos(self, raiz, seccion):
+        nodo = raiz.find(_q(seccion))
+        return list(nodo) if nodo is not None else []
+
+    def incorporar(self, xml):
+        raiz = ET.fromstring(xml)
+
+        mapa_fmt = {}
+        for nf in self._hijos(raiz, "numFmts"):
+            codigo = nf.get("formatCode")
+            if codigo not in self.formatos:
+                self.formatos[codigo] = 164 + len(self.formatos)
+            mapa_fmt[nf.get("numFmtId")] = str(self.formatos[codigo])
+
+        mapas = {
+            "fontId": [self._agregar("fonts", e) for e in self._hijos(raiz, "fonts")],
+            "fillId": [self._agregar("fills", e) for e in self._hijos(raiz, "fills")],
+            "borderId": [self._agregar("borders", e) for e in self._hijos(raiz, "borders")],
+        }
+
+        def traducir_xf(xf, mapa_xf=None):
+            xf = deepcopy(xf)
+            for attr, mapa in mapas.items():
+                if xf.get(attr) is not None:
+                    xf.set(attr, str(mapa[int(xf.get(attr))]))
+            if xf.get("numFmtId") in mapa_fmt:
+                xf.set("numFmtId", mapa_fmt[xf.get("numFmtId")])
+            if mapa_xf is not None and xf.get("xfId") is not None:
+                xf.set("xfId", str(mapa_xf[int(xf.get("xfId"))]))
+            return xf
+
+        mapa_style_xf = [self._agregar("cellStyleXfs", traducir_xf(e)) for e in self._hijos(raiz, "cellStyleXfs")]
+        mapa_xf = [self._agregar("cellXfs", traducir_xf(e, mapa_style_xf)) for e in self._hijos(raiz, "cellXfs")]
+
+        mapa_dxf = []
+        for dxf in self._hijos(raiz, "dxfs"):
+            dxf = deepcopy(dxf)
+            nf = dxf.find(_q("numFmt"))
+            if nf is not None and nf.get("numFmtId") in mapa_fmt:
+                nf.set("numFmtId", mapa_fmt[nf.get("numFmtId")])
+            mapa_dxf.append(self._agregar("dxfs", dxf))
+
+        for cs in self._hijos(raiz, "cellStyles"):
+            if cs.get("name") not in self.cell_styles:
+                cs = deepcopy(cs)
+                cs.set("xfId", str(mapa_style_xf[int(cs.get("xfId"))]))
+                self.cell_styles[cs.get("name")] = cs
+
+        nodo_ts = raiz.find(_q("tableStyles"))
+        if nodo_ts is not None:
+            if self.table_styles_attrs is None:
+                self.table_styles_attrs = {k: v for k, v in nodo_ts.attrib.items() if k != "count"}
+            for ts in nodo_ts:
+                if ts.get("name") not in self.table_styles:
+                    ts = deepcopy(ts)
+                    for el in ts:
+                        if el.get("dxfId") is not None:
+                            el.set("dxfId", str(mapa_dxf[int(el.get("dxfId"))]))
+                    self.table_styles[ts.get("name")] = ts
+
+        if self.colors is None:
+            self.colors = raiz.find(_q("colors"))
+
+        return mapa_xf, mapa_dxf
+
+    def xml(self):
+        raiz = ET.Element(_q("styleSheet"))
+
+        def seccion(tag, hijos, **attrs):
+            nodo = ET.SubElement(raiz, _q(tag), count=str(len(hijos)), **attrs)
+            nodo.extend(hijos)
+
+        if self.formatos:
+            seccion("numFmts", [
+                ET.Element(_q("numFmt"), numFmtId=str(i), formatCode=codigo)
+                for codigo, i in self.formatos.items()
+            ])
+        for tag in ("fonts", "fills", "borders", "cellStyleXfs", "cellXfs"):
+            seccion(tag, self.listas[tag][0])
+        seccion("cellStyles", list(self.cell_styles.values()))
+        seccion("dxfs", self.listas["dxfs"][0])
+        seccion("tableStyles", list(self.table_styles.values()), **(self.table_styles_attrs or {}))
+        if self.colors is not None:
+            raiz.append(self.colors)
+
+        return ET.tostring(raiz, xml_declaration=True, encoding="UTF-8")
+
+
+# ========================
+# REESCRITURA DE ÍNDICES EN EL XML DE LA HOJA
+# ========================
+_RE_ESTILO_CELDA = re.compile(rb'(<(?:c|row)\b[^>]*?\ss=")(\d+)(")')
+_RE_ESTILO_COL = re.compile(rb'(<col\b[^>]*?\sstyle=")(\d+)(")')
+_RE_DXF = re.compile(rb'(\s\w*[dD]xfId=")(\d+)(")')
+_RE_TAB_SELECTED = re.compile(rb'\stabSelected="(?:1|true)"')
+
+
+def _traducir(patron, xml, mapa):
+    if all(i == n for i, n in enumerate(mapa)):
+        return xml
+    tabla = [str(n).encode() for n in mapa]
+    return patron.sub(lambda m: m.group(1) + tabla[int(m.group(2))] + m.group(3), xml)
+
+
+def _nombres_definidos(libro, posicion, vistos):
+    """
+    <definedName> de un libro de una sola hoja, con localSheetId
+    apuntando a `posicion` en el combinado. Un nombre global que ya
+    trajo otra parte se omite (Excel no admite dos iguales).
+    """
+    nombres = []
+    for dn in libro.findall(f"{_q('definedNames')}/{_q('definedName')}"):
+        attrs = dict(dn.attrib)
+        if "localSheetId" in attrs:
+            if attrs["localSheetId"] != "0":
+                continue
+            attrs["localSheetId"] = str(posicion)
+        elif attrs.get("name") in vistos:
+            continue
+        else:
+            vistos.add(attrs.get("name"))
+        atributos = "".join(f" {k}={quoteattr(v)}" for k, v in attrs.items())
+        nombres.append(f"<definedName{atributos}>{escape(dn.text or '')}</definedName>")
+    return nombres
+
+
+def _pide_recalculo(libro):
+    calc = libro.find(_q("calcPr"))
+    return calc is not None and calc.get("fullCalcOnLoad") in ("1", "true")
+
+
+_dic = {}
+
+
+def _paquete_dic(plantilla):
+    """
+    La hoja DIC de la plantilla, guardada una vez por proceso con
+    openpyxl (textos en línea, sin sharedStrings) para poder trasladarla.
+    """
+    if plantilla not in _dic:
+        _dic[plantilla] = _leer_paquete(guardar_con_valores(cargar_hoja(plantilla, "DIC")))
+    return _dic[plantilla]
+
+
+def _combinar_por_paquete(plantilla, reportes):
+
+    with etapa("leer_paquetes") as registro:
+        partes = []
+        if "DIC" in hojas_plantilla(plantilla):
+            partes.append(("DIC", _paquete_dic(plantilla)))
+        for nombre, archivo_bytes in reportes.items():
+            if archivo_bytes:
+                partes.append((nombre, _leer_paquete(archivo_bytes)))
+        registro["hojas"] = len(partes)
+
+    if not partes:
+        raise _PaqueteNoSoportado("no hay hojas para combinar")
+
+    estilos = _EstilosCombinados()
+    salida = {}
+    hojas_xml = []
+    nombres_xml = []
+    nombres_globales = set()
+    content_types = []
+    nombres_tabla = set()
+    n_tabla = 0
+
+    with etapa("trasladar_hojas") as registro:
+        for i, (nombre, p) in enumerate(partes, start=1):
+            mapa_xf, mapa_dxf = estilos.incorporar(p["estilos"]) if p["estilos"] else ([], [])
+
+            hoja = p["hoja"]
+            hoja = _traducir(_RE_ESTILO_CELDA, hoja, mapa_xf)
+            hoja = _traducir(_RE_ESTILO_COL, hoja, mapa_xf)
+            hoja = _traducir(_RE_DXF, hoja, mapa_dxf)
+            hoja = _RE_TAB_SELECTED.sub(b"", hoja)
+
+            ruta_hoja = f"xl/worksheets/sheet{i}.xml"
+            salida[ruta_hoja] = hoja
+            content_types.append((ruta_hoja, CT_HOJA))
+
+            rels = []
+            for rid, tabla in p["tablas"]:
+                n_tabla += 1
+                raiz_t = ET.fromstring(tabla)
+                raiz_t.set("id", str(n_tabla))
+                nombre_t = raiz_t.get("name")
+                if nombre_t in nombres_tabla:
+                    nombre_t = f"{nombre_t}_{n_tabla}"
+                    raiz_t.set("name", nombre_t)
+                    raiz_t.set("displayName", nombre_t)
+                nombres_tabla.add(nombre_t)
+
+                tabla = _traducir(_RE_DXF, ET.tostring(raiz_t, xml_declaration=True, encoding="UTF-8"), mapa_dxf)
+                ruta_tabla = f"xl/tables/table{n_tabla}.xml"
+                salida[ruta_tabla] = tabla
+                content_types.append((ruta_tabla, CT_TABLA))
+                rels.append(f'<Relationship Id="{rid}" Type="{REL_TABLA}" Target="/{ruta_tabla}"/>')
+
+            if rels:
+                salida[_rels_de(ruta_hoja)] = (
+                    f'<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="{NS_REL}">'
+                    + "".join(rels) + "</Relationships>"
+                ).encode()
+
+            hojas_xml.append(f'<sheet name={quoteattr(nombre)} sheetId="{i}" r:id="rId{i}"/>')
+            nombres_xml += _nombres_definidos(p["libro"], i - 1, nombres_globales)
+        registro["tablas"] = n_tabla
+
+    primero = partes[0][1]
+    n = len(partes)
+
+    # Libro: mismas vistas que la primera parte, con la primera hoja de
+    # reporte activa (como quedaba el combinado celda por celda).
+    libro = primero["libro"]
+    vista = libro.find(f"{_q('bookViews')}/{_q('workbookView')}")
+    atributos_vista = ""
+    if vista is not None:
+        attrs = dict(vista.attrib)
+        attrs["firstSheet"] = "0"
+        attrs["activeTab"] = str(min(1, n - 1))
+        atributos_vista = "".join(f' {k}="{v}"' for k, v in attrs.items())
+    calc = libro.find(_q("calcPr"))
+    calc_id = calc.get("calcId", "191029") if calc is not None else "191029"
+
+    # Recálculo completo al abrir solo si alguna hoja lo pide (fórmulas
+    # sin valor en caché); las de generar_* ya traen sus resultados.
+    recalcular = ""
+    if any(_pide_recalculo(p["libro"]) for _, p in partes):
+        recalcular = ' fullCalcOnLoad="1"'
+
+    # áreas de impresión y rangos con nombre de cada hoja
+    definidos = f"<definedNames>{''.join(nombres_xml)}</definedNames>" if nombres_xml else ""
+
+    salida["xl/workbook.xml"] = (
+        f'<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="{NS}" xmlns:r="{NS_R}">'
+        f"<workbookPr/><bookViews><workbookView{atributos_vista}/></bookViews>"
+        f"<sheets>{''.join(hojas_xml)}</sheets>{definidos}"
+        f'<calcPr calcId="{calc_id}"{recalcular}/></workbook>'
+    ).encode()
+
+    rels_libro = [
+        f'<Relationship Id="rId{i}" Type="{REL_HOJA}" Target="/xl/worksheets/sheet{i}.xml"/>'
+        for i in range(1, n + 1)
+    ]
+    rels_libro.append(f'<Relationship Id="rId{n + 1}" Type="{REL_ESTILOS}" Target="styles.xml"/>')
+    salida["xl/styles.xml"] = estilos.xml()
+    content_types.append(("xl/styles.xml", CT_ESTILOS))
+
+    if primero["tema"]:
+        rels_libro.append(f'<Relationship Id="rId{n + 2}" Type="{REL_TEMA}" Target="theme/theme1.xml"/>')
+        salida["xl/theme/theme1.xml"] = primero["tema"]
+        content_types.append(("xl/theme/theme1.xml", CT_TEMA))
+
+    salida["xl/_rels/workbook.xml.rels"] = (
+        f'<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="{NS_REL}">'
+        + "".join(rels_libro) + "</Relationships>"
+    ).encode()
+
+    rels_raiz = [
+        f'<Relationship Id="rId1" Type="{NS_R}/officeDocument" Target="xl/workbook.xml"/>'
+    ]
+    content_types.append(("xl/workbook.xml", CT_LIBRO))
+    if primero["core"]:
+        salida["docProps/core.xml"] = primero["core"]
+        content_types.append(("docProps/core.xml", CT_CORE))
+        rels_raiz.append(
+            '<Relationship Id="rId2" Target="docProps/core.xml" '
+            'Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties"/>'
+        )
+    if primero["app"]:
+        salida["docProps/app.xml"] = primero["app"]
+        content_types.append(("docProps/app.xml", CT_APP))
+        rels_raiz.append(f'<Relationship Id="rId3" Type="{NS_R}/extended-properties" Target="docProps/app.xml"/>')
+
+    salida["_rels/.rels"] = (
+        f'<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="{NS_REL}">'
+        + "".join(rels_raiz) + "</Relationships>"
+    ).encode()
+
+    salida["[Content_Types].xml"] = (
+        f'<?xml version="1.0" encoding="UTF-8"?><Types xmlns="{NS_CT}">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        + "".join(f'<Override PartName="/{ruta}" ContentType="{ct}"/>' for ruta, ct in content_types)
+        + "</Types>"
+    ).encode()
+
+    with etapa("escribir_zip") as registro:
+        out = BytesIO()
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("[Content_Types].xml", salida.pop("[Content_Types].xml"))
+            for ruta, datos in salida.items():
+                z.writestr(ruta, datos)
+        registro["bytes"] = out.tell()
+    out.seek(0)
+    return out
+
+
+# ========================
+# COMBINAR REPORTES
+# ========================
+def combinar_reportes(plantilla, asistencia=None, op1=None,
+                      personal=None, cajas_sede=None, modo="paquete"):
+    """
+    Arma el Reporte Final: DIC primero y luego cada hoja generada.
+
+    modo="paquete" traslada el XML de cada hoja (con sus estilos,
+    tablas y formatos condicionales) sin crear objetos por celda.
+    modo="celdas" copia celda por celda con openpyxl; se usa también
+    como respaldo si algún libro trae partes que no se pueden trasladar.
+    """
+    reportes = {
+        "ASISTENCIA": asistencia,
+        "OP1": op1,
+        "PERSONAL": personal,
+        "CAJAS-SEDE": cajas_sede
+    }
+
+    if modo == "paquete":
+        try:
+            return _combinar_por_paquete(plantilla, reportes)
+        except _PaqueteNoSoportado:
+            pass
+
+    return _combinar_por_celdas(plantilla, reportes)
+
+
+# ========================
+# COMPACTACIÓN DEL XLSX
+# ========================
+_RE_BLOQUE_CF = re.compile(rb"<conditionalFormatting\b([^>]*)>(.*?)</conditionalFormatting>", re.S)
+_RE_CF_RULE = re.compile(rb"<cfRule\b[^>]*/>|<cfRule\b.*?</cfRule>", re.S)
+_RE_SQREF = re.compile(rb'\s*sqref="([^"]*)"\s*')
+_RE_PRIORIDAD = re.compile(rb'\spriority="(\d+)"')
+_RE_FORMULA = re.compile(rb"<formula>(.*?)</formula>", re.S)
+_RE_TEXTO_FORMULA = re.compile(rb'"[^"]*"|&quot;.*?&quot;')
+_RE_REF_FORMULA = re.compile(rb"\$?[A-Za-z]{1,3}\$?\d+")
+
+_RE_TIPO_NUMERO = re.compile(rb'(<c\b[^>]*?) t="n"')   # "n" es el tipo por defecto
+
+_PARTE_HOJA = re.compile(r"xl/worksheets/[^/]+\.xml$")
+_PARTE_TABLA = re.compile(r"xl/tables/[^/]+\.xml$")
+
+
+def _clave_regla(regla):
+    """
+    Clave para unir reglas iguales, o None si la regla depende de la
+    posición o del rango completo (fórmulas con referencias, top10,
+    escalas de color, …) y no se puede extender a otros rangos.
+    """
+    if b'type="cellIs"' not in regla or b"<extLst" in regla:
+        return None
+    for formula in _RE_FORMULA.findall(regla):
+        if _RE_REF_FORMULA.search(_RE_TEXTO_FORMULA.sub(b"", formula)):
+            return None
+    return _RE_PRIORIDAD.sub(b"", regla)
+
+
+def _se_superponen(a, b):
+    return any(not ra.isdisjoint(rb_) for ra in a for rb_ in b)
+
+
+def _compactar_formatos(hoja):
+    """
+    Une las reglas de formato condicional idénticas (mismo tipo,
+    operador, fórmula y dxf) en una sola regla con varios rangos y quita
+    las repetidas. Un grupo solo se une si en las celdas donde se cruza
+    con otras reglas se mantiene qué regla tiene prioridad.
+    Devuelve (hoja, reglas antes, reglas después).
+    """
+    bloques = list(_RE_BLOQUE_CF.finditer(hoja))
+    n_reglas = sum(len(_RE_CF_RULE.findall(b.group(2))) for b in bloques)
+    if len(bloques) < 2 or any(
+        hoja[a.end():b.start()].strip() for a, b in zip(bloques, bloques[1:])
+    ):
+        return hoja, n_reglas, n_reglas
+
+    # unidades: (prioridad, clave, sqref, rangos, xml); sqref None = bloque intacto
+    unidades = []
+    try:
+        for b in bloques:
+            reglas = _RE_CF_RULE.findall(b.group(2))
+            sqref = _RE_SQREF.fullmatch(b.group(1))
+            prioridades = [int(m.group(1)) for r in reglas for m in [_RE_PRIORIDAD.search(r)] if m]
+            if sqref is None or len(prioridades) != len(reglas):
+                rangos = [CellRange(r) for r in re.findall(r'sqref="([^"]*)"', b.group(1).decode())[0].split()]
+                unidades.append((min(prioridades or [0]), None, None, rangos, b.group(0)))
+                continue
+            rangos = [CellRange(r) for r in sqref.group(1).decode().split()]
+            for regla, prioridad in zip(reglas, prioridades):
+                unidades.append((prioridad, _clave_regla(regla), sqref.group(1), rangos, regla))
+    except (ValueError, IndexError):
+        return hoja, n_reglas, n_reglas
+
+    # agrupar por clave; las no unibles quedan solas
+    grupos, por_clave = [], {}
+    for u in unidades:
+        if u[1] is None:
+            grupos.append([u])
+        elif u[1] in por_clave:
+            por_clave[u[1]].append(u)
+        else:
+            por_clave[u[1]] = [u]
+            grupos.append(por_clave[u[1]])
+
+    # separar los grupos que cambiarían el orden de reglas superpuestas
+    cambio = True
+    while cambio:
+        cambio = False
+        for i, ga in enumerate(grupos):
+            for gb in grupos[i + 1:]:
+                pa, pb = min(u[0] for u in ga), min(u[0] for u in gb)
+                if any(
+                    (ua[0] < ub[0]) != (pa < pb) and _se_superponen(ua[3], ub[3])
+                    for ua in ga for ub in gb
+                ):
+                    partir = ga if len(ga) > 1 else gb
+                    grupos.remove(partir)
+                    grupos.extend([u] for u in partir)
+                    cambio = True
+                    break
+            if cambio:
+                break
+
+    # armar los bloques, en orden de prioridad
+    salida = []
+    for grupo in sorted(grupos, key=lambda g: min(u[0] for u in g)):
+        if grupo[0][2] is None:
+            salida.append((None, grupo[0][4]))
+            continue
+        refs = []
+        for u in grupo:
+            for ref in u[2].split():
+                if ref not in refs:
+                    refs.append(ref)
+        regla = _RE_PRIORIDAD.sub(b' priority="%d"' % min(u[0] for u in grupo), grupo[0][4], count=1)
+        if salida and salida[-1][0] == refs:
+            salida[-1][1].append(regla)
+        else:
+            salida.append((refs, [regla]))
+
+    xml = b"".join(
+        bloque if refs is None
+        else b'<conditionalFormatting sqref="%s">%s</conditionalFormatting>' % (b" ".join(refs), b"".join(bloque))
+        for refs, bloque in salida
+    )
+    n_final = sum(1 if refs is None else len(bloque) for refs, bloque in salida)
+    return hoja[:bloques[0].start()] + xml + hoja[bloques[-1].end():], n_reglas, n_final
+
+
+def _mejor_nivel(contenido):
+    """
+    Nivel de deflate que deja la parte más chica. El 9 no siempre gana:
+    en hojas muy repetitivas (p. ej. ASISTENCIA) comprime peor que el 6.
+    """
+    if len(contenido) < 4096:
+        return 9
+
+    def tamano(nivel):
+        c = zlib.compressobj(nivel, zlib.DEFLATED, -15)
+        return len(c.compress(contenido) + c.flush())
+
+    return min((9, 6), key=tamano)
+
+
+def compactar_xlsx(datos):
+    """
+    Etapa final sobre el xlsx ya armado: une reglas de formato condicional
+    iguales, deduplica estilos (fuentes, rellenos, bordes, xf y dxf),
+    omite el t="n" por defecto de las celdas, quita el calcChain y comprime cada parte con el nivel que más reduce.
+    Devuelve (bytes, informe) con los tamaños y reglas antes/después.
+    """
+    if hasattr(datos, "getvalue"):
+        datos = datos.getvalue()
+
+    with zipfile.ZipFile(BytesIO(datos)) as z:
+        partes = {info.filename: z.read(info.filename) for info in z.infolist()}
+
+    informe = {"bytes_antes": len(datos), "reglas_antes": 0, "reglas_despues": 0}
+
+    # calcChain (si quedó alguno) con su relación y su tipo de contenido
+    if partes.pop("xl/calcChain.xml", None) is not None:
+        if "xl/_rels/workbook.xml.rels" in partes:
+            partes["xl/_rels/workbook.xml.rels"] = re.sub(
+                rb'<Relationship\b[^>]*calcChain[^>]*/>', b"", partes["xl/_rels/workbook.xml.rels"]
+            )
+        partes["[Content_Types].xml"] = re.sub(
+            rb'<Override\b[^>]*calcChain[^>]*/>', b"", partes["[Content_Types].xml"]
+        )
+
+    # estilos repetidos → un solo índice (styles.xml con extLst se deja igual)
+    estilos = partes.get("xl/styles.xml")
+    if estilos is not None and b"<extLst" not in estilos:
+        combinados = _EstilosCombinados()
+        mapa_xf, mapa_dxf = combinados.incorporar(estilos)
+        partes["xl/styles.xml"] = combinados.xml()
+        for ruta in partes:
+            if _PARTE_HOJA.match(ruta):
+                hoja = _traducir(_RE_ESTILO_CELDA, partes[ruta], mapa_xf)
+                hoja = _traducir(_RE_ESTILO_COL, hoja, mapa_xf)
+                partes[ruta] = _traducir(_RE_DXF, hoja, mapa_dxf)
+            elif _PARTE_TABLA.match(ruta):
+                partes[ruta] = _traducir(_RE_DXF, partes[ruta], mapa_dxf)
+
+    for ruta in partes:
+        if _PARTE_HOJA.match(ruta):
+            partes[ruta], antes, despues = _compactar_formatos(_RE_TIPO_NUMERO.sub(rb"\1", partes[ruta]))
+            informe["reglas_antes"] += antes
+            informe["reglas_despues"] += despues
+
+    out = BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        for ruta, contenido in partes.items():
+            z.writestr(ruta, contenido, compresslevel=_mejor_nivel(contenido))
+
+    informe["bytes_despues"] = len(out.getvalue())
+    return out.getvalue(), informe
+
+
+def describir_compactacion(informe):
+    kb = lambda n: f"{n / 1024:,.0f} KB"
+    return (
+        f"{kb(informe['bytes_antes'])} → {kb(informe['bytes_despues'])}, "
+        f"formato condicional: {informe['reglas_antes']} → {informe['reglas_despues']} reglas"
+    )
\ No newline at end of file
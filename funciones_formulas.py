@@ -0,0 +1,563 @@
+import math
+import numbers
+import re
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape, unescape
+
+from openpyxl.compat import safe_string
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter
+
+from funciones_perfil import etapa
+
+
+# ============================================================
+# EVALUADOR DE FÓRMULAS SIMPLES
+# (referencias de la misma hoja, + - * / ^ &, comparaciones,
+#  IF, MOD, AND, OR, NOT, ABS). Lo demás se deja a Excel.
+# ============================================================
+
+class _NoEvaluable(Exception):
+    """La fórmula usa algo fuera del subconjunto o da un error de Excel."""
+
+
+_RE_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<num>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+      | (?P<str>"(?:[^"]|"")*")
+      | (?P<ref>\$?[A-Za-z]{1,3}\$?\d+)(?![\w(!])
+      | (?P<bool>TRUE|FALSE)(?![\w(])
+      | (?P<fn>[A-Za-z][A-Za-z0-9.]*)\s*\(
+      | (?P<op><>|<=|>=|[-+*/^&=<>(),%])
+    )\s*""", re.X | re.I)
+
+
+def _tokens(formula):
+    pos, tokens = 0, []
+    while pos < len(formula):
+        m = _RE_TOKEN.match(formula, pos)
+        if not m or m.end() == pos:
+            raise _NoEvaluable(formula)
+        pos = m.end()
+        tokens.append((m.lastgroup, m.group(m.lastgroup)))
+    return tokens
+
+
+class _Parser:
+    """Descenso recursivo con la precedencia de Excel; devuelve un árbol de tuplas."""
+
+    def __init__(self, formula):
+        self.tokens = _tokens(formula)
+        self.i = 0
+
+    def _ver(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def _op(self, *ops):
+        tipo, valor = self._ver()
+        if tipo == "op" and valor in ops:
+            self.i += 1
+            return valor
+        return None
+
+    def _esperar(self, op):
+        if not self._op(op):
+            raise _NoEvaluable(f"se esperaba {op}")
+
+    def arbol(self):
+        nodo = self._comparacion()
+        if self.i != len(self.tokens):
+            raise _NoEvaluable("sobran símbolos")
+        return nodo
+
+    def _binario(self, siguiente, *ops):
+        nodo = siguiente()
+        while True:
+            op = self._op(*ops)
+            if op is None:
+                return nodo
+            nodo = ("op", op, nodo, siguiente())
+
+    def _comparacion(self):
+        return self._binario(self._concatenacion, "=", "<>", "<", ">", "<=", ">=")
+
+    def _concatenacion(self):
+        return self._binario(self._suma, "&")
+
+    def _suma(self):
+        return self._binario(self._producto, "+", "-")
+
+    def _producto(self):
+        return self._binario(self._potencia, "*", "/")
+
+    def _potencia(self):
+        return self._binario(self._unario, "^")
+
+    def _unario(self):
+        op = self._op("-", "+")
+        if op:
+            nodo = self._unario()
+            return ("neg", nodo) if op == "-" else nodo
+        nodo = self._primario()
+        while self._op("%"):
+            nodo = ("op", "/", nodo, ("val", 100))
+        return nodo
+
+    def _primario(self):
+        tipo, valor = self._ver()
+        self.i += 1
+        if tipo == "num":
+            numero = float(valor)
+            return ("val", int(numero) if numero.is_integer() and "." not in valor else numero)
+        if tipo == "str":
+            return ("val", valor[1:-1].replace('""', '"'))
+        if tipo == "bool":
+            return ("val", valor.upper() == "TRUE")
+        if tipo == "ref":
+            return ("ref", coordinate_to_tuple(valor.replace("$", "")))
+        if tipo == "fn":
+            args = []
+            if not self._op(")"):
+                args.append(self._comparacion())
+                while self._op(","):
+                    args.append(self._comparacion())
+                self._esperar(")")
+            return ("fn", valor.upper(), args)
+        if tipo == "op" and valor == "(":
+            nodo = self._comparacion()
+            self._esperar(")")
+            return nodo
+        raise _NoEvaluable(f"símbolo inesperado {valor}")
+
+
+# ---------------------------------------------------------
+# Conversión de valores al estilo de Excel
+# ---------------------------------------------------------
+def _numero(v):
+    if v is None:
+        return 0
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, numbers.Real):
+        if not math.isfinite(v):
+            raise _NoEvaluable("número no finito")
+        return v
+    if isinstance(v, str):
+        try:
+            return float(v)
+        except ValueError:
+            raise _NoEvaluable("#VALUE!")
+    raise _NoEvaluable(f"tipo no soportado {type(v).__name__}")
+
+
+def _logico(v):
+    if isinstance(v, str):
+        if v.upper() in ("TRUE", "FALSE"):
+            return v.upper() == "TRUE"
+        raise _NoEvaluable("#VALUE!")
+    return _numero(v) != 0
+
+
+def _texto(v):
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _rango(v):
+    """Orden de tipos de Excel al comparar: números < textos < lógicos."""
+    if isinstance(v, bool):
+        return 2
+    if isinstance(v, str):
+        return 1
+    return 0
+
+
+def _comparar(op, a, b):
+    # una celda vacía se compara como 0, "" o FALSE según el otro lado
+    if a is None:
+        a = "" if isinstance(b, str) else (False if isinstance(b, bool) else 0)
+    if b is None:
+        b = "" if isinstance(a, str) else (False if isinstance(a, bool) else 0)
+
+    if _rango(a) != _rango(b):
+        a, b = _rango(a), _rango(b)
+    elif isinstance(a, str):
+        a, b = a.lower(), b.lower()
+    else:
+        a, b = _numero(a), _numero(b)
+
+    return bool({
+        "=": a == b, "<>": a != b,
+        "<": a < b, ">": a > b,
+        "<=": a <= b, ">=": a >= b,
+    }[op])
+
+
+def _dividir(a, b):
+    if b == 0:
+        raise _NoEvaluable("#DIV/0!")
+    return a / b
+
+
+_ARITMETICA = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": _dividir,
+    "^": lambda a, b: a ** b,
+}
+
+
+def _mod(a, b):
+    if b == 0:
+        raise _NoEvaluable("#DIV/0!")
+    return a - b * math.floor(a / b)
+
+
+# ---------------------------------------------------------
+# Evaluación de una hoja
+# ---------------------------------------------------------
+class _Hoja:
+
+    def __init__(self, celdas):
+        self.celdas = celdas    # {(fila, columna): celda}, como ws._cells
+        self.valores = {}
+        self.en_curso = set()
+
+    def valor(self, pos):
+        celda = self.celdas.get(pos)
+        if celda is None:
+            return None
+        v = celda.value
+        if celda.data_type != "f":
+            return v
+        if not isinstance(v, str):
+            raise _NoEvaluable("fórmula matricial")
+        if pos in self.valores:
+            return self.valores[pos]
+        if pos in self.en_curso:
+            raise _NoEvaluable("referencia circular")
+
+        self.en_curso.add(pos)
+        try:
+            resultado = self.evaluar(_Parser(v[1:]).arbol())
+        finally:
+            self.en_curso.discard(pos)
+        self.valores[pos] = resultado
+        return resultado
+
+    def evaluar(self, nodo):
+        tipo = nodo[0]
+        if tipo == "val":
+            return nodo[1]
+        if tipo == "ref":
+            return self.valor(nodo[1])
+        if tipo == "neg":
+            return -_numero(self.evaluar(nodo[1]))
+        if tipo == "op":
+            _, op, a, b = nodo
+            a, b = self.evaluar(a), self.evaluar(b)
+            if op in _ARITMETICA:
+                return _ARITMETICA[op](_numero(a), _numero(b))
+            if op == "&":
+                return _texto(a) + _texto(b)
+            return _comparar(op, a, b)
+
+        _, nombre, args = nodo
+        if nombre == "IF" and len(args) in (2, 3):
+            if _logico(self.evaluar(args[0])):
+                return self.evaluar(args[1])
+            return self.evaluar(args[2]) if len(args) == 3 else False
+        if nombre == "MOD" and len(args) == 2:
+            return _mod(_numero(self.evaluar(args[0])), _numero(self.evaluar(args[1])))
+        if nombre == "AND" and args:
+            return all([_logico(self.evaluar(a)) for a in args])
+        if nombre == "OR" and args:
+            return any([_logico(self.evaluar(a)) for a in args])
+        if nombre == "NOT" and len(args) == 1:
+            return not _logico(self.evaluar(args[0]))
+        if nombre == "ABS" and len(args) == 1:
+            return abs(_numero(self.evaluar(args[0])))
+        raise _NoEvaluable(f"función no soportada {nombre}")
+
+
+def calcular_formulas(ws):
+    """
+    Evalúa las fórmulas de la hoja. Devuelve ({coordenada: valor}, completo),
+    donde completo indica que se pudieron evaluar todas.
+    """
+    hoja = _Hoja(ws._cells)
+    valores = {}
+    completo = True
+
+    for pos, celda in list(hoja.celdas.items()):
+        if celda.data_type != "f":
+            continue
+        try:
+            valor = hoja.valor(pos)
+            if isinstance(valor, float) and not math.isfinite(valor):
+                raise _NoEvaluable("número no finito")
+            valores[celda.coordinate] = valor
+        except (_NoEvaluable, ArithmeticError, TypeError):
+            completo = False
+
+    return valores, completo
+
+
+# ============================================================
+# ESCRIBIR LOS VALORES EN CACHÉ EN EL XML DE LA HOJA
+# ============================================================
+
+# celda con fórmula tal como la escribe openpyxl: <c r=".." ..><f>..</f><v /></c>
+_RE_CELDA_FORMULA = re.compile(rb'<c r="([A-Z]+[0-9]+)"([^>]*)>(<f>[^<]*</f>)<v\s*/></c>')
+
+
+def _cache_xml(valor):
+    """(atributo t, contenido de <v>) para el valor calculado."""
+    if valor is None:
+        # =AH2 con AH2 vacía: Excel la muestra como 0
+        return "", "0"
+    if isinstance(valor, bool):
+        return ' t="b"', "1" if valor else "0"
+    if isinstance(valor, str):
+        return ' t="str"', escape(valor)
+    if isinstance(valor, float) and valor.is_integer() and abs(valor) < 1e15:
+        return "", str(int(valor))
+    if isinstance(valor, float):
+        return "", repr(valor)
+    return "", str(int(valor))
+
+
+def incrustar_valores(contenido, valores_por_hoja):
+    """
+    Reescribe las hojas indicadas ({ruta xml: {coordenada: valor}})
+    para que cada fórmula lleve su resultado como valor en caché.
+    """
+    def sustituir(valores):
+        def reemplazo(m):
+            coord = m.group(1).decode()
+            if coord not in valores:
+                return m.group(0)
+            t, v = _cache_xml(valores[coord])
+            return b'<c r="%s"%s%s>%s<v>%s</v></c>' % (
+                m.group(1), m.group(2), t.encode(), m.group(3), v.encode("utf-8")
+            )
+        return reemplazo
+
+    out = BytesIO()
+    with zipfile.ZipFile(BytesIO(contenido)) as origen, \
+            zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as destino:
+        for info in origen.infolist():
+            datos = origen.read(info.filename)
+            if valores_por_hoja.get(info.filename):
+                datos = _RE_CELDA_FORMULA.sub(sustituir(valores_por_hoja[info.filename]), datos)
+            destino.writestr(info, datos)
+    return out.getvalue()
+
+
+def guardar_con_valores(wb):
+    """
+    Guarda el libro con el resultado de cada fórmula como valor en caché.
+    Si todas se pudieron evaluar no se fuerza el recálculo completo al
+    abrir (Excel muestra los valores y recalcula solo lo que se edite);
+    si alguna no, se mantiene fullCalcOnLoad como antes.
+    """
+    with etapa("calcular_formulas") as registro:
+        calculos = [(ws, *calcular_formulas(ws)) for ws in wb.worksheets]
+        completo = all(c for _, _, c in calculos)
+        registro["formulas"] = sum(len(valores) for _, valores, _ in calculos)
+    wb.calculation.fullCalcOnLoad = None if completo else True
+
+    with etapa("guardar_xlsx") as registro:
+        out = BytesIO()
+        wb.save(out)
+        registro["celdas"] = sum(len(ws._cells) for ws in wb.worksheets)
+
+    with etapa("incrustar_valores") as registro:
+        contenido = incrustar_valores(
+            out.getvalue(),
+            {ws.path.lstrip("/"): valores for ws, valores, _ in calculos},
+        )
+        registro["bytes"] = len(contenido)
+    return contenido
+
+
+# ============================================================
+# CAMBIAR CELDAS EN EL XML DE UNA HOJA YA GUARDADA
+# ============================================================
+# Para la regeneración incremental: se reescriben solo las celdas con
+# datos nuevos y el valor en caché de las fórmulas que dependen de
+# ellas, sin abrir el libro con openpyxl ni evaluar las demás fórmulas.
+
+# <c r=".." s=".." t="..">contenido</c> o <c r=".." s=".." />
+_RE_CELDA = re.compile(rb'<c r="([A-Z]+[0-9]+)"((?:\s+[\w:]+="[^"]*")*)\s*(?:/>|>(.*?)</c>)', re.S)
+_RE_INICIO_CELDA = re.compile(rb"<c\b")
+_RE_TIPO = re.compile(rb'\st="([^"]*)"')
+_RE_ESTILO = re.compile(rb'\ss="\d+"')
+_RE_CONTENIDO = re.compile(rb"(<f>[^<]*</f>)?(?:<v>([^<]*)</v>|<v\s*/>)?")
+_RE_TEXTO = re.compile(rb"<t\b[^>]*>([^<]*)</t>|<t\b[^>]*/>")
+# referencias de una fórmula, sin los textos entre comillas (de más no
+# importa: una fórmula que no se puede evaluar queda sin valor igual)
+_RE_TEXTO_FORMULA = re.compile(rb'"[^"]*"')
+_RE_REFERENCIA = re.compile(rb"\$?([A-Za-z]{1,3})\$?(\d+)(?![\w(!])")
+
+
+class _NoSoportado(Exception):
+    """La hoja tiene algo que no se sabe reescribir en el xml."""
+
+
+class _CeldaXml:
+    """Lo que el evaluador lee de una celda (como una celda de openpyxl)."""
+
+    def __init__(self, coordinate, value, data_type):
+        self.coordinate = coordinate
+        self.value = value
+        self.data_type = data_type
+
+
+def _numero_xml(texto):
+    # como openpyxl al leer: entero salvo que tenga punto o exponente
+    return float(texto) if any(c in texto for c in ".eE") else int(texto)
+
+
+def _leer_celda(m):
+    """(fórmula o None, valor) de una coincidencia de _RE_CELDA; el valor de una fórmula es su caché."""
+    atributos, contenido = m.group(2), m.group(3) or b""
+    tipo = _RE_TIPO.search(atributos)
+    tipo = tipo.group(1) if tipo else b"n"
+
+    if tipo == b"inlineStr":
+        return None, unescape(b"".join(_RE_TEXTO.findall(contenido)).decode("utf-8"))
+
+    partes = _RE_CONTENIDO.fullmatch(contenido)
+    if partes is None or tipo not in (b"n", b"b", b"str", b"e"):
+        raise _NoSoportado(m.group(1).decode())     # sharedStrings, fórmula matricial, …
+    formula, v = partes.groups()
+    if formula is not None:
+        formula = "=" + unescape(formula[3:-4].decode("utf-8"), {"&quot;": '"'})
+        if tipo == b"e":
+            v = None
+    if v == b"" and tipo in (b"n", b"b"):
+        v = None
+    if v is not None:
+        v = unescape(v.decode("utf-8"))
+        if tipo == b"b":
+            v = v == "1"
+        elif tipo == b"n":
+            v = _numero_xml(v)
+    return formula, v
+
+
+class _CeldasXml:
+    """
+    Celdas de la hoja para el evaluador ({(fila, columna): celda}, como
+    ws._cells), leídas del xml solo cuando se piden. Las fórmulas que no
+    dependen de los cambios se ven como su valor en caché.
+    """
+
+    def __init__(self, coincidencias, dependientes, cambios):
+        self.coincidencias = coincidencias
+        self.dependientes = dependientes
+        self.cambios = cambios
+
+    def get(self, pos):
+        coord = f"{get_column_letter(pos[1])}{pos[0]}"
+        if coord in self.cambios:
+            return _CeldaXml(coord, self.cambios[coord], "n")
+        m = self.coincidencias.get(coord)
+        if m is None:
+            return None
+        formula, valor = _leer_celda(m)
+        if formula is not None and (coord in self.dependientes or valor is None):
+            return _CeldaXml(coord, formula, "f")
+        return _CeldaXml(coord, valor, "n")
+
+
+def _xml_valor(coord, atributos, valor):
+    """<c> con un valor como lo escribe openpyxl."""
+    estilo = _RE_ESTILO.search(atributos)
+    inicio = b'<c r="%s"%s' % (coord.encode(), estilo.group(0) if estilo else b"")
+    if valor is None:
+        return inicio + b" />"
+    if isinstance(valor, bool):
+        return inicio + b' t="b"><v>%d</v></c>' % valor
+    if isinstance(valor, numbers.Real):
+        return inicio + b' t="n"><v>%s</v></c>' % safe_string(valor).encode()
+    if isinstance(valor, str) and not valor.startswith("="):
+        espacio = b' xml:space="preserve"' if valor != valor.strip() else b""
+        return inicio + b' t="inlineStr"><is><t%s>%s</t></is></c>' % (espacio, escape(valor).encode("utf-8"))
+    raise _NoSoportado(coord)
+
+
+def actualizar_hoja_xml(hoja, cambios):
+    """
+    Escribe `cambios` ({coordenada: valor}) en el xml de una hoja guardada
+    con openpyxl y recalcula el valor en caché de las fórmulas que
+    dependen de esas celdas; el resto del xml queda igual. Devuelve
+    (xml, completo, reescritas) —completo: toda fórmula tiene su valor—
+    o None si la hoja tiene algo que no se sabe reescribir.
+    """
+    coincidencias = {m.group(1).decode(): m for m in _RE_CELDA.finditer(hoja)}
+    if (
+        len(coincidencias) != len(_RE_INICIO_CELDA.findall(hoja))
+        or b"<f " in hoja                   # fórmulas compartidas o matriciales
+        or not cambios.keys() <= coincidencias.keys()
+    ):
+        return None
+
+    # quién usa cada celda, y las fórmulas que dependen de los cambios
+    usan, sin_valor = {}, set()
+    for coord, m in coincidencias.items():
+        contenido = m.group(3)
+        if not contenido or not contenido.startswith(b"<f>"):
+            continue
+        if not contenido.endswith(b"</v>") or (contenido.endswith(b"<v></v>") and b' t="str"' not in m.group(2)):
+            sin_valor.add(coord)
+        formula = _RE_TEXTO_FORMULA.sub(b"", contenido[3:contenido.index(b"</f>")])
+        for columna, fila in _RE_REFERENCIA.findall(formula):
+            usan.setdefault(columna.upper().decode() + fila.decode(), []).append(coord)
+
+    dependientes, pendientes = set(), list(cambios)
+    while pendientes:
+        for coord in usan.get(pendientes.pop(), ()):
+            if coord not in dependientes and coord not in cambios:
+                dependientes.add(coord)
+                pendientes.append(coord)
+
+    try:
+        nuevas = {coord: _xml_valor(coord, coincidencias[coord].group(2), v) for coord, v in cambios.items()}
+        evaluador = _Hoja(_CeldasXml(coincidencias, dependientes, cambios))
+        completo = not (sin_valor - dependientes - cambios.keys())
+
+        # por filas: una fórmula suele usar las de filas anteriores
+        for coord in sorted(dependientes, key=coordinate_to_tuple):
+            m = coincidencias[coord]
+            atributos = _RE_TIPO.sub(b"", m.group(2))
+            formula = _RE_CONTENIDO.fullmatch(m.group(3)).group(1)
+            try:
+                valor = evaluador.valor(coordinate_to_tuple(coord))
+                if isinstance(valor, float) and not math.isfinite(valor):
+                    raise _NoEvaluable("número no finito")
+            except (_NoEvaluable, ArithmeticError, TypeError):
+                completo = False
+                nuevas[coord] = b'<c r="%s"%s>%s<v /></c>' % (m.group(1), atributos, formula)
+                continue
+            t, v = _cache_xml(valor)
+            nuevas[coord] = b'<c r="%s"%s%s>%s<v>%s</v></c>' % (
+                m.group(1), atributos, t.encode(), formula, v.encode("utf-8")
+            )
+    except _NoSoportado:
+        return None
+
+    partes, desde = [], 0
+    for coord in sorted(nuevas, key=lambda c: coincidencias[c].start()):
+        m = coincidencias[coord]
+        partes += [hoja[desde:m.start()], nuevas[coord]]
+        desde = m.end()
+    partes.append(hoja[desde:])
+    return b"".join(partes), completo, len(nuevas)
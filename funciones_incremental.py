@@ -0,0 +1,148 @@
+import re
+import zipfile
+from io import BytesIO
+
+from funciones_cache import huella_archivo
+from funciones_formulas import actualizar_hoja_xml, guardar_con_valores
+from funciones_perfil import etapa
+from funciones_plantilla import _RE_SHEET, _atributo, _rels, cargar_hoja
+
+
+# ---------------------------------------------------------
+# Regeneración incremental (OP1, ASISTENCIA)
+# ---------------------------------------------------------
+# Cada generar_* con varias entradas deja en ResultadoGeneracion.estado:
+#   huellas: {entrada: sha256} y la de la plantilla
+#   filas:   las claves (sede, local, …) de cada fila de la hoja
+#   bloques: {entrada: {celda: valor}} — los totales de cada archivo
+#            ya ubicados en sus columnas (p. ej. U–V de NOM en OP1)
+# Si se vuelve a generar pasando ese resultado como `anterior`, solo
+# se leen los archivos cuya huella cambió, se recalculan sus bloques y
+# se escriben sobre el xml del xlsx anterior las celdas que cambiaron
+# (y el valor en caché de las fórmulas que dependen de ellas).
+# ---------------------------------------------------------
+
+def huellas_entradas(base, archivos):
+    """{entrada: huella} (None si no hay archivo) más la de la plantilla."""
+    huellas = {k: huella_archivo(v) if v else None for k, v in archivos.items()}
+    huellas["plantilla"] = huella_archivo(base)
+    return huellas
+
+
+def estado_previo(anterior, huellas):
+    """
+    Estado del resultado anterior si sirve de punto de partida:
+    generado sin error, con la misma plantilla y las mismas entradas.
+    """
+    if anterior is None or not anterior.ok or not anterior.estado:
+        return None
+    estado = anterior.estado
+    if estado["huellas"].keys() != huellas.keys():
+        return None
+    if estado["huellas"]["plantilla"] != huellas["plantilla"]:
+        return None
+    return estado
+
+
+def entradas_cambiadas(previo, huellas):
+    """
+    Entradas a recalcular. Una huella anterior None (archivo ausente o
+    no válido) se recalcula siempre: así vuelve a salir su aviso.
+    """
+    entradas = [k for k in huellas if k != "plantilla"]
+    if previo is None:
+        return entradas
+    return [
+        k for k in entradas
+        if previo["huellas"][k] is None or previo["huellas"][k] != huellas[k]
+    ]
+
+
+def _igual(a, b):
+    # 0 y 0.0 se escriben distinto en el xlsx
+    return type(a) is type(b) and a == b
+
+
+def celdas_cambiadas(nuevos, anteriores):
+    """{celda: valor} de `nuevos` que no coinciden con `anteriores`."""
+    return {
+        celda: valor for celda, valor in nuevos.items()
+        if celda not in anteriores or not _igual(valor, anteriores[celda])
+    }
+
+
+def cambios_en_bloques(previo, bloques, cambiadas):
+    """Celdas de los bloques recalculados que difieren de la vez anterior."""
+    cambios = {}
+    for entrada in cambiadas:
+        cambios.update(celdas_cambiadas(bloques[entrada], previo["bloques"].get(entrada, {})))
+    return cambios
+
+
+_RE_CALC_PR = re.compile(rb"<calcPr\b[^>]*>")
+
+
+def _ruta_hoja(z, hoja):
+    libro = z.read("xl/workbook.xml").decode("utf-8")
+    _, rels = _rels(z, "xl/workbook.xml")
+    destino_de = {rid: destino for rid, _, destino in rels}
+    for tag in _RE_SHEET.findall(libro):
+        if _atributo(tag, "name") == hoja:
+            return destino_de.get(_atributo(tag, "r:id"))
+    return None
+
+
+def _calculo_al_abrir(libro, completo):
+    """workbook.xml con fullCalcOnLoad solo si falta algún valor en caché."""
+    m = _RE_CALC_PR.search(libro)
+    if m is None:
+        return libro if completo else None
+    calc = re.sub(rb'\sfullCalcOnLoad="[^"]*"', b"", m.group(0))
+    if not completo:
+        calc = calc.replace(b"<calcPr", b'<calcPr fullCalcOnLoad="1"', 1)
+    return libro[:m.start()] + calc + libro[m.end():]
+
+
+def _reescribir_hoja(contenido, hoja, cambios, registro):
+    """El xlsx con `cambios` escritos en el xml de la hoja, o None si no se pudo."""
+    with zipfile.ZipFile(BytesIO(contenido)) as z:
+        ruta = _ruta_hoja(z, hoja)
+        parche = actualizar_hoja_xml(z.read(ruta), cambios) if ruta in z.namelist() else None
+        if parche is None:
+            return None
+        xml, completo, registro["reescritas"] = parche
+        libro = _calculo_al_abrir(z.read("xl/workbook.xml"), completo)
+        if libro is None:
+            return None
+
+        out = BytesIO()
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as destino:
+            for info in z.infolist():
+                if info.filename == ruta:
+                    destino.writestr(info, xml)
+                elif info.filename == "xl/workbook.xml":
+                    destino.writestr(info, libro)
+                else:
+                    destino.writestr(info, z.read(info.filename))
+    return out.getvalue()
+
+
+def aplicar_cambios(anterior, hoja, cambios):
+    """
+    Bytes del xlsx anterior (no la plantilla) con `cambios` escritos.
+    No se abre el libro: se reescriben en el xml solo esas celdas y las
+    fórmulas que dependen de ellas. Si la hoja tiene algo que no se sabe
+    reescribir (sharedStrings, fórmulas compartidas, una celda que no
+    existe), se abre con openpyxl y se guarda completa como antes.
+    """
+    with etapa("actualizar_celdas", celdas=len(cambios)) as registro:
+        contenido = _reescribir_hoja(anterior.contenido, hoja, cambios, registro)
+    if contenido is not None:
+        return contenido
+
+    wb = cargar_hoja(anterior.contenido, hoja)
+    ws = wb[hoja]
+    with etapa("actualizar_celdas", celdas=len(cambios)):
+        for celda, valor in cambios.items():
+            ws[celda] = valor
+    return guardar_con_valores(wb)
@@ -0,0 +1,371 @@
+import codecs
+import csv
+import importlib.util
+import io
+import os
+import re
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from funciones_perfil import etapa
+
+
+# ---------------------------------------------------------
+# Rebobinar archivos subidos (UploadedFile / BytesIO)
+# ---------------------------------------------------------
+def rebobinar(archivo):
+    if hasattr(archivo, "seek"):
+        archivo.seek(0)
+    return archivo
+
+
+# ---------------------------------------------------------
+# Nombres de columna como los genera pd.read_excel(header=n)
+# ---------------------------------------------------------
+def _nombres_columnas(valores):
+    valores = list(valores)
+    while valores and valores[-1] in (None, ""):
+        valores.pop()
+
+    nombres = []
+    for i, v in enumerate(valores):
+        if v is None or v == "":
+            nombres.append(f"Unnamed: {i}")
+        elif isinstance(v, float) and v.is_integer():
+            nombres.append(int(v))
+        else:
+            nombres.append(v)
+
+    # Duplicados → "X", "X.1", "X.2" ... (misma regla que pandas)
+    cuenta = {}
+    columnas = []
+    for n in nombres:
+        k = cuenta.get(n, 0)
+        while k > 0:
+            cuenta[n] = k + 1
+            n = f"{n}.{k}"
+            k = cuenta.get(n, 0)
+        cuenta[n] = k + 1
+        columnas.append(n)
+
+    return columnas
+
+
+# ---------------------------------------------------------
+# Lector de Excel: el más rápido que esté instalado
+# (calamine, nativo) y openpyxl como respaldo. Ambos entregan
+# los mismos DataFrames; PE_LECTOR_EXCEL=openpyxl fuerza uno.
+# ---------------------------------------------------------
+LECTORES = {
+    "calamine": "python_calamine",
+    "openpyxl": "openpyxl",
+}
+
+_lector = None
+
+
+def lectores_disponibles():
+    return [n for n, modulo in LECTORES.items() if importlib.util.find_spec(modulo) is not None]
+
+
+def usar_lector(nombre=None):
+    """Fija el lector (None = automático) y devuelve el que estaba fijado."""
+    global _lector
+    if nombre is not None and nombre not in lectores_disponibles():
+        raise ValueError(f"❌ El lector de Excel {nombre} no está instalado.")
+    anterior, _lector = _lector, nombre
+    return anterior
+
+
+def lector_excel():
+    disponibles = lectores_disponibles()
+    pedido = _lector or os.environ.get("PE_LECTOR_EXCEL")
+    return pedido if pedido in disponibles else disponibles[0]
+
+
+def _filas_openpyxl(archivo, sheet_name):
+    wb = load_workbook(rebobinar(archivo), read_only=True, data_only=True)
+    try:
+        if isinstance(sheet_name, int):
+            ws = wb.worksheets[sheet_name]
+        else:
+            ws = wb[sheet_name]
+        ws.reset_dimensions()
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _valor_calamine(v):
+    # mismos valores que openpyxl: vacío → None, 3.0 → 3, fecha → datetime
+    if v == "":
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, date) and not isinstance(v, datetime):
+        return datetime(v.year, v.month, v.day)
+    return v
+
+
+def _filas_calamine(archivo, sheet_name):
+    from python_calamine import load_workbook as cargar_calamine
+
+    wb = cargar_calamine(rebobinar(archivo))
+    try:
+        if isinstance(sheet_name, int):
+            hoja = wb.get_sheet_by_index(sheet_name)
+        else:
+            hoja = wb.get_sheet_by_name(sheet_name)
+        # iter_rows empieza en la fila 0 pero en la primera columna usada
+        relleno = (None,) * hoja.start[1] if hoja.start else ()
+        for fila in hoja.iter_rows():
+            yield relleno + tuple(_valor_calamine(v) for v in fila)
+    finally:
+        wb.close()
+
+
+_FILAS = {
+    "calamine": _filas_calamine,
+    "openpyxl": _filas_openpyxl,
+}
+
+
+# ---------------------------------------------------------
+# Entradas de texto delimitado (CSV / TSV)
+# ---------------------------------------------------------
+EXTENSIONES_TEXTO = (".csv", ".tsv", ".txt")
+
+# filas por parte al leer un CSV: memoria acotada sin importar su tamaño
+TAMANO_PARTE = 100_000
+
+
+def _es_ruta(archivo):
+    return isinstance(archivo, (str, bytes)) or hasattr(archivo, "__fspath__")
+
+
+def _extension(archivo):
+    nombre = os.fspath(archivo) if _es_ruta(archivo) else getattr(archivo, "name", "") or ""
+    if isinstance(nombre, bytes):
+        nombre = nombre.decode(errors="ignore")
+    return os.path.splitext(nombre)[1].lower()
+
+
+def es_texto_delimitado(archivo):
+    return _extension(archivo) in EXTENSIONES_TEXTO
+
+
+def _muestra(archivo, n=64 * 1024):
+    if _es_ruta(archivo):
+        with open(archivo, "rb") as f:
+            return f.read(n)
+    datos = rebobinar(archivo).read(n)
+    rebobinar(archivo)
+    return datos
+
+
+def formato_texto(archivo):
+    """(codificación, separador) a partir del inicio del archivo."""
+    muestra = _muestra(archivo)
+    if muestra.startswith(codecs.BOM_UTF8):
+        codificacion = "utf-8-sig"
+    else:
+        try:
+            muestra.decode("utf-8")
+            codificacion = "utf-8"
+        except UnicodeDecodeError as e:
+            # un carácter cortado al final de la muestra no cuenta
+            codificacion = "utf-8" if e.start >= len(muestra) - 3 else "latin-1"
+
+    if _extension(archivo) == ".tsv":
+        return codificacion, "\t"
+
+    # el separador que más se repite en una misma línea (los títulos
+    # de una sola celda no lo tienen)
+    lineas = muestra.decode(codificacion, errors="ignore").splitlines()[:50]
+    separador = max(",;\t|", key=lambda s: max((l.count(s) for l in lineas), default=0))
+    return codificacion, separador
+
+
+def _filas_texto(archivo, sheet_name=None):
+    codificacion, separador = formato_texto(archivo)
+    if _es_ruta(archivo):
+        texto = open(archivo, encoding=codificacion, errors="replace", newline="")
+    else:
+        texto = io.TextIOWrapper(rebobinar(archivo), encoding=codificacion, errors="replace", newline="")
+    try:
+        for fila in csv.reader(texto, delimiter=separador):
+            yield tuple(v if v != "" else None for v in fila)
+    finally:
+        if _es_ruta(archivo):
+            texto.close()
+        else:
+            texto.detach()
+
+
+def _inicio_registro(archivo, registro, codificacion, separador):
+    """
+    Byte donde empieza el registro `registro` (en base 0, como lo cuenta
+    csv.reader: un campo entre comillas puede ocupar varias líneas).
+    """
+    leidos = 0
+
+    def lineas(origen):
+        nonlocal leidos
+        for linea in origen:
+            # "\r" sola también termina la línea (como newline="")
+            for parte in re.split(rb"(?<=\r)(?!\n)", linea):
+                if parte:
+                    leidos += len(parte)
+                    yield parte.decode(codificacion, errors="replace")
+
+    if not registro:
+        return 0
+    origen = open(archivo, "rb") if _es_ruta(archivo) else rebobinar(archivo)
+    try:
+        lector = csv.reader(lineas(origen), delimiter=separador)
+        for _ in range(registro):
+            if next(lector, None) is None:
+                break
+    finally:
+        if _es_ruta(archivo):
+            origen.close()
+        else:
+            rebobinar(archivo)
+    return leidos
+
+
+@contextmanager
+def _desde(archivo, inicio):
+    """El archivo abierto en binario y posicionado en el byte `inicio`."""
+    origen = open(archivo, "rb") if _es_ruta(archivo) else rebobinar(archivo)
+    try:
+        origen.seek(inicio)
+        yield origen
+    finally:
+        if _es_ruta(archivo):
+            origen.close()
+        else:
+            rebobinar(archivo)
+
+
+def leer_texto_agregado(archivo, header, preparar, reducir, tamano_parte=None, columnas=None, dtype=None):
+    """
+    Lee un CSV/TSV por partes desde la fila de encabezado sin tener
+    nunca la tabla completa en memoria: preparar(parte) normaliza y
+    agrega cada parte; reducir(df) combina los agregados acumulados
+    (sumas, último por clave, …) y debe poder aplicarse varias veces.
+    columnas/dtype: ver elegir_columnas.
+    """
+    codificacion, separador = formato_texto(archivo)
+    # se salta por registros y no con skiprows (que cuenta líneas): un
+    # título entre comillas con saltos de línea corre el encabezado
+    inicio = _inicio_registro(archivo, header, codificacion, separador)
+    opciones = dict(
+        sep=separador,
+        header=0,
+        encoding=codificacion,
+        encoding_errors="replace",
+        # CSV en configuración regional de Perú/España: 1,5 con separador ;
+        decimal="," if separador == ";" else ".",
+        usecols=_proyeccion(columnas),
+        dtype=dtype,
+    )
+
+    with etapa("leer_texto") as registro:
+        acumulado, filas, partes = None, 0, 0
+        with _desde(archivo, inicio) as origen, \
+                pd.read_csv(origen, chunksize=tamano_parte or TAMANO_PARTE, **opciones) as lector:
+            for parte in lector:
+                filas += len(parte)
+                partes += 1
+                parte = preparar(parte)
+                acumulado = parte if acumulado is None else reducir(pd.concat([acumulado, parte], ignore_index=True))
+        if acumulado is None:
+            # solo el encabezado
+            with _desde(archivo, inicio) as origen:
+                acumulado = preparar(pd.read_csv(origen, nrows=0, **opciones))
+        registro.update(filas=filas, partes=partes, grupos=len(acumulado), lector="csv")
+    return acumulado
+
+
+# ---------------------------------------------------------
+# Detección de encabezado en streaming (sin cargar la hoja)
+# ---------------------------------------------------------
+def detectar_encabezado(archivo, es_encabezado, sheet_name=0, max_filas=None):
+    """
+    Recorre la hoja fila por fila y se detiene en la primera fila que
+    cumple es_encabezado(valores).
+    Devuelve (fila, columnas) con la fila en base 0, o (None, []).
+    """
+    with etapa("detectar_encabezado") as registro:
+        lector = "csv" if es_texto_delimitado(archivo) else lector_excel()
+        try:
+            fila, columnas = _detectar_encabezado(archivo, es_encabezado, sheet_name, max_filas, lector)
+        except Exception:
+            if lector in ("openpyxl", "csv"):
+                raise
+            lector = "openpyxl"
+            fila, columnas = _detectar_encabezado(archivo, es_encabezado, sheet_name, max_filas, lector)
+        registro["fila"], registro["lector"] = fila, lector
+    return fila, columnas
+
+
+def _detectar_encabezado(archivo, es_encabezado, sheet_name, max_filas, lector):
+    filas = _filas_texto(archivo) if lector == "csv" else _FILAS[lector](archivo, sheet_name)
+    try:
+        for i, valores in enumerate(filas):
+            if max_filas is not None and i >= max_filas:
+                break
+            if es_encabezado(valores):
+                return i, _nombres_columnas(valores)
+    finally:
+        filas.close()
+        rebobinar(archivo)
+
+    return None, []
+
+
+# ---------------------------------------------------------
+# Proyección: cada cargador lee solo las columnas que usa
+# ---------------------------------------------------------
+def elegir_columnas(columnas, necesarias, normalizar=str):
+    """
+    De las columnas del encabezado (nombres como los deja pandas, p. ej.
+    los de detectar_encabezado) elige las que, normalizadas, están en
+    `necesarias` ({nombre: dtype o None}). Devuelve (columnas, dtype)
+    para leer_excel / leer_texto_agregado. Si falta alguna, el cargador
+    lo reporta igual que antes: la columna no llega al DataFrame.
+    """
+    elegidas = [c for c in columnas if normalizar(c) in necesarias]
+    tipos = {c: necesarias[normalizar(c)] for c in elegidas if necesarias[normalizar(c)] is not None}
+    return elegidas, tipos or None
+
+
+def _proyeccion(columnas):
+    # usecols invocable: pandas lo evalúa con los nombres ya desduplicados
+    if columnas is None:
+        return None
+    return frozenset(columnas).__contains__
+
+
+# ---------------------------------------------------------
+# Lectura completa a partir de la fila de encabezado
+# ---------------------------------------------------------
+def leer_excel(archivo, sheet_name=0, header=0, columnas=None, dtype=None):
+    opciones = dict(sheet_name=sheet_name, header=header, usecols=_proyeccion(columnas), dtype=dtype)
+    with etapa("leer_excel") as registro:
+        lector = lector_excel()
+        try:
+            df = pd.read_excel(rebobinar(archivo), engine=lector, **opciones)
+        except Exception:
+            # p. ej. un xlsx que calamine no entiende: se intenta con openpyxl
+            if lector == "openpyxl":
+                raise
+            lector = "openpyxl"
+            df = pd.read_excel(rebobinar(archivo), engine=lector, **opciones)
+        registro["filas"], registro["columnas"] = df.shape
+        registro["lector"] = lector
+    return df
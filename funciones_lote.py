@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from funciones_asistencia import generar_asistencia
+from funciones_cache import contenido_archivo
+from funciones_cajas_sede import generar_cajas_sede
+from funciones_lectura import lector_excel, usar_lector
+from funciones_op1 import generar_op1
+from funciones_perfil import configurar_memoria, medir_memoria
+from funciones_personal import generar_personal
+from funciones_plantilla import obtener_plantilla
+from funciones_resultado import ResultadoGeneracion
+
+
+# ---------------------------------------------------------
+# Reporte → (función, entradas obligatorias, entradas opcionales)
+# (el nombre del reporte es también el de su hoja en la plantilla)
+# ---------------------------------------------------------
+GENERADORES = {
+    "PERSONAL": (generar_personal, ["asc_personal"], []),
+    "CAJAS-SEDE": (generar_cajas_sede, ["asc_cajas_sede"], []),
+    "ASISTENCIA": (generar_asistencia, ["asc", "nom"], ["asc_mindef"]),
+    "OP1": (generar_op1, ["asc_fa", "asc_inst", "nom_inst"], ["mindef_inst"]),
+}
+
+# reportes que aceptan el resultado anterior para regenerar solo lo que cambió
+INCREMENTALES = {"ASISTENCIA", "OP1"}
+
+
+def reportes_disponibles(clasificados):
+    """Reportes cuyas entradas obligatorias fueron detectadas."""
+    return [
+        reporte
+        for reporte, (_, obligatorias, _) in GENERADORES.items()
+        if all(clasificados.get(k) for k in obligatorias)
+    ]
+
+
+def _en_memoria(archivo):
+    """
+    Copia el archivo a un BytesIO (los UploadedFile no se pueden enviar
+    a otro proceso). Las rutas se envían tal cual: así un CSV grande se
+    lee por partes en el proceso que lo usa, sin copiarlo antes.
+    """
+    if archivo is None or isinstance(archivo, str) or hasattr(archivo, "__fspath__"):
+        return archivo
+    copia = BytesIO(contenido_archivo(archivo))
+    copia.name = os.path.basename(getattr(archivo, "name", "") or "")
+    return copia
+
+
+def _ejecutar(reporte, plantilla, entradas, memoria=False, lector=None, anterior=None):
+    # en otro proceso no llega la configuración del que llama
+    configurar_memoria(memoria)
+    usar_lector(lector)
+    funcion = GENERADORES[reporte][0]
+    if anterior is not None:
+        return funcion(plantilla, *entradas, anterior=anterior)
+    return funcion(plantilla, *entradas)
+
+
+# ---------------------------------------------------------
+# Pool de procesos (uno por proceso del servidor)
+# ---------------------------------------------------------
+_pool = None
+_lock = threading.Lock()
+
+
+def _obtener_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=min(len(GENERADORES), os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ---------------------------------------------------------
+# Generar todos los reportes disponibles
+# ---------------------------------------------------------
+def generar_todos(clasificados, plantilla=None, paralelo=True, anteriores=None):
+    """
+    Ejecuta cada generar_* cuyas entradas estén disponibles y devuelve
+    {reporte: ResultadoGeneracion}. Con paralelo=True cada reporte corre
+    en su propio proceso, así el tiempo total es el del más lento.
+    `anteriores` ({reporte: ResultadoGeneracion} de la vez previa) permite
+    a los reportes INCREMENTALES releer solo los archivos que cambiaron.
+    """
+    anteriores = anteriores or {}
+    tareas = {}
+    for reporte in reportes_disponibles(clasificados):
+        _, obligatorias, opcionales = GENERADORES[reporte]
+        entradas = [_en_memoria(clasificados.get(k)) for k in obligatorias + opcionales]
+        anterior = anteriores.get(reporte) if reporte in INCREMENTALES else None
+        tareas[reporte] = (
+            obtener_plantilla(reporte, plantilla), entradas, medir_memoria(), lector_excel(), anterior
+        )
+
+    if not paralelo or len(tareas) < 2:
+        return {reporte: _ejecutar(reporte, *t) for reporte, t in tareas.items()}
+
+    pool = _obtener_pool()
+    futuros = {reporte: pool.submit(_ejecutar, reporte, *t) for reporte, t in tareas.items()}
+
+    resultados = {}
+    for reporte, futuro in futuros.items():
+        try:
+            resultados[reporte] = futuro.result()
+        except Exception as e:
+            # p. ej. BrokenProcessPool: se recrea el pool en la próxima llamada
+            _descartar_pool()
+            resultados[reporte] = ResultadoGeneracion(reporte, error=f"❌ Error al generar {reporte}: {e}")
+
+    return resultados
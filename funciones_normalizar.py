@@ -0,0 +1,69 @@
+import os
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# ---------------------------------------------------------
+# Normalización de textos y claves (sede, local, cargo, tipo)
+# ---------------------------------------------------------
+# Misma regla para los datos y para la plantilla, en los cuatro
+# generadores: espacios raros (\xa0, \t, \r, \n) → espacio, strip y
+# mayúsculas. Con PE_SIN_ACENTOS=1 las claves además se comparan sin
+# tildes (MARÍA = MARIA); se fija por proceso porque lo que devuelven
+# los cargadores (y su copia en disco) depende de ello.
+# ---------------------------------------------------------
+SIN_ACENTOS = os.environ.get("PE_SIN_ACENTOS", "") == "1"
+
+_ESPACIOS = str.maketrans({"\xa0": " ", "\t": " ", "\r": " ", "\n": " "})
+_MARCAS = re.compile("[\u0300-\u036f]")    # tildes y diéresis tras NFKD
+
+
+def _quitar_acentos(texto):
+    return _MARCAS.sub("", unicodedata.normalize("NFKD", texto))
+
+
+@lru_cache(maxsize=100_000)
+def _limpiar_texto(texto, sin_acentos):
+    # memo: los encabezados y las sedes de la plantilla se repiten mucho
+    texto = texto.translate(_ESPACIOS).strip().upper()
+    if sin_acentos:
+        texto = _quitar_acentos(texto)
+    return sys.intern(texto)
+
+
+def limpiar(valor, sin_acentos=False):
+    """Texto normalizado de un valor ("" si está vacío)."""
+    if valor is None or pd.isna(valor):
+        return ""
+    return _limpiar_texto(str(valor), sin_acentos)
+
+
+def limpiar_serie(serie, sin_acentos=False):
+    """
+    limpiar() sobre toda una columna: se normaliza una vez cada valor
+    distinto con el accesor .str y el resultado se reparte por código.
+    Los textos quedan internados (sys.intern), así las claves repetidas
+    son el mismo objeto al buscarlas en diccionarios y al agrupar.
+    """
+    codigos, unicos = pd.factorize(serie)
+    textos = pd.Series(unicos, dtype=object).astype(str).str.translate(_ESPACIOS).str.strip().str.upper()
+    if sin_acentos:
+        textos = textos.str.normalize("NFKD").str.replace(_MARCAS, "", regex=True)
+
+    # el "" final atiende a los vacíos (código -1 de factorize)
+    por_codigo = np.array([sys.intern(t) for t in textos] + [""], dtype=object)
+    return pd.Series(por_codigo[codigos], index=serie.index, name=serie.name)
+
+
+def clave(valor):
+    """limpiar() para comparar claves (sin tildes si PE_SIN_ACENTOS=1)."""
+    return limpiar(valor, SIN_ACENTOS)
+
+
+def claves(serie):
+    return limpiar_serie(serie, SIN_ACENTOS)
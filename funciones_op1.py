@@ -1,42 +1,75 @@
+import re
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
-from io import BytesIO
-from openpyxl import load_workbook
 from openpyxl.styles import PatternFill, Font
 from openpyxl.formatting.rule import CellIsRule
-from openpyxl.workbook.properties import CalcProperties
-import streamlit as st
+
+from funciones_cache import cargar_con_cache
+from funciones_formulas import guardar_con_valores
+from funciones_incremental import (
+    aplicar_cambios, cambios_en_bloques, entradas_cambiadas, estado_previo, huellas_entradas,
+)
+from funciones_lectura import (
+    detectar_encabezado, elegir_columnas, es_texto_delimitado, leer_excel, leer_texto_agregado,
+)
+from funciones_normalizar import clave, claves
+from funciones_perfil import avance, etapa, perfilado
+from funciones_plantilla import cargar_hoja
+from funciones_resultado import ResultadoGeneracion
 
 
 # ============================================================
 # FUNCIONES AUXILIARES
 # ============================================================
 
-def habilitar_recalculo(wb):
-    """Activa recálculo completo al abrir Excel."""
-    try:
-        wb.calculation_properties.fullCalcOnLoad = True
-    except Exception:
-        wb.calculation_properties = CalcProperties(fullCalcOnLoad=True)
+def _es_fila_sede_operativa(valores):
+    return any(
+        v is not None and "sede operativa" in str(v).lower()
+        for v in valores
+    )
 
 
-def cargar_excel_con_encabezado_correcto(file):
+def detectar_fila_sede_operativa(file):
     """
-    Detecta la fila donde aparece 'Sede Operativa'
-    y la usa como fila de encabezado.
+    Devuelve (fila, columnas) de la primera fila donde aparece
+    'Sede Operativa', leyendo solo hasta encontrarla.
     """
-    df_raw = pd.read_excel(file, header=None)
-    header_row = None
+    fila, columnas = detectar_encabezado(file, _es_fila_sede_operativa)
+    if fila is None:
+        raise ValueError("❌ No se encontró la fila de encabezado (Sede Operativa).")
+    return fila, columnas
 
-    for i in range(len(df_raw)):
-        fila = df_raw.iloc[i].astype(str).str.lower()
-        if fila.str.contains("sede operativa").any():
-            header_row = i
-            break
 
-    if header_row is None:
-        raise ValueError("❌ No se encontró la fila de encabezado (Sede Operativa).")
+# columnas que usan los instrumentos/FA (el resto del archivo no se lee)
+COLUMNAS_INVENTARIO = {
+    "Sede Operativa": str,
+    "Local": str,
+    "Tipo": str,
+    "Inventario en campo": None,
+}
+
+
+def _sin_espacios(nombre):
+    return str(nombre).strip()
+
+
+def cargar_excel_con_encabezado_correcto(file, necesarias=None):
+    """
+    Detecta la fila donde aparece 'Sede Operativa'
+    y la usa como fila de encabezado. Con `necesarias`
+    ({columna: dtype}) lee solo esas columnas.
+    """
+    header_row, columnas = detectar_fila_sede_operativa(file)
+
+    tipos = None
+    if necesarias is not None:
+        columnas, tipos = elegir_columnas(columnas, necesarias, _sin_espacios)
+    else:
+        columnas = None
 
-    df = pd.read_excel(file, header=header_row)
+    df = leer_excel(file, header=header_row, columnas=columnas, dtype=tipos)
     df.columns = df.columns.str.strip()
     return df
 
@@ -45,269 +78,370 @@ def cargar_excel_con_encabezado_correcto(file):
 # FUNCIÓN PRINCIPAL — GENERAR OP1
 # ============================================================
 
-def generar_op1(base, asc_fa, asc_inst, nom_inst, mindef_inst=None):
+@perfilado("OP1")
+def generar_op1(base, asc_fa, asc_inst, nom_inst, mindef_inst=None, anterior=None):
+    """
+    Con `anterior` (el resultado de la generación previa) solo se leen
+    los archivos que cambiaron y se reescriben sus celdas.
+    """
 
-    st.info("Procesando hoja OP1...")
+    resultado = ResultadoGeneracion("OP1")
 
     try:
-        asc_fa_df = cargar_excel_con_encabezado_correcto(asc_fa)
-        asc_inst_df = cargar_excel_con_encabezado_correcto(asc_inst)
-        nom_inst_df = cargar_excel_con_encabezado_correcto(nom_inst)
-
-        # MINDEF opcional
-        if mindef_inst:
-            try:
-                mindef_inst_df = cargar_excel_con_encabezado_correcto(mindef_inst)
-            except Exception:
-                st.warning("⚠ MINDEF - INSTRUMENTOS no válido. Se usará 0.")
-                mindef_inst_df = None
+        archivos = {"asc_fa": asc_fa, "asc_inst": asc_inst, "nom_inst": nom_inst, "mindef_inst": mindef_inst}
+        huellas = huellas_entradas(base, archivos)
+        previo = estado_previo(anterior, huellas)
+        cambiadas = entradas_cambiadas(previo, huellas)
+
+        dfs = {}
+        for entrada in cambiadas:
+            tipo, categorias, _ = ENTRADAS_OP1[entrada]
+            if entrada != "mindef_inst":
+                dfs[entrada] = cargar_con_cache(archivos[entrada], tipo, cargador_categorizado(categorias))
+                continue
+
+            # MINDEF opcional
+            dfs[entrada] = None
+            if mindef_inst:
+                try:
+                    dfs[entrada] = cargar_con_cache(mindef_inst, tipo, cargador_categorizado(categorias))
+                except Exception:
+                    resultado.avisos.append("⚠ MINDEF - INSTRUMENTOS no válido. Se usará 0.")
+                    huellas[entrada] = None     # se vuelve a intentar la próxima vez
+
+        indices = indexar_entradas(dfs)
+
+        if previo is None:
+            # solo se abre la hoja OP1 de la plantilla
+            wb = cargar_hoja(base, "OP1")
+            ws = wb["OP1"]
+            filas = filas_op1(ws)
+            bloques = {e: bloque_op1(e, filas, indices[e]) for e in ENTRADAS_OP1}
+
+            actualizar_OP1(ws, filas, bloques)
+            # fórmulas con su resultado en caché: Excel no recalcula todo al abrir
+            resultado.contenido = guardar_con_valores(wb)
+            resultado.mensaje = "✅ OP1 generado correctamente."
         else:
-            mindef_inst_df = None
-
-        wb = load_workbook(base)
-
-        if "OP1" not in wb.sheetnames:
-            raise ValueError("❌ La plantilla no contiene la hoja OP1.")
+            filas = previo["filas"]
+            bloques = dict(previo["bloques"])
+            bloques.update({e: bloque_op1(e, filas, indices[e]) for e in cambiadas})
+            cambios = cambios_en_bloques(previo, bloques, cambiadas)
 
-        # dejar solo OP1
-        for h in wb.sheetnames.copy():
-            if h != "OP1":
-                del wb[h]
+            if cambios:
+                resultado.contenido = aplicar_cambios(anterior, "OP1", cambios)
+                resultado.mensaje = f"✅ OP1 actualizado ({len(cambios)} celdas)."
+            else:
+                resultado.contenido = anterior.contenido
+                resultado.mensaje = "✅ OP1 sin cambios en los datos."
 
-        ws = wb["OP1"]
+        resultado.estado = {"huellas": huellas, "filas": filas, "bloques": bloques}
 
-        actualizar_OP1(ws, asc_fa_df, asc_inst_df, nom_inst_df, mindef_inst_df)
+    except Exception as e:
+        resultado.error = f"❌ Error al generar OP1: {e}"
 
-        habilitar_recalculo(wb)
+    return resultado
 
-        out = BytesIO()
-        wb.save(out)
-        out.seek(0)
-        st.session_state["op1_generada"] = out
 
-        st.success("✅ OP1 generado correctamente.")
+# ============================================================
+# CATEGORÍAS DE "Tipo" POR ARCHIVO
+# ============================================================
 
-    except Exception as e:
-        st.error(f"❌ Error al generar OP1: {e}")
+CATEGORIAS_ASC = {
+    "C": ["CUADERNILLO DE CONOCIMIENTOS"],
+    "F": ["FICHA DE RESPUESTA"],
+}
+
+CATEGORIAS_NOM = {
+    "C": ["CUADERNILLO DE HABILIDADES", "CUADERNILLO DE CONOCIMIENTOS"],
+    "F": ["FICHA DE RESPUESTA"],
+}
+
+CATEGORIAS_MINDEF = {
+    "C": ["CUADERNILLO"],
+    "F": ["FICHA DE RESPUESTA"],
+}
+
+# Formatos Auxiliares: columna de la hoja OP1 → texto buscado en "Tipo"
+FA_TIPOS = {
+    "AV": "ACTA DE RECEPCIÓN/DEVOLUCIÓN",
+    "AX": "ACTA DE APLICACIÓN DEL AULA",
+    "AZ": "LISTA DE ASISTENCIA",
+    "BB": "LISTA DE RETIRO DE CUADERNILLOS",
+    "BD": "ACTA DE RESPUESTA A OBSERVACIONES DEL DOCENTE",
+    "BF": "REGISTRO DE ENTREGA INSTRUMENTOS ADICIONALES",
+    "BH": "ACTA DE INCIDENCIAS DEL CAE",
+    "BJ": "ACTA DE INCUMPLIMIENTO DE PROCEDIMIENTOS",
+    "BL": "ACTA DE INCIDENCIAS DE SALUD",
+    "BN": "ACTA DE INCIDENCIAS DEL LOCAL DE EVALUACIÓN",
+    "BP": "ACTA FISCAL",
+    "BR": "SOBRES",
+}
+
+CATEGORIAS_FA = {col: [texto] for col, texto in FA_TIPOS.items()}
+
+# Entrada → (tipo de caché, categorías, columna de la hoja → categoría)
+ENTRADAS_OP1 = {
+    "asc_fa": ("fa", CATEGORIAS_FA, {col: col for col in FA_TIPOS}),     # AV–BR
+    "asc_inst": ("instrumentos-asc", CATEGORIAS_ASC, {"O": "C", "P": "F"}),
+    "nom_inst": ("instrumentos-nom", CATEGORIAS_NOM, {"U": "C", "V": "F"}),
+    "mindef_inst": ("instrumentos-mindef", CATEGORIAS_MINDEF, {"AA": "C", "AB": "F"}),
+}
 
 
 # ============================================================
-# ACTUALIZAR HOJA OP1
+# "Tipo" → CÓDIGO DE CATEGORÍA (una sola vez, al cargar)
 # ============================================================
 
-def actualizar_OP1(ws, asc_fa_df, asc_inst_df, nom_inst_df, mindef_inst_df):
+@lru_cache(maxsize=None)
+def _patrones_categorias(textos_por_categoria):
+    """Un patrón por categoría: alguno de sus textos (literales), sin mayúsculas."""
+    return [
+        re.compile("|".join(re.escape(t) for t in textos), re.IGNORECASE)
+        for textos in textos_por_categoria
+    ]
+
+
+def categorizar_tipo(tipo, categorias):
+    """
+    Matriz booleana filas × categorías: True si el "Tipo" contiene alguno
+    de los textos de la categoría. Cada categoría se evalúa por separado
+    (como el str.contains de cada una), así un Tipo puede estar en varias.
+    Los patrones se evalúan una vez por valor distinto.
+    """
+    patrones = _patrones_categorias(tuple(tuple(t) for t in categorias.values()))
+    codigos, valores = pd.factorize(tipo.astype(str))
+
+    por_valor = [[p.search(str(valor)) is not None for p in patrones] for valor in valores]
+    # la fila final atiende a los valores vacíos (código -1 de factorize)
+    por_valor.append([False] * len(patrones))
+    return np.array(por_valor, dtype=bool).reshape(-1, len(patrones))[codigos]
+
+
+def por_categoria(df, categorias):
+    """
+    Una fila por cada categoría a la que pertenece cada fila de df, con
+    su código en _categoria (Categorical). Las filas sin categoría se
+    descartan y las que están en dos categorías suman en las dos.
+    """
+    filas, codigos = np.nonzero(categorizar_tipo(df["Tipo"], categorias))
+    df = df.take(filas).reset_index(drop=True)
+    df["_categoria"] = pd.Categorical.from_codes(codigos.astype(np.int8), categories=list(categorias))
+    return df
+
+
+def _sumar_inventario(df, col_inv="Inventario en campo"):
+    return df.groupby(
+        ["Sede Operativa", "Local", "_categoria"], sort=False, observed=True, as_index=False
+    )[col_inv].sum()
 
-    col_inv = "Inventario en campo"
 
-    def norm(df):
+def cargador_categorizado(categorias):
+    """
+    Cargador de instrumentos/FA que deja lista la columna _categoria.
+    Un CSV se agrega por partes: solo quedan los totales por
+    (sede, local, categoría), que indexar_inventario vuelve a agrupar igual.
+    """
+    def agregar_parte(df):
         df.columns = df.columns.str.strip()
+        df["Sede Operativa"] = claves(df["Sede Operativa"])
+        df["Local"] = claves(df["Local"])
+        return _sumar_inventario(por_categoria(df, categorias))
+
+    def cargar(file):
+        if es_texto_delimitado(file):
+            fila, columnas = detectar_fila_sede_operativa(file)
+            columnas, tipos = elegir_columnas(columnas, COLUMNAS_INVENTARIO, _sin_espacios)
+            return leer_texto_agregado(
+                file, fila, agregar_parte, _sumar_inventario, columnas=columnas, dtype=tipos
+            )
+
+        df = cargar_excel_con_encabezado_correcto(file, COLUMNAS_INVENTARIO)
+        if "Tipo" in df:
+            df = por_categoria(df, categorias)
         return df
+    return cargar
 
-    asc_fa_df = norm(asc_fa_df)
-    asc_inst_df = norm(asc_inst_df)
-    nom_inst_df = norm(nom_inst_df)
-    if mindef_inst_df is not None:
-        mindef_inst_df = norm(mindef_inst_df)
 
-    # =====================================================
-    # RECORRER FILAS
-    # =====================================================
+# ============================================================
+# ÍNDICE (Sede, Local, Categoría) → Inventario en campo
+# ============================================================
+
+def indexar_inventario(df, categorias, col_inv="Inventario en campo"):
+    """
+    Agrupa el archivo una sola vez por (Sede Operativa, Local, categoría)
+    y devuelve {(sede, local, categoria): total}. La categoría viene de
+    la columna _categoria (ver cargador_categorizado) o se calcula aquí.
+    """
+    if "_categoria" not in df:
+        df = por_categoria(df, categorias)
+    sede = claves(df["Sede Operativa"])
+    local = claves(df["Local"])
+
+    totales = df[col_inv].groupby([sede, local, df["_categoria"]], sort=False, observed=True).sum()
+    indice = dict(totales.items())
+
+    # mismo tipo de cero que daba .sum() sobre una selección vacía
+    cero = df[col_inv].iloc[:0].sum()
+    return indice, cero
+
+
+# ============================================================
+# TOTALES POR ENTRADA (bloques de columnas de la hoja)
+# ============================================================
+
+def indexar_entradas(dfs):
+    """
+    {entrada: (índice, cero)} de cada DataFrame cargado; una entrada
+    sin archivo (MINDEF opcional) queda en ceros.
+    """
+    indices = {}
+    with etapa("agregar") as registro:
+        for entrada, df in dfs.items():
+            if df is None:
+                indices[entrada] = ({}, 0)
+                continue
+            df.columns = df.columns.str.strip()
+            indices[entrada] = indexar_inventario(df, ENTRADAS_OP1[entrada][1])
+        registro["grupos"] = sum(len(indice) for indice, _ in indices.values())
+    return indices
+
+
+def filas_op1(ws):
+    """[(fila, sede, local)] de las filas de la hoja con sede y local."""
+    filas = []
     for r in range(2, ws.max_row + 1):
+        sede = clave(ws[f"B{r}"].value)
+        local = clave(ws[f"C{r}"].value)
+        if sede and local:
+            filas.append((r, sede, local))
+    return filas
 
-        sede = str(ws[f"B{r}"].value or "").strip()
-        local = str(ws[f"C{r}"].value or "").strip()
-        if not sede or not local:
-            continue
 
-        # =====================================================
-        # ASC — INSTRUMENTOS (O–T)
-        # =====================================================
+def bloque_op1(entrada, filas, indice):
+    """{celda: total} de las columnas de `entrada` en cada fila."""
+    idx, cero = indice
+    columnas = ENTRADAS_OP1[entrada][2]
+    return {
+        f"{col}{r}": idx.get((sede, local, categoria), cero)
+        for r, sede, local in filas
+        for col, categoria in columnas.items()
+    }
 
-        asc_fil = (
-            (asc_inst_df["Sede Operativa"].astype(str).str.strip() == sede)
-            & (asc_inst_df["Local"].astype(str).str.strip() == local)
-        )
 
-        asc_c = asc_inst_df.loc[
-            asc_fil
-            & asc_inst_df["Tipo"].astype(str).str.contains(
-                "CUADERNILLO DE CONOCIMIENTOS", case=False, na=False
-            ),
-            col_inv,
-        ].sum()
-
-        asc_f = asc_inst_df.loc[
-            asc_fil
-            & asc_inst_df["Tipo"].astype(str).str.contains(
-                "FICHA DE RESPUESTA", case=False, na=False
-            ),
-            col_inv,
-        ].sum()
-
-        ws[f"O{r}"] = asc_c
-        ws[f"P{r}"] = asc_f
-        ws[f"Q{r}"] = f"=G{r}-O{r}"           # ASC-C[d]
-        ws[f"R{r}"] = f"=H{r}-P{r}"           # ASC-F[d]
-        ws[f"S{r}"] = f"=IF(G{r}=0,1,O{r}/G{r})"  # ASC-C[p]
-        ws[f"T{r}"] = f"=IF(H{r}=0,1,P{r}/H{r})"  # ASC-F[p]
+# ============================================================
+# ACTUALIZAR HOJA OP1
+# ============================================================
+
+def actualizar_OP1(ws, filas, bloques):
+
+    # =====================================================
+    # TOTALES DE CADA ARCHIVO (O–P, U–V, AA–AB, AV–BR)
+    # =====================================================
+    with etapa("llenar_celdas", filas=len(filas)):
+        for valores in bloques.values():
+            for celda, valor in valores.items():
+                ws[celda] = valor
 
         # =====================================================
-        # NOM — INSTRUMENTOS (U–Z)
+        # FÓRMULAS DE CADA FILA
         # =====================================================
+        for r, _, _ in filas:
+            avance(r - 1, ws.max_row - 1)
 
-        nom_fil = (
-            (nom_inst_df["Sede Operativa"].astype(str).str.strip() == sede)
-            & (nom_inst_df["Local"].astype(str).str.strip() == local)
-        )
+            # =====================================================
+            # ASC — INSTRUMENTOS (O–T)
+            # =====================================================
 
-        nom_c = nom_inst_df.loc[
-            nom_fil
-            & (
-                nom_inst_df["Tipo"].astype(str).str.contains(
-                    "CUADERNILLO DE HABILIDADES", case=False, na=False
-                )
-                | nom_inst_df["Tipo"].astype(str).str.contains(
-                    "CUADERNILLO DE CONOCIMIENTOS", case=False, na=False
-                )
-            ),
-            col_inv,
-        ].sum()
-
-        nom_f = nom_inst_df.loc[
-            nom_fil
-            & nom_inst_df["Tipo"].astype(str).str.contains(
-                "FICHA DE RESPUESTA", case=False, na=False
-            ),
-            col_inv,
-        ].sum()
-
-        ws[f"U{r}"] = nom_c
-        ws[f"V{r}"] = nom_f
-        ws[f"W{r}"] = f"=I{r}-U{r}"           # NOM-C[d]
-        ws[f"X{r}"] = f"=J{r}-V{r}"           # NOM-F[d]
-        ws[f"Y{r}"] = f"=IF(I{r}=0,1,U{r}/I{r})"  # NOM-C[p]
-        ws[f"Z{r}"] = f"=IF(J{r}=0,1,V{r}/J{r})"  # NOM-F[p]
+            ws[f"Q{r}"] = f"=G{r}-O{r}"           # ASC-C[d]
+            ws[f"R{r}"] = f"=H{r}-P{r}"           # ASC-F[d]
+            ws[f"S{r}"] = f"=IF(G{r}=0,1,O{r}/G{r})"  # ASC-C[p]
+            ws[f"T{r}"] = f"=IF(H{r}=0,1,P{r}/H{r})"  # ASC-F[p]
 
-        # =====================================================
-        # MINDEF — INSTRUMENTOS (AA–AF) *opcional*
-        # =====================================================
+            # =====================================================
+            # NOM — INSTRUMENTOS (U–Z)
+            # =====================================================
 
-        if mindef_inst_df is not None:
-            mindef_fil = (
-                (mindef_inst_df["Sede Operativa"].astype(str).str.strip() == sede)
-                & (mindef_inst_df["Local"].astype(str).str.strip() == local)
-            )
+            ws[f"W{r}"] = f"=I{r}-U{r}"           # NOM-C[d]
+            ws[f"X{r}"] = f"=J{r}-V{r}"           # NOM-F[d]
+            ws[f"Y{r}"] = f"=IF(I{r}=0,1,U{r}/I{r})"  # NOM-C[p]
+            ws[f"Z{r}"] = f"=IF(J{r}=0,1,V{r}/J{r})"  # NOM-F[p]
 
-            mindef_c = mindef_inst_df.loc[
-                mindef_fil
-                & mindef_inst_df["Tipo"].astype(str).str.contains(
-                    "CUADERNILLO", case=False, na=False
-                ),
-                col_inv,
-            ].sum()
-
-            mindef_f = mindef_inst_df.loc[
-                mindef_fil
-                & mindef_inst_df["Tipo"].astype(str).str.contains(
-                    "FICHA DE RESPUESTA", case=False, na=False
-                ),
-                col_inv,
-            ].sum()
-        else:
-            mindef_c = 0
-            mindef_f = 0
+            # =====================================================
+            # MINDEF — INSTRUMENTOS (AA–AF) *opcional*
+            # =====================================================
 
-        ws[f"AA{r}"] = mindef_c
-        ws[f"AB{r}"] = mindef_f
-        ws[f"AC{r}"] = f"=K{r}-AA{r}"              # MINDEF-C[d]
-        ws[f"AD{r}"] = f"=L{r}-AB{r}"              # MINDEF-F[d]
-        ws[f"AE{r}"] = f"=IF(K{r}=0,1,AA{r}/K{r})" # MINDEF-C[p]
-        ws[f"AF{r}"] = f"=IF(L{r}=0,1,AB{r}/L{r})" # MINDEF-F[p]
+            ws[f"AC{r}"] = f"=K{r}-AA{r}"              # MINDEF-C[d]
+            ws[f"AD{r}"] = f"=L{r}-AB{r}"              # MINDEF-F[d]
+            ws[f"AE{r}"] = f"=IF(K{r}=0,1,AA{r}/K{r})" # MINDEF-C[p]
+            ws[f"AF{r}"] = f"=IF(L{r}=0,1,AB{r}/L{r})" # MINDEF-F[p]
 
-        # =====================================================
-        # FA — Formatos Auxiliares (AG–AU y AV–BS)
-        # =====================================================
+            # =====================================================
+            # FA — PORCENTAJES / ESTADOS (AW–BS)
+            # =====================================================
 
-        def sumar_fa(tipo_exact):
-            return asc_fa_df.loc[
-                (asc_fa_df["Sede Operativa"].astype(str).str.strip() == sede)
-                & (asc_fa_df["Local"].astype(str).str.strip() == local)
-                & (asc_fa_df["Tipo"].astype(str).str.contains(
-                    tipo_exact, case=False, na=False
-                )),
-                col_inv,
-            ].sum()
-
-        fa_tipos = {
-            "AV": "ACTA DE RECEPCIÓN/DEVOLUCIÓN",
-            "AX": "ACTA DE APLICACIÓN DEL AULA",
-            "AZ": "LISTA DE ASISTENCIA",
-            "BB": "LISTA DE RETIRO DE CUADERNILLOS",
-            "BD": "ACTA DE RESPUESTA A OBSERVACIONES DEL DOCENTE",
-            "BF": "REGISTRO DE ENTREGA INSTRUMENTOS ADICIONALES",
-            "BH": "ACTA DE INCIDENCIAS DEL CAE",
-            "BJ": "ACTA DE INCUMPLIMIENTO DE PROCEDIMIENTOS",
-            "BL": "ACTA DE INCIDENCIAS DE SALUD",
-            "BN": "ACTA DE INCIDENCIAS DEL LOCAL DE EVALUACIÓN",
-            "BP": "ACTA FISCAL",
-            "BR": "SOBRES",
-        }
-
-        for col_letra, texto in fa_tipos.items():
-            ws[f"{col_letra}{r}"] = sumar_fa(texto)
-
-        # --------------------------
-        # PORCENTAJES / ESTADOS FA
-        # --------------------------
-
-        ws[f"AW{r}"] = f"=IF(AJ{r}=0,1,AV{r}/AJ{r})"
-        ws[f"AY{r}"] = f"=IF(AK{r}=0,1,AX{r}/AK{r})"
-        ws[f"BA{r}"] = f"=IF(AL{r}=0,1,AZ{r}/AL{r})"
-        ws[f"BC{r}"] = f"=IF(AM{r}=0,1,BB{r}/AM{r})"
-        ws[f"BE{r}"] = f"=IF(AN{r}=0,1,BD{r}/AN{r})"
-        ws[f"BG{r}"] = f"=IF(AO{r}=0,1,BF{r}/AO{r})"
-        ws[f"BI{r}"] = f"=IF(AP{r}=0,1,BH{r}/AP{r})"
-
-        # ✔ BK y BQ con fórmulas de OK/ERR (no porcentaje)
-        ws[f"BK{r}"] = f'=IF(MOD(BJ{r},2)=0,"OK","ERR")'# Acta de incumplimiento de procedimientos
-        ws[f"BQ{r}"] = f'=IF(AT{r}=0,0,BP{r}/AT{r})'
-        ws[f"BQ{r}"].number_format = "0.00%"  # Acta fiscal
-
-        ws[f"BM{r}"] = f"=IF(AR{r}=0,1,BL{r}/AR{r})"
-        ws[f"BO{r}"] = f"=IF(AS{r}=0,1,BN{r}/AS{r})"
-        ws[f"BS{r}"] = f"=IF(AU{r}=0,1,BR{r}/AU{r})"
+            ws[f"AW{r}"] = f"=IF(AJ{r}=0,1,AV{r}/AJ{r})"
+            ws[f"AY{r}"] = f"=IF(AK{r}=0,1,AX{r}/AK{r})"
+            ws[f"BA{r}"] = f"=IF(AL{r}=0,1,AZ{r}/AL{r})"
+            ws[f"BC{r}"] = f"=IF(AM{r}=0,1,BB{r}/AM{r})"
+            ws[f"BE{r}"] = f"=IF(AN{r}=0,1,BD{r}/AN{r})"
+            ws[f"BG{r}"] = f"=IF(AO{r}=0,1,BF{r}/AO{r})"
+            ws[f"BI{r}"] = f"=IF(AP{r}=0,1,BH{r}/AP{r})"
+
+            # ✔ BK y BQ con fórmulas de OK/ERR (no porcentaje)
+            ws[f"BK{r}"] = f'=IF(MOD(BJ{r},2)=0,"OK","ERR")'# Acta de incumplimiento de procedimientos
+            ws[f"BQ{r}"] = f'=IF(AT{r}=0,0,BP{r}/AT{r})'
+            ws[f"BQ{r}"].number_format = "0.00%"  # Acta fiscal
+
+            ws[f"BM{r}"] = f"=IF(AR{r}=0,1,BL{r}/AR{r})"
+            ws[f"BO{r}"] = f"=IF(AS{r}=0,1,BN{r}/AS{r})"
+            ws[f"BS{r}"] = f"=IF(AU{r}=0,1,BR{r}/AU{r})"
 
     # =====================================================
     # FORMATO CONDICIONAL PARA [d] (≠ 0 → rojo)
     # =====================================================
 
-    columnas_d = ["Q", "R", "W", "X", "AC", "AD"]
+    with etapa("formato_condicional"):
+        columnas_d = ["Q", "R", "W", "X", "AC", "AD"]
 
-    for col in columnas_d:
-        ws.conditional_formatting.add(
-            f"{col}2:{col}{ws.max_row}",
-            CellIsRule(
-                operator="notEqual",
-                formula=["0"],
-                font=Font(color="FF0000")
+        for col in columnas_d:
+            ws.conditional_formatting.add(
+                f"{col}2:{col}{ws.max_row}",
+                CellIsRule(
+                    operator="notEqual",
+                    formula=["0"],
+                    font=Font(color="FF0000")
+                )
             )
-        )
 
        
-    # =====================================================
-    # FORMATO CONDICIONAL PARA [p] (< 1 → rojo)
-    # (NO incluye BK ni BQ porque son OK/ERR, no proporción)
-    # =====================================================
+        # =====================================================
+        # FORMATO CONDICIONAL PARA [p] (< 1 → rojo)
+        # (NO incluye BK ni BQ porque son OK/ERR, no proporción)
+        # =====================================================
 
-    columnas_p = [
-        "S", "T", "Y", "Z", "AE", "AF",
-        "AW", "AY", "BA", "BC", "BE", "BG", "BI",
-        "BM", "BO", "BS"
-    ]
+        columnas_p = [
+            "S", "T", "Y", "Z", "AE", "AF",
+            "AW", "AY", "BA", "BC", "BE", "BG", "BI",
+            "BM", "BO", "BS"
+        ]
+
+        for col in columnas_p:
+            ws.conditional_formatting.add(
+                f"{col}2:{col}{ws.max_row}",
+                CellIsRule(
+                    operator="lessThan",
+                    formula=["1"],
+                    font=Font(color="FF0000")
+                )
+            )
+
+                # =====================================================
+        # NUEVO → Formato condicional para BQ < 1 (100%)
+        # =====================================================
 
-    for col in columnas_p:
         ws.conditional_formatting.add(
-            f"{col}2:{col}{ws.max_row}",
+            f"BQ2:BQ{ws.max_row}",
             CellIsRule(
                 operator="lessThan",
                 formula=["1"],
@@ -315,34 +449,21 @@ def actualizar_OP1(ws, asc_fa_df, asc_inst_df, nom_inst_df, mindef_inst_df):
             )
         )
 
-            # =====================================================
-    # NUEVO → Formato condicional para BQ < 1 (100%)
-    # =====================================================
-
-    ws.conditional_formatting.add(
-        f"BQ2:BQ{ws.max_row}",
-        CellIsRule(
-            operator="lessThan",
-            formula=["1"],
-            font=Font(color="FF0000")
-        )
-    )
-
-    # =====================================================
-    # FORMATO CONDICIONAL SOLO PARA BK y BQ (ERR → rojo)
-    # =====================================================
+        # =====================================================
+        # FORMATO CONDICIONAL SOLO PARA BK y BQ (ERR → rojo)
+        # =====================================================
 
-    err_columns = ["BK", "BQ"]
+        err_columns = ["BK", "BQ"]
 
-    for col in err_columns:
-        ws.conditional_formatting.add(
-            f"{col}2:{col}{ws.max_row}",
-            CellIsRule(
-                operator="equal",
-                formula=['"ERR"'],
-                font=Font(color="FF0000")
+        for col in err_columns:
+            ws.conditional_formatting.add(
+                f"{col}2:{col}{ws.max_row}",
+                CellIsRule(
+                    operator="equal",
+                    formula=['"ERR"'],
+                    font=Font(color="FF0000")
+                )
             )
-        )
 
 
     return ws
\ No newline at end of file
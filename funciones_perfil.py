@@ -0,0 +1,230 @@
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# ---------------------------------------------------------
+# Medición de memoria (tracemalloc) — desactivada por defecto:
+# openpyxl crea un objeto por celda y con tracemalloc activo la
+# generación tarda varias veces más. Se activa con
+# PE_PERFIL_MEMORIA=1 o configurar_memoria(True), que vale solo
+# para el hilo/contexto actual (cada sesión de Streamlit decide).
+# ---------------------------------------------------------
+_medir_memoria = ContextVar(
+    "medir_memoria", default=os.environ.get("PE_PERFIL_MEMORIA", "") == "1"
+)
+
+_perfil_actual = ContextVar("perfil_actual", default=None)
+_lock = threading.Lock()
+_trazando = 0
+
+
+def configurar_memoria(activo):
+    _medir_memoria.set(bool(activo))
+
+
+def medir_memoria():
+    return _medir_memoria.get()
+
+
+def _iniciar_traza():
+    global _trazando
+    with _lock:
+        if _trazando == 0 and tracemalloc.is_tracing():
+            return False    # la traza la inició otro: se usa sin detenerla
+        if _trazando == 0:
+            tracemalloc.start()
+        _trazando += 1
+    return True
+
+
+def _detener_traza():
+    global _trazando
+    with _lock:
+        _trazando -= 1
+        if _trazando == 0:
+            tracemalloc.stop()
+
+
+def _memoria():
+    """(actual, pico) en bytes; (0, 0) si otro hilo ya detuvo la traza."""
+    return tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+
+
+# ---------------------------------------------------------
+# Perfil de una generación: etapas con nombre
+# ---------------------------------------------------------
+class Perfil:
+    """
+    Registra, por etapa, el tiempo (perf_counter), el pico de memoria
+    sobre lo que había al entrar (si se mide) y los conteos que se le
+    asignen (filas, celdas, …). Las etapas pueden anidarse.
+
+    Mientras está activo (with Perfil(...)) las funciones que usan
+    etapa() registran en él sin recibirlo como parámetro.
+    El pico sale de tracemalloc, que es global al proceso: con varias
+    generaciones a la vez en hilos, incluye lo que reservaron las otras.
+    """
+
+    def __init__(self, nombre, memoria=None):
+        self.nombre = nombre
+        self.memoria = medir_memoria() if memoria is None else memoria
+        self.etapas = []
+        self.segundos = None
+        self.memoria_pico = None
+        self._pila = []
+        self._token = None
+        self._traza_propia = False
+
+    def __enter__(self):
+        if self.memoria:
+            self._traza_propia = _iniciar_traza()
+        raiz = {"_inicio": time.perf_counter(), "_base": 0, "_pico": 0}
+        if self.memoria:
+            raiz["_base"] = _memoria()[0]
+            tracemalloc.reset_peak()
+        self._pila = [raiz]
+        self._token = _perfil_actual.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _perfil_actual.reset(self._token)
+        raiz = self._pila.pop()
+        self.segundos = time.perf_counter() - raiz["_inicio"]
+        if self.memoria:
+            self.memoria_pico = max(raiz["_pico"], _memoria()[1]) - raiz["_base"]
+            if self._traza_propia:
+                _detener_traza()
+        return False
+
+    @contextmanager
+    def etapa(self, nombre, **conteos):
+        registro = {"etapa": nombre, "nivel": len(self._pila) - 1, **conteos}
+        self.etapas.append(registro)
+        padre = self._pila[-1] if self._pila else None
+
+        estado = {"_inicio": time.perf_counter(), "_base": 0, "_pico": 0}
+        if self.memoria:
+            actual, pico = _memoria()
+            if padre is not None:
+                padre["_pico"] = max(padre["_pico"], pico)
+            estado["_base"] = actual
+            tracemalloc.reset_peak()
+        self._pila.append(estado)
+
+        try:
+            yield registro
+        finally:
+            self._pila.pop()
+            registro["segundos"] = round(time.perf_counter() - estado["_inicio"], 4)
+            if self.memoria:
+                pico = max(estado["_pico"], _memoria()[1])
+                registro["memoria_pico"] = pico - estado["_base"]
+                if padre is not None:
+                    padre["_pico"] = max(padre["_pico"], pico)
+
+    def como_dict(self):
+        return {
+            "reporte": self.nombre,
+            "segundos": round(self.segundos, 4) if self.segundos is not None else None,
+            "memoria_pico": self.memoria_pico,
+            "etapas": self.etapas,
+        }
+
+
+@contextmanager
+def etapa(nombre, **conteos):
+    """
+    Etapa del perfil activo. Sin perfil activo no mide nada y entrega
+    un dict que se descarta, así el código instrumentado no cambia.
+    """
+    aviso = _seguimiento.get()
+    if aviso is not None:
+        aviso(nombre, None, None, None)
+    perfil = _perfil_actual.get()
+    if perfil is None:
+        yield dict(conteos)
+        return
+    with perfil.etapa(nombre, **conteos) as registro:
+        yield registro
+
+
+def perfilado(reporte):
+    """
+    Decorador para los generar_*: corre la función dentro de un Perfil
+    y deja el resultado en ResultadoGeneracion.perfil.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with Perfil(reporte) as perfil:
+                resultado = funcion(*args, **kwargs)
+            resultado.perfil = perfil.como_dict()
+            return resultado
+        return envoltura
+    return decorador
+
+
+# ---------------------------------------------------------
+# Seguimiento de un trabajo en segundo plano (funciones_trabajos)
+# ---------------------------------------------------------
+# Mientras hay seguimiento activo, cada etapa() y cada avance() llaman
+# a aviso(etapa, hechas, total, unidad); etapa es None en los avances.
+# El aviso puede lanzar Cancelado para cortar la generación.
+# ---------------------------------------------------------
+_seguimiento = ContextVar("seguimiento", default=None)
+
+
+class Cancelado(BaseException):
+    """
+    Se canceló el trabajo en curso. Hereda de BaseException para que
+    el `except Exception` de los generar_* no lo convierta en un error.
+    """
+
+
+@contextmanager
+def seguimiento(aviso):
+    token = _seguimiento.set(aviso)
+    try:
+        yield
+    finally:
+        _seguimiento.reset(token)
+
+
+def avance(hechas, total, unidad="filas"):
+    """Cuánto lleva la etapa en curso (sin seguimiento no hace nada)."""
+    aviso = _seguimiento.get()
+    if aviso is not None:
+        aviso(None, hechas, total, unidad)
+
+
+# ---------------------------------------------------------
+# Texto breve y tabla para mostrar
+# ---------------------------------------------------------
+def _mb(n):
+    return f"{n / 1024 / 1024:,.1f} MB"
+
+
+def filas_perfil(perfil):
+    """Una fila por etapa (sangría según el nivel) para st.dataframe."""
+    filas = []
+    for e in perfil["etapas"]:
+        conteos = {k: v for k, v in e.items() if k not in ("etapa", "nivel", "segundos", "memoria_pico")}
+        filas.append({
+            "Etapa": "    " * e["nivel"] + e["etapa"],
+            "Segundos": e.get("segundos"),
+            "Memoria pico": _mb(e["memoria_pico"]) if e.get("memoria_pico") is not None else "—",
+            "Conteos": ", ".join(f"{k}={v:,}" if isinstance(v, int) else f"{k}={v}" for k, v in conteos.items()),
+        })
+    return filas
+
+
+def describir_perfil(perfil):
+    texto = f"{perfil['segundos']:.2f} s"
+    if perfil.get("memoria_pico") is not None:
+        texto += f", pico {_mb(perfil['memoria_pico'])}"
+    return texto
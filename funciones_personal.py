@@ -1,84 +1,113 @@
 # funciones_personal.py
 # Versión FINAL con detección robusta + formato condicional completo
+import numpy as np
 import pandas as pd
-import streamlit as st
-from openpyxl import load_workbook
 from openpyxl.formatting.rule import CellIsRule
 from openpyxl.styles import Font
-from io import BytesIO
 
-
-# -----------------------------------------------------------
-# LIMPIEZA DE TEXTO
-# -----------------------------------------------------------
-def limpiar(s):
-    if pd.isna(s):
-        return ""
-    return (
-        str(s)
-        .replace("\xa0", " ")
-        .replace("\t", " ")
-        .replace("\r", " ")
-        .strip()
-        .upper()
-    )
+from funciones_cache import cargar_con_cache
+from funciones_formulas import guardar_con_valores
+from funciones_lectura import (
+    detectar_encabezado, elegir_columnas, es_texto_delimitado, leer_excel, leer_texto_agregado,
+)
+from funciones_normalizar import clave, claves, limpiar
+from funciones_perfil import avance, etapa, perfilado
+from funciones_plantilla import cargar_hoja
+from funciones_resultado import ResultadoGeneracion
 
 
 # -----------------------------------------------------------
 # DETECTAR FILA DE ENCABEZADOS
 # -----------------------------------------------------------
-def detectar_fila_encabezados(df_raw):
-    columnas_clave = [
-        "SEDE OPERATIVA",
-        "LOCAL",
-        "CARGO",
-        "MÍNIMO REQUERIDO",
-        "ASISTENCIA",
-    ]
+COLUMNAS_CLAVE = [
+    "SEDE OPERATIVA",
+    "LOCAL",
+    "CARGO",
+    "MÍNIMO REQUERIDO",
+    "ASISTENCIA",
+]
+
 
-    for i in range(12):
-        fila = df_raw.iloc[i].astype(str).apply(limpiar)
-        coincidencias = sum(col in fila.values for col in columnas_clave)
-        if coincidencias >= 4:
-            return i
+def _es_fila_encabezados(valores):
+    fila = {limpiar(v) for v in valores}
+    coincidencias = sum(col in fila for col in COLUMNAS_CLAVE)
+    return coincidencias >= 4
 
-    raise ValueError("No se pudo detectar la fila de encabezados en ASC-PERSONAL.")
+
+def detectar_fila_encabezados(archivo_asc):
+    """Busca el encabezado en las primeras 12 filas sin leer el resto."""
+    fila, columnas = detectar_encabezado(
+        archivo_asc,
+        _es_fila_encabezados,
+        sheet_name="Reporte_Nacional",
+        max_filas=12
+    )
+    if fila is None:
+        raise ValueError("No se pudo detectar la fila de encabezados en ASC-PERSONAL.")
+    return fila, columnas
 
 
 # -----------------------------------------------------------
 # CARGAR ASC-PERSONAL
 # -----------------------------------------------------------
-def _cargar_asc_personal(archivo_asc):
-    df_raw = pd.read_excel(archivo_asc, sheet_name="Reporte_Nacional", header=None)
-    header_row = detectar_fila_encabezados(df_raw)
+COLUMNAS_NECESARIAS = [
+    "SEDE OPERATIVA",
+    "LOCAL",
+    "CARGO",
+    "MÍNIMO REQUERIDO",
+    "ASISTENCIA",
+]
 
-    df = pd.read_excel(
-        archivo_asc,
-        sheet_name="Reporte_Nacional",
-        header=header_row
-    )
+# las claves se leen como texto; los números se convierten al llenar
+TIPOS_COLUMNAS = {"SEDE OPERATIVA": str, "LOCAL": str, "CARGO": str}
 
-    df.columns = [limpiar(c) for c in df.columns]
 
-    columnas_necesarias = [
-        "SEDE OPERATIVA",
-        "LOCAL",
-        "CARGO",
-        "MÍNIMO REQUERIDO",
-        "ASISTENCIA",
-    ]
+def _normalizar_asc_personal(df):
+    df.columns = [limpiar(c) for c in df.columns]
 
-    faltan = [c for c in columnas_necesarias if c not in df.columns]
+    faltan = [c for c in COLUMNAS_NECESARIAS if c not in df.columns]
     if faltan:
         raise ValueError(f"Faltan columnas en ASC-PERSONAL: {faltan}")
 
-    df["SEDE OPERATIVA"] = df["SEDE OPERATIVA"].apply(limpiar)
-    df["LOCAL"] = df["LOCAL"].apply(limpiar)
-    df["CARGO"] = df["CARGO"].apply(limpiar)
+    df["SEDE OPERATIVA"] = claves(df["SEDE OPERATIVA"])
+    df["LOCAL"] = claves(df["LOCAL"])
+    df["CARGO"] = claves(df["CARGO"])
 
     return df
 
 
+def _ultimo_por_cargo(df):
+    # misma regla que el índice de generar_personal: gana la última fila
+    return df.drop_duplicates(["SEDE OPERATIVA", "LOCAL", "CARGO"], keep="last")
+
+
+def _cargar_asc_personal(archivo_asc):
+    header_row, columnas = detectar_fila_encabezados(archivo_asc)
+    columnas, tipos = elegir_columnas(
+        columnas, {c: TIPOS_COLUMNAS.get(c) for c in COLUMNAS_NECESARIAS}, limpiar
+    )
+
+    if es_texto_delimitado(archivo_asc):
+        return leer_texto_agregado(
+            archivo_asc,
+            header_row,
+            lambda df: _ultimo_por_cargo(_normalizar_asc_personal(df)[COLUMNAS_NECESARIAS]),
+            _ultimo_por_cargo,
+            columnas=columnas,
+            dtype=tipos
+        )
+
+    df = leer_excel(
+        archivo_asc,
+        sheet_name="Reporte_Nacional",
+        header=header_row,
+        columnas=columnas,
+        dtype=tipos
+    )
+
+    return _normalizar_asc_personal(df)
+
+
 # -----------------------------------------------------------
 # MAPEO DE ROLES
 # -----------------------------------------------------------
@@ -108,115 +137,163 @@ ROLE_MAPPING = {
 
 
 # -----------------------------------------------------------
-# GENERAR HOJA PERSONAL
+# MATRIZ (sede, local) × cargo
 # -----------------------------------------------------------
-def generar_personal(ruta_plantilla_temp, archivo_asc_personal):
-
-    try:
-        with st.spinner("Generando hoja PERSONAL..."):
-
-            df_asc = _cargar_asc_personal(archivo_asc_personal)
-
-            asc_idx = {}
-            for _, row in df_asc.iterrows():
-                key = (
-                    row["SEDE OPERATIVA"],
-                    row["LOCAL"],
-                    row["CARGO"]
-                )
-                asc_idx[key] = row
+CAMPOS = ["MÍNIMO REQUERIDO", "ASISTENCIA"]
 
-            wb = load_workbook(ruta_plantilla_temp)
-            ws = wb["PERSONAL"]
 
-            header_map = {}
-            for cell in ws[1]:
-                if cell.value:
-                    nombre = limpiar(cell.value)
-                    if nombre:
-                        header_map[nombre] = (cell.column, cell.column_letter)
+def pivotar_personal(df_asc):
+    """
+    Una fila por (sede, local) con columnas (campo, cargo) para cada
+    campo de CAMPOS y "_presente" (hay fila para ese cargo), solo con
+    los cargos de ROLE_MAPPING. Si un cargo se repite gana la última fila.
+    """
+    cargos = [clave(c) for c in ROLE_MAPPING.values()]
+    ultimos = _ultimo_por_cargo(df_asc[COLUMNAS_NECESARIAS])
+    ultimos = ultimos[ultimos["CARGO"].isin(cargos)].assign(_presente=True)
 
-            if "SEDE" not in header_map or "LOCAL" not in header_map:
-                raise ValueError("La plantilla no tiene las columnas SEDE y LOCAL correctamente definidas.")
-
-            col_sede = header_map["SEDE"][1]
-            col_local = header_map["LOCAL"][1]
-
-            totals_cols = {}
-            base_cols = {}
-            perc_cols = {}
-            diff_cols = {}
-
-            for name, (idx, let) in header_map.items():
-
-                if name.endswith("[T]"):
-                    base = name.replace("[T]", "").strip()
-                    totals_cols[base] = name
-
-                elif name.endswith("[P]"):
-                    base = name.replace("[P]", "").strip()
-                    perc_cols[base] = name
-
-                elif name.endswith("[D]"):
-                    base = name.replace("[D]", "").strip()
-                    diff_cols[base] = name
-
-                else:
-                    if name not in ("N", "SEDE", "LOCAL"):
-                        base_cols[name] = name
+    matriz = ultimos.pivot(
+        index=["SEDE OPERATIVA", "LOCAL"], columns="CARGO", values=CAMPOS + ["_presente"]
+    )
+    return matriz.reindex(columns=pd.MultiIndex.from_product([CAMPOS + ["_presente"], cargos]))
+
+
+def _enteros(valores, presente):
+    """
+    int(v or 0) donde hay fila y 0 donde no, como el recorrido fila por
+    fila. Un vacío (NaN) en una fila que existe sigue siendo un error.
+    """
+    salida = np.zeros(presente.shape, dtype="int64")
+    valores = valores[presente]
+    if valores.dtype.kind == "f":
+        if np.isnan(valores).any():
+            raise ValueError("cannot convert float NaN to integer")
+        salida[presente] = np.trunc(valores)
+    elif valores.dtype.kind in "iub":
+        salida[presente] = valores
+    else:
+        salida[presente] = [int(v or 0) for v in valores]
+    return salida
+
+
+def alinear_personal(matriz, filas):
+    """
+    (mínimos, asistencias): matrices filas × cargos de enteros, en el
+    orden de `filas` [(fila, sede, local)] y de ROLE_MAPPING.
+    """
+    destino = pd.MultiIndex.from_arrays(
+        [[sede for _, sede, _ in filas], [local for _, _, local in filas]]
+    )
+    alineada = matriz.reindex(index=destino)
+    presente = alineada["_presente"].notna().to_numpy()
+    return tuple(_enteros(alineada[campo].to_numpy(), presente) for campo in CAMPOS)
 
-            max_row = ws.max_row
 
-            # ------------------------------------------------------
-            # RELLENAR HOJA PERSONAL
-            # ------------------------------------------------------
-            for r in range(2, max_row + 1):
+# -----------------------------------------------------------
+# GENERAR HOJA PERSONAL
+# -----------------------------------------------------------
+@perfilado("PERSONAL")
+def generar_personal(ruta_plantilla_temp, archivo_asc_personal):
 
-                sede = limpiar(ws[f"{col_sede}{r}"].value)
-                local = limpiar(ws[f"{col_local}{r}"].value)
+    resultado = ResultadoGeneracion("PERSONAL")
 
-                if not sede or not local:
+    try:
+        df_asc = cargar_con_cache(archivo_asc_personal, "personal", _cargar_asc_personal)
+
+        with etapa("agregar") as registro:
+            matriz = pivotar_personal(df_asc)
+            registro["grupos"] = int(matriz["_presente"].notna().to_numpy().sum())
+
+        wb = cargar_hoja(ruta_plantilla_temp, "PERSONAL")
+        ws = wb["PERSONAL"]
+
+        header_map = {}
+        for cell in ws[1]:
+            if cell.value:
+                nombre = limpiar(cell.value)
+                if nombre:
+                    header_map[nombre] = (cell.column, cell.column_letter)
+
+        if "SEDE" not in header_map or "LOCAL" not in header_map:
+            raise ValueError("La plantilla no tiene las columnas SEDE y LOCAL correctamente definidas.")
+
+        col_sede = header_map["SEDE"][1]
+        col_local = header_map["LOCAL"][1]
+
+        totals_cols = {}
+        base_cols = {}
+        perc_cols = {}
+        diff_cols = {}
+
+        for name, (idx, let) in header_map.items():
+
+            if name.endswith("[T]"):
+                base = name.replace("[T]", "").strip()
+                totals_cols[base] = name
+
+            elif name.endswith("[P]"):
+                base = name.replace("[P]", "").strip()
+                perc_cols[base] = name
+
+            elif name.endswith("[D]"):
+                base = name.replace("[D]", "").strip()
+                diff_cols[base] = name
+
+            else:
+                if name not in ("N", "SEDE", "LOCAL"):
+                    base_cols[name] = name
+
+        max_row = ws.max_row
+
+        # filas de la plantilla con sede y local
+        filas = []
+        for r in range(2, max_row + 1):
+            sede = clave(ws[f"{col_sede}{r}"].value)
+            local = clave(ws[f"{col_local}{r}"].value)
+            if sede and local:
+                filas.append((r, sede, local))
+
+        # ------------------------------------------------------
+        # RELLENAR HOJA PERSONAL (por columna, desde la matriz)
+        # ------------------------------------------------------
+        with etapa("llenar_celdas", filas=max_row - 1):
+            minimos, asistencias = alinear_personal(matriz, filas)
+
+            for j, base in enumerate(ROLE_MAPPING):
+                avance(j, len(ROLE_MAPPING), "cargos")
+                colT = header_map[totals_cols[base]] if base in totals_cols else None
+                colA = header_map[base_cols[base]] if base in base_cols else None
+
+                # TOTAL T
+                if colT:
+                    for (r, _, _), minimo in zip(filas, minimos[:, j].tolist()):
+                        ws.cell(r, colT[0], minimo)
+
+                # ASISTENCIA
+                if colA:
+                    for (r, _, _), asistencia in zip(filas, asistencias[:, j].tolist()):
+                        ws.cell(r, colA[0], asistencia)
+
+                if not (colT and colA):
                     continue
-
-                for base, cargo_name in ROLE_MAPPING.items():
-
-                    cargo = limpiar(cargo_name)
-                    key = (sede, local, cargo)
-
-                    minimo = 0
-                    asistencia = 0
-
-                    if key in asc_idx:
-                        minimo = int(asc_idx[key]["MÍNIMO REQUERIDO"] or 0)
-                        asistencia = int(asc_idx[key]["ASISTENCIA"] or 0)
-
-                    # TOTAL T
-                    if base in totals_cols:
-                        colT = header_map[totals_cols[base]][1]
-                        ws[f"{colT}{r}"] = minimo
-
-                    # ASISTENCIA
-                    if base in base_cols:
-                        colA = header_map[base_cols[base]][1]
-                        ws[f"{colA}{r}"] = asistencia
-
-                    # PORCENTAJE
-                    if base in perc_cols and base in totals_cols and base in base_cols:
-                        colp = header_map[perc_cols[base]][1]
-                        colT = header_map[totals_cols[base]][1]
-                        colA = header_map[base_cols[base]][1]
-                        ws[f"{colp}{r}"] = f"=IF({colT}{r}=0,1,{colA}{r}/{colT}{r})"
-
-                    # DIFERENCIA
-                    if base in diff_cols and base in totals_cols and base in base_cols:
-                        cold = header_map[diff_cols[base]][1]
-                        colT = header_map[totals_cols[base]][1]
-                        colA = header_map[base_cols[base]][1]
-                        ws[f"{cold}{r}"] = f"={colT}{r}-{colA}{r}"
-
-            # ------------------------------------------------------
-            # FORMATO CONDICIONAL PORCENTAJE < 100%
-            # ------------------------------------------------------
+                T, A = colT[1], colA[1]
+
+                # PORCENTAJE
+                if base in perc_cols:
+                    colp = header_map[perc_cols[base]][0]
+                    for r, _, _ in filas:
+                        ws.cell(r, colp, f"=IF({T}{r}=0,1,{A}{r}/{T}{r})")
+
+                # DIFERENCIA
+                if base in diff_cols:
+                    cold = header_map[diff_cols[base]][0]
+                    for r, _, _ in filas:
+                        ws.cell(r, cold, f"={T}{r}-{A}{r}")
+
+        # ------------------------------------------------------
+        # FORMATO CONDICIONAL PORCENTAJE < 100%
+        # ------------------------------------------------------
+        with etapa("formato_condicional"):
             for base, colname in perc_cols.items():
                 col_letter = header_map[colname][1]
                 rango = f"{col_letter}2:{col_letter}{max_row}"
@@ -244,21 +321,14 @@ def generar_personal(ruta_plantilla_temp, archivo_asc_personal):
                 )
                 ws.conditional_formatting.add(rango, regla_rojo_d)
 
-            # ------------------------------------------------------
-            # ✔ EXPORTAR SOLO LA HOJA PERSONAL SIN DAÑAR LA PLANTILLA
-            # ------------------------------------------------------
-            hojas = wb.sheetnames
-            for hoja in hojas:
-                if hoja != "PERSONAL":
-                    del wb[hoja]
-
-            out = BytesIO()
-            wb.save(out)
-            out.seek(0)
-
-            st.session_state["personal_generada"] = out
-
-        st.success("Hoja PERSONAL generada correctamente ✔")
+        # ------------------------------------------------------
+        # ✔ EXPORTAR SOLO LA HOJA PERSONAL (cargar_hoja ya abrió
+        #   únicamente esta hoja, la plantilla no se modifica)
+        # ------------------------------------------------------
+        resultado.contenido = guardar_con_valores(wb)
+        resultado.mensaje = "Hoja PERSONAL generada correctamente ✔"
 
     except Exception as e:
-        st.error(f"Error al generar PERSONAL: {e}")
\ No newline at end of file
+        resultado.error = f"Error al generar PERSONAL: {e}"
+
+    return resultado
\ No newline at end of file
@@ -0,0 +1,213 @@
+import os
+import posixpath
+import re
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from io import BytesIO
+from xml.sax.saxutils import unescape
+
+from openpyxl import load_workbook
+
+from funciones_perfil import etapa
+
+
+# ========================
+# PLANTILLA BASE
+# ========================
+def _get_plantilla_path():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    candidatos = [
+        os.path.join(base_dir, "plantillas", "Op1 - Reporte.xlsx"),
+        os.path.join(base_dir, "Op1 - Reporte.xlsx"),
+    ]
+    for ruta in candidatos:
+        if os.path.exists(ruta):
+            return ruta
+    raise FileNotFoundError("❌ No se encontró la plantilla ‘Op1 - Reporte.xlsx’.")
+
+
+PLANTILLA_PATH = _get_plantilla_path()
+
+
+# ========================
+# EXTRAER UNA HOJA (a nivel de paquete xlsx)
+# ========================
+REL_HOJA = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+REL_CALC_CHAIN = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/calcChain"
+
+_RE_SHEET = re.compile(r"<sheet\b[^>]*?/>")
+_RE_DEFINED_NAME = re.compile(r"<definedName\b([^>]*)>.*?</definedName>", re.S)
+
+
+def _atributo(tag, nombre):
+    m = re.search(r"\b" + re.escape(nombre) + r'="([^"]*)"', tag)
+    return unescape(m.group(1), {"&quot;": '"'}) if m else None
+
+
+def _rels(z, ruta):
+    carpeta, nombre = posixpath.split(ruta)
+    ruta_rels = posixpath.join(carpeta, "_rels", nombre + ".rels")
+    if ruta_rels not in z.namelist():
+        return ruta_rels, []
+
+    rels = []
+    for r in ET.fromstring(z.read(ruta_rels)):
+        destino = r.get("Target")
+        if r.get("TargetMode") == "External":
+            continue
+        if destino.startswith("/"):
+            destino = destino.lstrip("/")
+        else:
+            destino = posixpath.normpath(posixpath.join(carpeta, destino))
+        rels.append((r.get("Id"), r.get("Type"), destino))
+    return ruta_rels, rels
+
+
+def _partes_de(z, ruta, vistas=None):
+    """La parte y todo lo que cuelga de ella (tablas, dibujos, …)."""
+    vistas = set() if vistas is None else vistas
+    if ruta in vistas:
+        return vistas
+    vistas.add(ruta)
+    ruta_rels, rels = _rels(z, ruta)
+    if rels:
+        vistas.add(ruta_rels)
+    for _, _, destino in rels:
+        _partes_de(z, destino, vistas)
+    return vistas
+
+
+def _leer_zip(base):
+    if isinstance(base, (bytes, bytearray)):
+        return zipfile.ZipFile(BytesIO(base))
+    if hasattr(base, "getvalue"):
+        return zipfile.ZipFile(BytesIO(base.getvalue()))
+    return zipfile.ZipFile(base)
+
+
+def nombres_hojas(base):
+    with _leer_zip(base) as z:
+        libro = z.read("xl/workbook.xml").decode("utf-8")
+    return [_atributo(tag, "name") for tag in _RE_SHEET.findall(libro)]
+
+
+def extraer_hoja(base, hoja):
+    """
+    Devuelve los bytes de un xlsx con una sola hoja, sin abrir las
+    demás: se copian tal cual sus estilos, tablas y nombres definidos,
+    y se eliminan las otras hojas (con sus partes) y el calcChain.
+    """
+    with _leer_zip(base) as z:
+        libro = z.read("xl/workbook.xml").decode("utf-8")
+        _, rels_libro = _rels(z, "xl/workbook.xml")
+        destino_de = {rid: destino for rid, _, destino in rels_libro}
+
+        tags = _RE_SHEET.findall(libro)
+        nombres = [_atributo(tag, "name") for tag in tags]
+        if hoja not in nombres:
+            raise ValueError(f"❌ La plantilla no contiene la hoja {hoja}.")
+        pos = nombres.index(hoja)
+
+        conservar = _partes_de(z, destino_de[_atributo(tags[pos], "r:id")])
+        quitar = set()
+        for i, tag in enumerate(tags):
+            if i != pos:
+                quitar |= _partes_de(z, destino_de[_atributo(tag, "r:id")])
+        quitar -= conservar
+        rids_quitar = set()
+        for rid, tipo, destino in rels_libro:
+            if tipo == REL_CALC_CHAIN or (tipo == REL_HOJA and destino in quitar):
+                quitar.add(destino)
+                rids_quitar.add(rid)
+
+        # workbook.xml: solo la hoja pedida, activa y en la posición 0
+        for i, tag in enumerate(tags):
+            if i != pos:
+                libro = libro.replace(tag, "", 1)
+
+        def nombre_definido(m):
+            local = _atributo(m.group(1), "localSheetId")
+            if local is None:
+                return m.group(0)
+            if int(local) != pos:
+                return ""
+            return m.group(0).replace(f'localSheetId="{local}"', 'localSheetId="0"', 1)
+
+        libro = _RE_DEFINED_NAME.sub(nombre_definido, libro)
+        libro = re.sub(r'\b(activeTab|firstSheet)="\d+"', r'\1="0"', libro)
+
+        out = BytesIO()
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dest:
+            for info in z.infolist():
+                nombre = info.filename
+                if nombre in quitar:
+                    continue
+                datos = z.read(nombre)
+
+                if nombre == "xl/workbook.xml":
+                    datos = libro.encode("utf-8")
+                elif nombre == "xl/_rels/workbook.xml.rels":
+                    datos = re.sub(
+                        rb"<Relationship\b[^>]*?/>",
+                        lambda m: b"" if _atributo(m.group(0).decode("utf-8"), "Id") in rids_quitar else m.group(0),
+                        datos,
+                    )
+                elif nombre == "[Content_Types].xml":
+                    datos = re.sub(
+                        rb"<Override\b[^>]*?/>",
+                        lambda m: b"" if _atributo(m.group(0).decode("utf-8"), "PartName").lstrip("/") in quitar else m.group(0),
+                        datos,
+                    )
+
+                dest.writestr(info, datos)
+
+    return out.getvalue()
+
+
+def cargar_hoja(base, hoja):
+    """
+    Abre con openpyxl solo la hoja pedida de un libro (ruta, bytes o
+    BytesIO). La carga y el guardado dependen solo del tamaño de esa hoja.
+    """
+    with etapa("abrir_plantilla") as registro:
+        wb = load_workbook(BytesIO(extraer_hoja(base, hoja)))
+        registro["celdas"] = len(wb[hoja]._cells) if hoja in wb.sheetnames else 0
+    return wb
+
+
+# ========================
+# CACHÉ EN MEMORIA POR HOJA
+# ========================
+_plantillas = {}
+_hojas = {}
+_lock = threading.Lock()
+
+
+def _bytes_plantilla(ruta):
+    with _lock:
+        if ruta not in _plantillas:
+            with open(ruta, "rb") as f:
+                _plantillas[ruta] = f.read()
+        return _plantillas[ruta]
+
+
+def hojas_plantilla(ruta=None):
+    return nombres_hojas(_bytes_plantilla(ruta or PLANTILLA_PATH))
+
+
+def obtener_plantilla(hoja, ruta=None):
+    """
+    Devuelve un BytesIO nuevo con la hoja pedida de la plantilla.
+    Cada hoja se separa una vez por proceso (sin abrir las demás);
+    cada llamada solo copia los bytes ya preparados.
+    """
+    ruta = ruta or PLANTILLA_PATH
+    clave = (ruta, hoja)
+
+    if clave not in _hojas:
+        datos = extraer_hoja(_bytes_plantilla(ruta), hoja)
+        with _lock:
+            _hojas[clave] = datos
+
+    return BytesIO(_hojas[clave])
@@ -0,0 +1,19 @@
+from dataclasses import dataclass, field
+
+
+# ---------------------------------------------------------
+# Resultado de un generar_*: bytes del xlsx + diagnóstico
+# ---------------------------------------------------------
+@dataclass
+class ResultadoGeneracion:
+    reporte: str
+    contenido: bytes = None
+    mensaje: str = ""
+    avisos: list = field(default_factory=list)
+    error: str = None
+    perfil: dict = None
+    estado: dict = None     # para regenerar solo lo que cambió (funciones_incremental)
+
+    @property
+    def ok(self):
+        return self.error is None and self.contenido is not None
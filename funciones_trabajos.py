@@ -0,0 +1,245 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+from funciones_cache import huella_archivo
+from funciones_lectura import lector_excel
+from funciones_lote import GENERADORES, INCREMENTALES, _descartar_pool, _ejecutar, _en_memoria, _obtener_pool
+from funciones_perfil import Cancelado, medir_memoria, seguimiento
+from funciones_plantilla import obtener_plantilla
+from funciones_resultado import ResultadoGeneracion
+
+
+# ---------------------------------------------------------
+# Trabajos en segundo plano (un generar_* por trabajo)
+# ---------------------------------------------------------
+# Cada trabajo corre en el pool de procesos de funciones_lote, así la
+# app sigue respondiendo mientras se genera. El proceso deja su avance
+# (etapa, filas n/N) en un dict compartido (multiprocessing.Manager) y
+# ahí mismo lee si se pidió cancelar. Límites:
+#   PE_TRABAJOS_MAX       trabajos en cola o en curso en el servidor (16)
+#   PE_TRABAJOS_CONSERVAR horas que se guarda uno terminado sin retirar (1)
+# Un trabajo con las mismas entradas (misma sesión, reporte, plantilla
+# y huella de cada archivo) que uno pendiente no se vuelve a encolar.
+# ---------------------------------------------------------
+MAX_PENDIENTES = int(os.environ.get("PE_TRABAJOS_MAX", "16"))
+CONSERVAR_SEGUNDOS = float(os.environ.get("PE_TRABAJOS_CONSERVAR", "1")) * 3600
+
+# cada cuánto el proceso informa el avance y mira si se canceló
+INTERVALO_AVISO = 0.25
+
+EN_COLA = "en cola"
+EN_CURSO = "en curso"
+TERMINADO = "terminado"
+CANCELADO = "cancelado"
+
+_trabajos = {}      # clave → Trabajo (pendiente o terminado sin retirar)
+_manager = None
+_lock = threading.RLock()
+
+
+def _compartido():
+    """Dict compartido con los procesos del pool (un Manager por servidor)."""
+    global _manager
+    with _lock:
+        if _manager is None:
+            _manager = multiprocessing.get_context("spawn").Manager()
+        return _manager.dict()
+
+
+# ---------------------------------------------------------
+# Lado del proceso que genera
+# ---------------------------------------------------------
+class _Aviso:
+    """Lleva etapa y avance al dict compartido; lanza Cancelado si se pidió."""
+
+    def __init__(self, estado):
+        self.estado = estado
+        self.etapa = "inicio"
+        self.ultimo = time.monotonic()
+        estado.update(etapa=self.etapa, hechas=None, total=None, unidad=None)
+
+    def __call__(self, etapa, hechas, total, unidad):
+        ahora = time.monotonic()
+        if etapa is not None:
+            self.etapa = etapa
+        elif ahora - self.ultimo < INTERVALO_AVISO:
+            return
+        self.ultimo = ahora
+        if self.estado.get("cancelar"):
+            raise Cancelado()
+        self.estado.update(etapa=self.etapa, hechas=hechas, total=total, unidad=unidad)
+
+
+def _ejecutar_seguido(reporte, plantilla, entradas, memoria, lector, anterior, estado):
+    with seguimiento(_Aviso(estado)):
+        return _ejecutar(reporte, plantilla, entradas, memoria, lector, anterior)
+
+
+# ---------------------------------------------------------
+# Trabajo
+# ---------------------------------------------------------
+class Trabajo:
+    """
+    Generación encolada de un reporte. `estado` y `progreso()` se pueden
+    consultar en cada rerun; `resultado()` es None mientras no termine o
+    si se canceló.
+    """
+
+    def __init__(self, reporte, clave, compartido, futuro):
+        self.id = uuid.uuid4().hex
+        self.reporte = reporte
+        self.clave = clave
+        self.creado = time.time()
+        self.cancelado = False
+        self._compartido = compartido
+        self._futuro = futuro
+        self._resultado = None
+        self._leido = False
+        self.ultimo_avance = (0.0, "Iniciando")     # lo último que mostró la barra
+
+    @property
+    def terminado(self):
+        return self._futuro.done()
+
+    @property
+    def estado(self):
+        if self.terminado:
+            return CANCELADO if self.resultado() is None else TERMINADO
+        # running() también es cierto para los que esperan en la cola del pool
+        return EN_CURSO if self.progreso() else EN_COLA
+
+    def progreso(self):
+        """{etapa, hechas, total, unidad} de lo último que informó el proceso."""
+        try:
+            return self._compartido.copy()
+        except (OSError, EOFError):
+            return {}
+
+    def cancelar(self):
+        """Si aún está en cola no corre; si ya corre, se corta en el próximo aviso."""
+        self.cancelado = True
+        if not self._futuro.cancel():
+            try:
+                self._compartido["cancelar"] = True
+            except (OSError, EOFError):
+                pass
+
+    def resultado(self):
+        if not self.terminado:
+            return None
+        if not self._leido:
+            self._leido = True
+            if self._futuro.cancelled():
+                return None
+            try:
+                self._resultado = self._futuro.result()
+            except Cancelado:
+                pass
+            except Exception as e:
+                # p. ej. BrokenProcessPool: se recrea el pool en el próximo trabajo
+                _descartar_pool()
+                self._resultado = ResultadoGeneracion(self.reporte, error=f"❌ Error al generar {self.reporte}: {e}")
+        return self._resultado
+
+
+# ---------------------------------------------------------
+# Encolar / retirar
+# ---------------------------------------------------------
+def _clave(sesion, reporte, plantilla, entradas):
+    h = hashlib.sha256(f"{sesion}|{reporte}|{huella_archivo(plantilla)}".encode())
+    for archivo in entradas:
+        h.update(f"|{huella_archivo(archivo) if archivo else '-'}".encode())
+    return h.hexdigest()
+
+
+def _depurar(ahora):
+    for clave, trabajo in list(_trabajos.items()):
+        if trabajo.terminado and ahora - trabajo.creado > CONSERVAR_SEGUNDOS:
+            del _trabajos[clave]
+
+
+def enviar(reporte, clasificados, sesion="", plantilla=None, anterior=None):
+    """
+    Encola la generación de `reporte` con las entradas de `clasificados`
+    y devuelve su Trabajo. Si la sesión ya tiene uno con las mismas
+    entradas (en cola, en curso o terminado sin retirar), devuelve ese.
+    """
+    _, obligatorias, opcionales = GENERADORES[reporte]
+    entradas = [_en_memoria(clasificados.get(k)) for k in obligatorias + opcionales]
+    plantilla = obtener_plantilla(reporte, plantilla)
+    clave = _clave(sesion, reporte, plantilla, entradas)
+    anterior = anterior if reporte in INCREMENTALES else None
+
+    with _lock:
+        _depurar(time.time())
+        trabajo = _trabajos.get(clave)
+        if trabajo is not None and not trabajo.cancelado:
+            return trabajo
+
+        if sum(not t.terminado for t in _trabajos.values()) >= MAX_PENDIENTES:
+            raise RuntimeError("❌ Hay demasiados reportes en cola. Intenta de nuevo en unos minutos.")
+
+        compartido = _compartido()
+        futuro = _obtener_pool().submit(
+            _ejecutar_seguido, reporte, plantilla, entradas,
+            medir_memoria(), lector_excel(), anterior, compartido,
+        )
+        trabajo = _trabajos[clave] = Trabajo(reporte, clave, compartido, futuro)
+        return trabajo
+
+
+def retirar(trabajo):
+    """Resultado del trabajo terminado; deja de contar para la deduplicación."""
+    with _lock:
+        if _trabajos.get(trabajo.clave) is trabajo:
+            del _trabajos[trabajo.clave]
+    return trabajo.resultado()
+
+
+# ---------------------------------------------------------
+# Texto y fracción para la barra de progreso
+# ---------------------------------------------------------
+# fracción de la barra al entrar a cada etapa; llenar_celdas avanza
+# de 0.55 a 0.9 según las filas. Con una etapa que no figura aquí la
+# barra se queda donde estaba.
+_TRAMOS = [
+    ("inicio", 0.0, "Iniciando"),
+    ("cargar", 0.05, "Cargando archivos"),
+    ("leer", 0.05, "Cargando archivos"),
+    ("detectar", 0.05, "Cargando archivos"),
+    ("agregar", 0.4, "Agregando"),
+    ("abrir_plantilla", 0.5, "Abriendo la plantilla"),
+    ("llenar_celdas", 0.55, "Llenando"),
+    ("actualizar_celdas", 0.55, "Actualizando celdas"),
+    ("formato_condicional", 0.9, "Aplicando formato"),
+    ("calcular_formulas", 0.92, "Calculando fórmulas"),
+    ("guardar_xlsx", 0.96, "Guardando"),
+    ("incrustar_valores", 0.98, "Guardando"),
+]
+
+
+def describir_trabajo(trabajo):
+    """(fracción 0–1, texto) del avance del trabajo."""
+    if trabajo.cancelado and not trabajo.terminado:
+        return 0.0, "Cancelando…"
+    estado = trabajo.estado
+    if estado != EN_CURSO:
+        return (1.0 if estado == TERMINADO else 0.0), estado.capitalize()
+
+    progreso = trabajo.progreso()
+    etapa = progreso.get("etapa") or ""
+    for prefijo, desde, texto in _TRAMOS:
+        if etapa.startswith(prefijo):
+            break
+    else:
+        return trabajo.ultimo_avance
+
+    hechas, total = progreso.get("hechas"), progreso.get("total")
+    if etapa == "llenar_celdas" and total:
+        desde, texto = desde + 0.35 * hechas / total, f"{texto} {progreso['unidad']} {hechas:,}/{total:,}"
+    trabajo.ultimo_avance = (desde, texto)
+    return desde, texto
@@ -0,0 +1,155 @@
+"""
+Generación de reportes PE sin Streamlit (para corridas programadas).
+
+    python -m pe_reportes build --inputs CARPETA --out "PE - Reporte_Final.xlsx"
+
+Código de salida 0 si se generó el Reporte Final, 1 si falló algún
+reporte o no se reconoció ningún archivo.
+"""
+import argparse
+import json
+import os
+import sys
+from io import BytesIO
+
+from funciones_clasificar import clasificar_archivos
+from funciones_combinar import combinar_reportes, compactar_xlsx, describir_compactacion
+from funciones_lectura import EXTENSIONES_TEXTO, LECTORES, lector_excel, usar_lector
+from funciones_lote import GENERADORES, generar_todos, reportes_disponibles
+from funciones_perfil import Perfil, configurar_memoria, describir_perfil, etapa
+from funciones_plantilla import PLANTILLA_PATH
+
+
+# reporte → parámetro de combinar_reportes
+PARAMETROS_COMBINAR = {
+    "ASISTENCIA": "asistencia",
+    "OP1": "op1",
+    "PERSONAL": "personal",
+    "CAJAS-SEDE": "cajas_sede",
+}
+
+
+def archivos_de_carpeta(carpeta):
+    """Los .xlsx y .csv/.tsv de la carpeta (sin los temporales ~$ de Excel)."""
+    return [
+        os.path.join(carpeta, nombre)
+        for nombre in sorted(os.listdir(carpeta))
+        if nombre.lower().endswith((".xlsx",) + EXTENSIONES_TEXTO) and not nombre.startswith("~$")
+    ]
+
+
+# ========================
+# API
+# ========================
+def construir_reporte_final(archivos, plantilla=None, paralelo=True, compactar=True):
+    """
+    Clasifica los archivos, genera los reportes disponibles y los combina.
+    Devuelve (bytes del Reporte Final, {reporte: ResultadoGeneracion},
+    informe de compactación); los bytes son None si algún reporte falló
+    o no hubo ninguno, y el informe es None si no se compactó.
+    """
+    clasificados = clasificar_archivos(archivos)
+    with etapa("generar_todos") as registro:
+        resultados = generar_todos(clasificados, plantilla, paralelo=paralelo)
+        registro["reportes"] = len(resultados)
+
+    if not resultados or not all(res.ok for res in resultados.values()):
+        return None, resultados, None
+
+    generados = {
+        PARAMETROS_COMBINAR[reporte]: BytesIO(res.contenido)
+        for reporte, res in resultados.items()
+    }
+    with etapa("combinar_reportes"):
+        combinado = combinar_reportes(plantilla or PLANTILLA_PATH, **generados)
+    if not compactar:
+        return combinado.getvalue(), resultados, None
+    with etapa("compactar_xlsx") as registro:
+        datos, informe = compactar_xlsx(combinado)
+        registro["bytes"] = len(datos)
+    return datos, resultados, informe
+
+
+# ========================
+# CLI
+# ========================
+def _build(args):
+    if not os.path.isdir(args.inputs):
+        print(f"❌ No existe la carpeta {args.inputs}.", file=sys.stderr)
+        return 1
+
+    archivos = archivos_de_carpeta(args.inputs)
+    disponibles = reportes_disponibles(clasificar_archivos(archivos))
+    for reporte in GENERADORES:
+        if reporte not in disponibles:
+            print(f"⚠ {reporte}: faltan archivos de entrada, se omite.", file=sys.stderr)
+
+    configurar_memoria(args.medir_memoria)
+    try:
+        usar_lector(args.lector)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"📖 Lector de Excel: {lector_excel()}")
+
+    try:
+        with Perfil("REPORTE FINAL") as perfil:
+            final, resultados, informe = construir_reporte_final(
+                archivos, args.plantilla, paralelo=not args.secuencial,
+                compactar=not args.sin_compactar
+            )
+    except Exception as e:
+        print(f"❌ Error al combinar reportes: {e}", file=sys.stderr)
+        return 1
+
+    for res in resultados.values():
+        for aviso in res.avisos:
+            print(aviso, file=sys.stderr)
+        if res.ok:
+            print(res.mensaje)
+        else:
+            print(res.error, file=sys.stderr)
+
+    if args.perfil:
+        perfiles = [res.perfil for res in resultados.values() if res.perfil]
+        perfiles.append(perfil.como_dict())
+        with open(args.perfil, "w", encoding="utf-8") as f:
+            json.dump(perfiles, f, ensure_ascii=False, indent=2)
+        for p in perfiles:
+            print(f"⏱ {p['reporte']}: {describir_perfil(p)}")
+
+    if final is None:
+        if not resultados:
+            print(f"❌ No se reconoció ningún archivo en {args.inputs}.", file=sys.stderr)
+        return 1
+
+    with open(args.out, "wb") as f:
+        f.write(final)
+    if informe:
+        print(f"📦 Compactado: {describir_compactacion(informe)}")
+    print(f"✅ Reporte Final guardado en {args.out}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pe_reportes", description="Generación de reportes PE")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    build = sub.add_parser("build", help="Genera y combina los reportes de una carpeta")
+    build.add_argument("--inputs", required=True, help="Carpeta con los Excel de entrada")
+    build.add_argument("--out", required=True, help="Ruta del Reporte Final (.xlsx)")
+    build.add_argument("--plantilla", default=None, help="Plantilla a usar (por defecto la del repositorio)")
+    build.add_argument("--secuencial", action="store_true", help="No usar procesos en paralelo")
+    build.add_argument("--sin-compactar", action="store_true", help="No compactar el Reporte Final")
+    build.add_argument("--lector", choices=list(LECTORES), default=None,
+                       help="Lector de Excel (por defecto el más rápido instalado)")
+    build.add_argument("--perfil", default=None, help="Guardar el perfil por etapas (tiempos, memoria, conteos) en este JSON")
+    build.add_argument("--medir-memoria", action="store_true", help="Medir el pico de memoria por etapa (tracemalloc, más lento)")
+    build.set_defaults(func=_build)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
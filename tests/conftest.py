@@ -0,0 +1,25 @@
+import os
+import sys
+
+# las pruebas no dejan copias Arrow en la carpeta temporal compartida
+os.environ.setdefault("PE_SPILL", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from benchmarks.datos import sintetizar
+from funciones_lote import generar_todos
+
+
+@pytest.fixture(scope="session")
+def entradas(tmp_path_factory):
+    """Rutas de las entradas sintéticas (300 filas por archivo)."""
+    return sintetizar(str(tmp_path_factory.mktemp("entradas")), 300, 1)
+
+
+@pytest.fixture(scope="session")
+def reportes(entradas):
+    """{reporte: bytes del xlsx} generados con las entradas sintéticas."""
+    resultados = generar_todos(entradas, paralelo=False)
+    assert all(r.ok for r in resultados.values()), [r.error for r in resultados.values()]
+    return {reporte: r.contenido for reporte, r in resultados.items()}
@@ -0,0 +1,61 @@
+import os
+import time
+
+import pytest
+
+import funciones_almacen
+from funciones_almacen import abrir, depurar, guardar, uso
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    monkeypatch.setattr(funciones_almacen, "CARPETA_ALMACEN", str(tmp_path))
+    monkeypatch.setattr(funciones_almacen, "CUOTA_SESION", 250)
+    monkeypatch.setattr(funciones_almacen, "CUOTA_TOTAL", 350)
+    monkeypatch.setattr(funciones_almacen, "TTL_SEGUNDOS", 100)
+    return tmp_path
+
+
+def _archivo(carpeta, sesion, nombre, tamano, mtime):
+    os.makedirs(carpeta / sesion, exist_ok=True)
+    ruta = carpeta / sesion / nombre
+    ruta.write_bytes(b"x" * tamano)
+    os.utime(ruta, (mtime, mtime))
+
+
+def _contenido(carpeta):
+    return sorted(f"{s.name}/{a.name}" for s in carpeta.iterdir() for a in s.iterdir())
+
+
+def test_depurar_ttl_cuotas_y_lru(almacen):
+    t = time.time()
+    _archivo(almacen, "a", "a1", 100, t - 60)
+    _archivo(almacen, "a", "a2", 100, t - 50)
+    _archivo(almacen, "a", "a3", 100, t - 40)
+    _archivo(almacen, "b", "b1", 100, t - 55)
+    _archivo(almacen, "b", "b2", 100, t - 30)
+    _archivo(almacen, "c", "c1", 10, t - 500)
+
+    # c1 por TTL (y su carpeta); a1 por la cuota de "a"; b1 por la total
+    assert depurar(ahora=t) == 3
+    assert _contenido(almacen) == ["a/a2", "a/a3", "b/b2"]
+    assert not (almacen / "c").exists()
+    assert uso() == 300 and uso("a") == 200
+
+    # abrir renueva el último uso: al pasar la cuota sale a3 y no a2
+    with abrir("a", "a2") as f:
+        assert f.read() == b"x" * 100
+    _archivo(almacen, "b", "b3", 100, t - 10)
+    assert depurar(ahora=t + 1) == 1
+    assert _contenido(almacen) == ["a/a2", "b/b2", "b/b3"]
+
+    # más tarde vence b2 (sin uso desde t - 30), no lo usado después
+    assert depurar(ahora=t + 75) == 1
+    assert _contenido(almacen) == ["a/a2", "b/b3"]
+
+
+def test_guardar_protege_lo_recien_escrito(almacen):
+    _archivo(almacen, "a", "viejo", 100, time.time() - 50)
+    guardar("a", "grande", b"x" * 300)      # pasa la cuota de la sesión él solo
+    assert _contenido(almacen) == ["a/grande"]
+    assert abrir("a", "viejo") is None
@@ -0,0 +1,41 @@
+import os
+
+import funciones_cache
+from funciones_cache import depurar_disco, limpiar_cache
+
+
+def _archivo(carpeta, nombre, tamano, mtime):
+    ruta = os.path.join(carpeta, nombre)
+    with open(ruta, "wb") as f:
+        f.write(b"x" * tamano)
+    os.utime(ruta, (mtime, mtime))
+    return ruta
+
+
+def test_depurar_disco_ttl_cuota_y_temporales(tmp_path, monkeypatch):
+    monkeypatch.setattr(funciones_cache, "CARPETA_DISCO", str(tmp_path))
+    monkeypatch.setattr(funciones_cache, "CUOTA_DISCO", 250)
+    monkeypatch.setattr(funciones_cache, "TTL_DISCO", 100)
+
+    vieja = _archivo(tmp_path, "vieja.arrow", 10, 1000)
+    a = _archivo(tmp_path, "a.arrow", 100, 1850)
+    b = _archivo(tmp_path, "b.arrow", 100, 1900)
+    c = _archivo(tmp_path, "c.arrow", 100, 1950)
+    en_curso = _archivo(tmp_path, "d.arrow.1.2.tmp", 500, 1960)
+    vencido = _archivo(tmp_path, "e.arrow.1.2.tmp", 10, 1000)
+
+    # vieja y el .tmp vencido por TTL; a por cuota (el .tmp en curso no cuenta)
+    assert depurar_disco(ahora=2000) == 3
+    assert sorted(os.listdir(tmp_path)) == ["b.arrow", "c.arrow", "d.arrow.1.2.tmp"]
+    assert not any(os.path.exists(r) for r in (vieja, a, vencido))
+    assert all(os.path.exists(r) for r in (b, c, en_curso))
+
+
+def test_limpiar_cache_no_borra_escrituras_en_curso(tmp_path, monkeypatch):
+    monkeypatch.setattr(funciones_cache, "CARPETA_DISCO", str(tmp_path))
+    ahora = os.path.getmtime(tmp_path)
+    _archivo(tmp_path, "a.arrow", 10, ahora)
+    _archivo(tmp_path, "b.arrow.1.2.tmp", 10, ahora)
+
+    limpiar_cache()
+    assert os.listdir(tmp_path) == ["b.arrow.1.2.tmp"]
@@ -0,0 +1,107 @@
+from copy import copy
+from io import BytesIO
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import PatternFill
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.xml.functions import tostring
+
+from funciones_combinar import combinar_reportes, compactar_xlsx
+from funciones_plantilla import PLANTILLA_PATH
+
+ORDEN = ["DIC", "ASISTENCIA", "OP1", "PERSONAL", "CAJAS-SEDE"]
+
+
+def _combinar(reportes):
+    return combinar_reportes(
+        PLANTILLA_PATH,
+        asistencia=reportes["ASISTENCIA"],
+        op1=reportes["OP1"],
+        personal=reportes["PERSONAL"],
+        cajas_sede=reportes["CAJAS-SEDE"],
+    ).getvalue()
+
+
+def _estilo(celda):
+    # copy() quita el StyleProxy, que no se compara bien con otro proxy
+    return tuple(copy(x) for x in (celda.font, celda.fill, celda.border, celda.alignment, celda.protection)) + (
+        celda.number_format,
+    )
+
+
+def test_combinado_conserva_orden_estilos_y_valores(reportes):
+    combinado = _combinar(reportes)
+    wb = load_workbook(BytesIO(combinado))
+    wb_valores = load_workbook(BytesIO(combinado), data_only=True)
+    assert wb.sheetnames == ORDEN
+
+    for hoja in ORDEN[1:]:
+        origen = load_workbook(BytesIO(reportes[hoja]))[hoja]
+        origen_valores = load_workbook(BytesIO(reportes[hoja]), data_only=True)[hoja]
+        ws, ws_valores = wb[hoja], wb_valores[hoja]
+        assert ws.max_row == origen.max_row and ws.max_column == origen.max_column
+
+        for fila in origen.iter_rows():
+            for c in fila:
+                d = ws[c.coordinate]
+                assert d.value == c.value, (hoja, c.coordinate)
+                assert _estilo(d) == _estilo(c), (hoja, c.coordinate)
+                assert ws_valores[c.coordinate].value == origen_valores[c.coordinate].value
+
+
+def test_combinado_conserva_nombres_definidos(reportes):
+    # área de impresión (local a la hoja) y un rango con nombre global
+    wb = load_workbook(BytesIO(reportes["OP1"]))
+    wb["OP1"].print_area = "A1:D20"
+    wb.defined_names["TOTALES_OP1"] = DefinedName("TOTALES_OP1", attr_text="'OP1'!$A$1:$B$5")
+    out = BytesIO()
+    wb.save(out)
+
+    combinado = load_workbook(BytesIO(_combinar({**reportes, "OP1": out.getvalue()})))
+    assert combinado["OP1"].print_area == "'OP1'!$A$1:$D$20"
+    assert combinado.defined_names["TOTALES_OP1"].attr_text == "'OP1'!$A$1:$B$5"
+    assert not combinado["ASISTENCIA"].print_area
+
+
+def _reglas_por_celda(ws):
+    """{coordenada: [regla, …]} en orden de prioridad, tal como las aplica Excel."""
+    por_celda = {}
+    for formato in ws.conditional_formatting:
+        for regla in formato.rules:
+            dxf = tostring(regla.dxf.to_tree()) if regla.dxf is not None else None
+            clave = (regla.type, regla.operator, tuple(regla.formula), regla.stopIfTrue, regla.text, dxf)
+            for rango in formato.sqref.ranges:
+                for fila in rango.cells:
+                    por_celda.setdefault(fila, []).append((regla.priority, clave))
+    return {celda: [c for _, c in sorted(reglas, key=lambda r: r[0])] for celda, reglas in por_celda.items()}
+
+
+def test_compactar_conserva_reglas_efectivas(reportes):
+    for hoja in ("OP1", "PERSONAL"):
+        compacto, informe = compactar_xlsx(reportes[hoja])
+        assert informe["reglas_despues"] < informe["reglas_antes"], hoja
+
+        antes = _reglas_por_celda(load_workbook(BytesIO(reportes[hoja]))[hoja])
+        despues = _reglas_por_celda(load_workbook(BytesIO(compacto))[hoja])
+        assert antes.keys() == despues.keys(), hoja
+        for celda, reglas in antes.items():
+            assert despues[celda] == reglas, (hoja, celda)
+
+
+def test_compactar_no_une_reglas_si_cambia_la_prioridad():
+    # la regla roja de A6:A10 es igual a la de A1:A5, pero allí la verde
+    # va antes; unirlas le daría a la roja la prioridad 1 también en A6:A10
+    wb = Workbook()
+    ws = wb.active
+    rojo = PatternFill("solid", start_color="FFC7CE", end_color="FFC7CE")
+    verde = PatternFill("solid", start_color="C6EFCE", end_color="C6EFCE")
+    ws.conditional_formatting.add("A1:A5", CellIsRule("lessThan", ["0"], fill=rojo))
+    ws.conditional_formatting.add("A1:A10", CellIsRule("lessThan", ["10"], fill=verde, stopIfTrue=True))
+    ws.conditional_formatting.add("A6:A10", CellIsRule("lessThan", ["0"], fill=rojo))
+    ws.conditional_formatting.add("B1:B5", CellIsRule("lessThan", ["0"], fill=rojo))
+    out = BytesIO()
+    wb.save(out)
+
+    compacto, _ = compactar_xlsx(out.getvalue())
+    assert _reglas_por_celda(load_workbook(BytesIO(compacto)).active) == _reglas_por_celda(ws)
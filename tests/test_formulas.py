@@ -0,0 +1,150 @@
+import re
+import zipfile
+from io import BytesIO
+
+import openpyxl
+
+from funciones_formulas import actualizar_hoja_xml, calcular_formulas, guardar_con_valores
+
+
+def _xml_hoja(contenido):
+    with zipfile.ZipFile(BytesIO(contenido)) as z:
+        return z.read("xl/worksheets/sheet1.xml").decode()
+
+
+def test_referencia_a_celda_vacia_se_guarda_como_cero():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = "=B1"
+    ws["C1"] = "=B1+1"
+
+    valores, completo = calcular_formulas(ws)
+    assert valores == {"A1": None, "C1": 1}
+    assert completo
+
+    xml = _xml_hoja(guardar_con_valores(wb))
+    assert '<c r="A1"><f>B1</f><v>0</v></c>' in xml
+    assert '<c r="C1"><f>B1+1</f><v>1</v></c>' in xml
+
+    # el valor en caché es el que se lee sin fórmulas
+    wb2 = openpyxl.load_workbook(BytesIO(guardar_con_valores(wb)), data_only=True)
+    assert wb2.active["A1"].value == 0
+
+
+def _guardar_y_leer(wb):
+    """(xml de la hoja, libro con los valores en caché, si pide fullCalcOnLoad)."""
+    contenido = guardar_con_valores(wb)
+    with zipfile.ZipFile(BytesIO(contenido)) as z:
+        recalcular = b'fullCalcOnLoad="1"' in z.read("xl/workbook.xml")
+    wb2 = openpyxl.load_workbook(BytesIO(contenido), data_only=True)
+    return _xml_hoja(contenido), wb2.active, recalcular
+
+
+def test_porcentaje_con_divisor_cero():
+    # =IF(C=0,1,I/C) de OP1, PERSONAL y CAJAS-SEDE
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append([None, None, 4, None, None, None, None, None, 3])
+    ws.append([None, None, 0, None, None, None, None, None, 3])
+    ws.append([None, None, None, None, None, None, None, None, None])
+    for r in (1, 2, 3):
+        ws[f"J{r}"] = f"=IF(C{r}=0,1,I{r}/C{r})"
+
+    xml, hoja, recalcular = _guardar_y_leer(wb)
+    assert '<c r="J1"><f>IF(C1=0,1,I1/C1)</f><v>0.75</v></c>' in xml
+    assert [hoja[f"J{r}"].value for r in (1, 2, 3)] == [0.75, 1, 1]
+    assert not recalcular
+
+
+def test_mod_ok_err():
+    # =IF(MOD(BJ,2)=0,"OK","ERR") de OP1; MOD toma el signo del divisor
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for r, n in enumerate([4, 5, -3, None], start=1):
+        ws[f"A{r}"] = n
+        ws[f"B{r}"] = f'=IF(MOD(A{r},2)=0,"OK","ERR")'
+        ws[f"C{r}"] = f"=MOD(A{r},2)"
+
+    xml, hoja, recalcular = _guardar_y_leer(wb)
+    assert '<c r="B1" t="str"><f>IF(MOD(A1,2)=0,"OK","ERR")</f><v>OK</v></c>' in xml
+    assert [hoja[f"B{r}"].value for r in (1, 2, 3, 4)] == ["OK", "ERR", "ERR", "OK"]
+    assert [hoja[f"C{r}"].value for r in (1, 2, 3, 4)] == [0, 1, 1, 0]
+    assert not recalcular
+
+
+def test_comparacion_de_columnas_con_resultado_texto():
+    # =IF($D=$T,"OK","ERR") de ASISTENCIA, con T=H+L+P
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    filas = [(6, 1, 2, 3), (7, 1, 2, 3), ("6", 1, 2, 3), (None, None, None, None)]
+    for r, (d, h, l, p) in enumerate(filas, start=1):
+        ws[f"D{r}"], ws[f"H{r}"], ws[f"L{r}"], ws[f"P{r}"] = d, h, l, p
+        ws[f"T{r}"] = f"=H{r}+L{r}+P{r}"
+        ws[f"U{r}"] = f'=IF($D{r}=$T{r},"OK","ERR")'
+
+    xml, hoja, recalcular = _guardar_y_leer(wb)
+    assert '<c r="U1" t="str"><f>IF($D1=$T1,"OK","ERR")</f><v>OK</v></c>' in xml
+    # un texto nunca es igual a un número en Excel; vacía contra 0 sí
+    assert [hoja[f"U{r}"].value for r in (1, 2, 3, 4)] == ["OK", "ERR", "ERR", "OK"]
+    assert [hoja[f"T{r}"].value for r in (1, 2, 3, 4)] == [6, 6, 6, 0]
+    assert not recalcular
+
+
+def test_error_de_excel_deja_la_celda_sin_cache_y_fuerza_recalculo():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"], ws["B1"] = 3, 0
+    ws["C1"] = "=A1/B1"                 # #DIV/0!
+    ws["D1"] = "=C1+1"                  # depende de un error
+    ws["E1"] = "=SUM(A1:B1)"            # fuera del subconjunto
+    ws["F1"] = "=A1*2"
+
+    valores, completo = calcular_formulas(ws)
+    assert valores == {"F1": 6}
+    assert not completo
+
+    xml, hoja, recalcular = _guardar_y_leer(wb)
+    assert re.search(r'<c r="C1"><f>A1/B1</f><v\s*/></c>', xml)
+    assert hoja["C1"].value is None and hoja["D1"].value is None and hoja["E1"].value is None
+    assert hoja["F1"].value == 6
+    assert recalcular
+
+
+def test_celdas_con_estilo_conservan_el_atributo_s():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"], ws["B1"] = 1, 4
+    ws["C1"] = "=IF(B1=0,1,A1/B1)"
+    ws["C1"].number_format = "0.00%"
+    ws["D1"] = '=IF(MOD(B1,2)=0,"OK","ERR")'
+    ws["D1"].font = openpyxl.styles.Font(bold=True)
+
+    xml, hoja, _ = _guardar_y_leer(wb)
+    assert re.search(r'<c r="C1" s="\d+"><f>IF\(B1=0,1,A1/B1\)</f><v>0.25</v></c>', xml)
+    assert re.search(r'<c r="D1" s="\d+" t="str"><f>[^<]*</f><v>OK</v></c>', xml)
+    assert hoja["C1"].value == 0.25 and hoja["C1"].number_format == "0.00%"
+    assert hoja["D1"].value == "OK" and hoja["D1"].font.b
+
+
+def test_actualizar_hoja_xml_recalcula_solo_las_dependientes():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"], ws["B1"], ws["A2"] = 6, 3, 1
+    ws["C1"] = "=A1/B1"
+    ws["D1"] = '=IF(C1>1,"ALTO","BAJO")'
+    ws["C2"] = "=A2*10"
+    hoja = _xml_hoja(guardar_con_valores(wb)).encode()
+
+    xml, completo, reescritas = actualizar_hoja_xml(hoja, {"A1": 2})
+    assert (completo, reescritas) == (True, 3)
+    assert b'<c r="C1"><f>A1/B1</f><v>0.6666666666666666</v></c>' in xml
+    assert b'<c r="D1" t="str"><f>IF(C1&gt;1,"ALTO","BAJO")</f><v>BAJO</v></c>' in xml
+    assert b'<c r="C2"><f>A2*10</f><v>10</v></c>' in xml
+
+    # #DIV/0!: la celda queda sin valor y Excel tiene que recalcular
+    xml, completo, _ = actualizar_hoja_xml(hoja, {"B1": 0})
+    assert not completo
+    assert re.search(rb'<c r="C1"><f>A1/B1</f><v\s*/></c>', xml)
+
+    # una celda que no está en el xml no se sabe insertar
+    assert actualizar_hoja_xml(hoja, {"Z9": 1}) is None
@@ -0,0 +1,67 @@
+import random
+import re
+import shutil
+import zipfile
+from io import BytesIO
+
+import pytest
+from openpyxl import load_workbook
+
+from funciones_formulas import _RE_CELDA
+from funciones_lote import GENERADORES
+from funciones_plantilla import PLANTILLA_PATH
+
+# reporte → (entrada que se cambia, columna de la hoja de entrada)
+CAMBIOS = {"OP1": ("nom_inst", 5), "ASISTENCIA": ("nom", 6)}
+
+
+def _generar(reporte, entradas, anterior=None):
+    funcion, obligatorias, opcionales = GENERADORES[reporte]
+    resultado = funcion(PLANTILLA_PATH, *[entradas.get(k) for k in obligatorias + opcionales], anterior=anterior)
+    assert resultado.ok, resultado.error
+    return resultado
+
+
+def _partes(contenido):
+    """({coordenada: xml de la celda}, xml de la hoja sin celdas, workbook.xml)."""
+    with zipfile.ZipFile(BytesIO(contenido)) as z:
+        hoja = z.read("xl/worksheets/sheet1.xml")
+        libro = z.read("xl/workbook.xml")
+    celdas = {m.group(1).decode(): m.group(0) for m in _RE_CELDA.finditer(hoja)}
+    return celdas, _RE_CELDA.sub(b"", hoja), libro
+
+
+@pytest.mark.parametrize("reporte", sorted(CAMBIOS))
+def test_incremental_reescribe_solo_lo_que_cambia(reporte, entradas, tmp_path):
+    anterior = _generar(reporte, entradas)
+
+    # otros valores en 40 filas de una de las entradas
+    entrada, columna = CAMBIOS[reporte]
+    cambiadas = dict(entradas, **{entrada: str(tmp_path / f"{entrada}.xlsx")})
+    shutil.copy(entradas[entrada], cambiadas[entrada])
+    wb = load_workbook(cambiadas[entrada])
+    ws, rnd = wb.active, random.Random(3)
+    for _ in range(40):
+        ws.cell(rnd.randint(6, ws.max_row), columna).value = rnd.randint(0, 60)
+    wb.save(cambiadas[entrada])
+
+    incremental = _generar(reporte, cambiadas, anterior=anterior)
+    completo = _generar(reporte, cambiadas)
+    assert "actualiza" in incremental.mensaje
+    assert "calcular_formulas" not in [e["etapa"] for e in incremental.perfil["etapas"]]
+
+    antes, resto_antes, _ = _partes(anterior.contenido)
+    despues, resto_despues, libro = _partes(incremental.contenido)
+    esperado, _, libro_esperado = _partes(completo.contenido)
+
+    # igual que generar desde cero
+    assert despues == esperado
+    assert libro == libro_esperado
+
+    # solo cambian las celdas de la entrada y las fórmulas de esas filas
+    assert resto_despues == resto_antes
+    reescritas = {c for c in despues if despues[c] != antes[c]}
+    de_la_entrada = {c for c in reescritas if b"<f>" not in despues[c]}
+    filas = {re.sub(r"[A-Z]+", "", c) for c in de_la_entrada}
+    assert de_la_entrada
+    assert all(b"<f>" in despues[c] and re.sub(r"[A-Z]+", "", c) in filas for c in reescritas - de_la_entrada)
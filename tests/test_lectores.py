@@ -0,0 +1,12 @@
+import pytest
+
+from benchmarks.datos import sintetizar
+from benchmarks.lectores import verificar_lectores
+from funciones_lectura import lectores_disponibles
+
+
+@pytest.mark.skipif(len(lectores_disponibles()) < 2, reason="solo está instalado openpyxl")
+def test_lectores_dan_los_mismos_dataframes(tmp_path):
+    # cada cargador con calamine (u otro lector) contra openpyxl
+    rutas = sintetizar(str(tmp_path), 200, 1)
+    assert verificar_lectores(rutas) == []
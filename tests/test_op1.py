@@ -0,0 +1,32 @@
+import pandas as pd
+
+from funciones_op1 import CATEGORIAS_MINDEF, categorizar_tipo, indexar_inventario
+
+
+def _inventario(tipos, cantidades):
+    return pd.DataFrame({
+        "Sede Operativa": ["LIMA"] * len(tipos),
+        "Local": ["L1"] * len(tipos),
+        "Tipo": tipos,
+        "Inventario en campo": cantidades,
+    })
+
+
+def test_tipo_en_dos_categorias_suma_en_ambas():
+    df = _inventario(
+        ["Cuadernillo y Ficha de Respuesta", "CUADERNILLO", "FICHA DE RESPUESTA", "OTRO", None],
+        [5, 10, 20, 40, 80],
+    )
+    mascara = categorizar_tipo(df["Tipo"], CATEGORIAS_MINDEF)
+    assert mascara.tolist() == [[True, True], [True, False], [False, True], [False, False], [False, False]]
+
+    indice, _ = indexar_inventario(df, CATEGORIAS_MINDEF)
+    assert indice == {("LIMA", "L1", "C"): 15, ("LIMA", "L1", "F"): 25}
+
+
+def test_textos_de_categoria_son_literales():
+    categorias = {"X": ["SOBRE (A+B)"], "Y": ["ACTA.FISCAL"]}
+    df = _inventario(["sobre (a+b) 1", "SOBRE AAB", "ACTA FISCAL", "ACTA.FISCAL"], [1, 2, 4, 8])
+
+    indice, _ = indexar_inventario(df, categorias)
+    assert indice == {("LIMA", "L1", "X"): 1, ("LIMA", "L1", "Y"): 8}
@@ -0,0 +1,42 @@
+import csv
+import os
+from io import BytesIO
+
+from openpyxl import load_workbook
+
+import funciones_lectura
+from funciones_lote import generar_todos
+
+# separador y codificación de cada entrada, como los exportan los sistemas
+FORMATOS = [(".csv", ",", "utf-8"), (".csv", ";", "utf-8-sig"), (".tsv", "\t", "latin-1")]
+
+
+def _a_texto(entradas, carpeta):
+    """Copia cada Excel como CSV/TSV, con el título partido en dos líneas."""
+    rutas = {}
+    for i, (clave, ruta) in enumerate(sorted(entradas.items())):
+        extension, separador, codificacion = FORMATOS[i % len(FORMATOS)]
+        destino = os.path.join(carpeta, os.path.splitext(os.path.basename(ruta))[0] + extension)
+        with open(destino, "w", newline="", encoding=codificacion) as f:
+            escritor = csv.writer(f, delimiter=separador)
+            for n, fila in enumerate(load_workbook(ruta, read_only=True).worksheets[0].iter_rows(values_only=True)):
+                if n == 0:
+                    fila = ("REPORTE\nNACIONAL",) + fila[1:]
+                escritor.writerow(["" if v is None else v for v in fila])
+        rutas[clave] = destino
+    return rutas
+
+
+def _valores(contenido):
+    wb = load_workbook(BytesIO(contenido), data_only=True)
+    return {ws.title: [tuple(c.value for c in fila) for fila in ws.iter_rows()] for ws in wb.worksheets}
+
+
+def test_texto_por_partes_igual_que_excel(entradas, reportes, tmp_path, monkeypatch):
+    # partes de 7 filas: los agregados se combinan muchas veces
+    monkeypatch.setattr(funciones_lectura, "TAMANO_PARTE", 7)
+    resultados = generar_todos(_a_texto(entradas, str(tmp_path)), paralelo=False)
+
+    for reporte, resultado in resultados.items():
+        assert resultado.ok, resultado.error
+        assert _valores(resultado.contenido) == _valores(reportes[reporte]), reporte
@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import funciones_trabajos
+from funciones_trabajos import CANCELADO, EN_COLA, EN_CURSO, MAX_PENDIENTES, TERMINADO, enviar, retirar
+
+
+@pytest.fixture
+def seguir(monkeypatch):
+    """
+    Un solo hilo en vez del pool de procesos. Cada trabajo queda en curso
+    (ya informó "inicio") hasta que se activa el evento que se devuelve.
+    """
+    evento = threading.Event()
+    ejecutar = funciones_trabajos._ejecutar
+
+    def en_espera(*args):
+        evento.wait(30)
+        return ejecutar(*args)
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(funciones_trabajos, "_trabajos", {})
+    monkeypatch.setattr(funciones_trabajos, "_obtener_pool", lambda: pool)
+    monkeypatch.setattr(funciones_trabajos, "_compartido", dict)
+    monkeypatch.setattr(funciones_trabajos, "_ejecutar", en_espera)
+    yield evento
+    evento.set()
+    pool.shutdown(cancel_futures=True)
+
+
+def _esperar(condicion):
+    limite = time.monotonic() + 60
+    while not condicion():
+        assert time.monotonic() < limite
+        time.sleep(0.05)
+
+
+def test_mismas_entradas_un_solo_trabajo(entradas, seguir):
+    trabajo = enviar("CAJAS-SEDE", entradas, sesion="s1")
+    assert enviar("CAJAS-SEDE", entradas, sesion="s1") is trabajo
+    assert enviar("CAJAS-SEDE", entradas, sesion="s2") is not trabajo
+
+    seguir.set()
+    _esperar(lambda: trabajo.terminado)
+    assert trabajo.estado == TERMINADO
+    # terminado sin retirar sigue contando; retirado, se vuelve a encolar
+    assert enviar("CAJAS-SEDE", entradas, sesion="s1") is trabajo
+    assert retirar(trabajo).ok
+    assert enviar("CAJAS-SEDE", entradas, sesion="s1") is not trabajo
+
+
+def test_cancelar_en_cola_y_en_curso(entradas, seguir):
+    en_curso = enviar("OP1", entradas, sesion="s1")
+    en_cola = enviar("ASISTENCIA", entradas, sesion="s1")
+    _esperar(lambda: en_curso.progreso())
+    assert (en_curso.estado, en_cola.estado) == (EN_CURSO, EN_COLA)
+
+    en_cola.cancelar()
+    assert en_cola.terminado and en_cola.estado == CANCELADO
+    assert en_cola.resultado() is None
+
+    # el que corre se corta en el próximo aviso (la primera etapa)
+    en_curso.cancelar()
+    seguir.set()
+    _esperar(lambda: en_curso.terminado)
+    assert en_curso.estado == CANCELADO
+    assert en_curso.resultado() is None
+
+    # uno cancelado no se reutiliza
+    assert enviar("OP1", entradas, sesion="s1") is not en_curso
+
+
+def test_rechaza_pasado_el_maximo(entradas, seguir):
+    trabajos = [enviar("CAJAS-SEDE", entradas, sesion=f"s{i}") for i in range(MAX_PENDIENTES)]
+    with pytest.raises(RuntimeError, match="demasiados reportes en cola"):
+        enviar("CAJAS-SEDE", entradas, sesion="una más")
+
+    # al cancelar uno queda lugar
+    trabajos[-1].cancelar()
+    assert enviar("CAJAS-SEDE", entradas, sesion="una más").estado == EN_COLA